@@ -0,0 +1,257 @@
+"""
+Content-addressed local cache of generated target outputs.
+
+Entries are keyed by a hash of everything a generation target's output
+depends on (the ICD YAML files, the firehose sources, the target options
+and the versions of any external generators). A hit restores the complete
+file set of the target, by hardlink where possible, instead of running the
+backend. The cache is a plain directory, so it works offline and can be
+shared between checkouts and CI runs on the same machine.
+
+The cache is enabled by setting FIREHOSE_CACHE_DIR. FIREHOSE_CACHE_MAX_SIZE
+(bytes, optionally suffixed with K, M, G or T) bounds its size; least
+recently used entries are evicted first.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+import uuid
+from glob import glob
+from os.path import join
+from typing import Dict, Iterable, List, Tuple
+
+CACHE_DIR_ENV = "FIREHOSE_CACHE_DIR"
+CACHE_MAX_SIZE_ENV = "FIREHOSE_CACHE_MAX_SIZE"
+DEFAULT_MAX_SIZE = 5 * 1024**3
+
+ENTRY_FILE = "entry.json"
+FILES_DIR = "files"
+
+SIZE_SUFFIXES = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+# Files are snapshotted by (size, mtime) to tell which ones a target wrote.
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+def parse_size(size: str) -> int:
+    """
+    Parses a byte count such as '500M' or '10G'.
+
+    Parameters:
+    - size (str): Number of bytes, optionally suffixed with K, M, G or T.
+    """
+    size = size.strip().upper().rstrip("B")
+    if size and size[-1] in SIZE_SUFFIXES:
+        return int(float(size[:-1]) * SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+def hash_files(paths: Iterable[str], digest=None):
+    """
+    Feeds the relative names and contents of all files under the given
+    paths (files or directories) into a hash, in a stable order.
+
+    Parameters:
+    - paths (Iterable[str]): Files or directories to hash.
+    - digest: Optional hashlib object to update. A new sha256 is used if None.
+    """
+    digest = digest or hashlib.sha256()
+    for path in paths:
+        if os.path.isfile(path):
+            files = [path]
+            base = os.path.dirname(path)
+        else:
+            files = sorted(
+                p
+                for p in glob(join(path, "**", "*"), recursive=True)
+                if os.path.isfile(p) and "__pycache__" not in p
+            )
+            base = path
+        for file_path in files:
+            digest.update(os.path.relpath(file_path, base).encode())
+            digest.update(b"\0")
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            digest.update(b"\0")
+    return digest
+
+
+def tool_version(cmd: List[str]) -> str:
+    """
+    Returns the output of a version command, or a marker if the tool is
+    unavailable, so outputs of different tool versions never share a key.
+    """
+    try:
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            timeout=120,
+        )
+        return result.stdout.strip()
+    except (OSError, subprocess.TimeoutExpired):
+        return f"{cmd[0]}: unavailable"
+
+
+def snapshot(roots: List[str]) -> Snapshot:
+    """
+    Records the size and modification time of every file under the roots.
+    """
+    files = {}
+    for root in roots:
+        for dir_path, _, file_names in os.walk(root):
+            for file_name in file_names:
+                path = join(dir_path, file_name)
+                stat = os.stat(path)
+                files[path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def break_hardlinks(roots: List[str]) -> None:
+    """
+    Replaces hardlinked files under the roots with private copies, so a
+    target that rewrites a file restored from the cache cannot modify the
+    cache entry through the shared inode.
+    """
+    for root in roots:
+        for dir_path, _, file_names in os.walk(root):
+            for file_name in file_names:
+                path = join(dir_path, file_name)
+                if os.lstat(path).st_nlink > 1:
+                    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+                    shutil.copy2(path, tmp_path)
+                    os.replace(tmp_path, path)
+
+
+class ArtifactCache:
+    def __init__(self, cache_dir: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Returns the cache configured through the environment, or None if
+        FIREHOSE_CACHE_DIR is not set.
+        """
+        cache_dir = os.environ.get(CACHE_DIR_ENV)
+        if not cache_dir:
+            return None
+        max_size = os.environ.get(CACHE_MAX_SIZE_ENV)
+        return cls(
+            cache_dir, parse_size(max_size) if max_size else DEFAULT_MAX_SIZE
+        )
+
+    def _entry_dir(self, key: str) -> str:
+        return join(self.cache_dir, key[:2], key)
+
+    def restore(self, key: str, roots: List[str]) -> bool:
+        """
+        Restores the files of a cache entry into the output roots.
+
+        Parameters:
+        - key (str): The cache key of the target.
+        - roots (List[str]): The output roots of the target, in the same
+          order they were passed to store().
+
+        Returns:
+        - bool: True on a cache hit, False if there is no entry for key.
+        """
+        entry_dir = self._entry_dir(key)
+        entry_path = join(entry_dir, ENTRY_FILE)
+        try:
+            with open(entry_path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        for rel_path in entry["files"]:
+            index, _, path_in_root = rel_path.partition("/")
+            src = join(entry_dir, FILES_DIR, rel_path)
+            dst = join(roots[int(index)], path_in_root)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+
+        # The entry file's mtime is the last-use time for LRU eviction
+        os.utime(entry_path)
+        return True
+
+    def store(self, key: str, roots: List[str], before: Snapshot) -> None:
+        """
+        Stores the files a target wrote into a new cache entry.
+
+        Parameters:
+        - key (str): The cache key of the target.
+        - roots (List[str]): The output roots of the target.
+        - before (Snapshot): Snapshot of the roots taken before the target
+          ran. Only files that are new or changed since then are stored, so
+          roots shared with a target's dependencies are handled correctly.
+        """
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return
+
+        tmp_dir = join(self.cache_dir, f".tmp-{uuid.uuid4().hex}")
+        files = []
+        size = 0
+        try:
+            for index, root in enumerate(roots):
+                for path, stat in sorted(snapshot([root]).items()):
+                    if before.get(path) == stat:
+                        continue
+                    rel_path = f"{index}/{os.path.relpath(path, root)}"
+                    dst = join(tmp_dir, FILES_DIR, rel_path)
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    shutil.copy2(path, dst)
+                    files.append(rel_path)
+                    size += stat[0]
+
+            with open(join(tmp_dir, ENTRY_FILE), "w") as f:
+                json.dump(
+                    {"files": files, "size": size, "created": time.time()}, f
+                )
+
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                # Another process stored the same key first
+                pass
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Removes least recently used entries until the cache fits max_size.
+        """
+        entries = []
+        total = 0
+        for entry_path in glob(join(self.cache_dir, "*", "*", ENTRY_FILE)):
+            try:
+                with open(entry_path) as f:
+                    size = json.load(f)["size"]
+                last_used = os.stat(entry_path).st_mtime
+            except (OSError, ValueError, KeyError):
+                continue
+            entries.append((last_used, size, os.path.dirname(entry_path)))
+            total += size
+
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
@@ -4,12 +4,15 @@ from os.path import join
 from textwrap import dedent
 from typing import List, Union
 from ..backend import Backend
+from .aspn_yaml_to_bench_aspn23 import AspnYamlToBenchAspn23
 from .aspn_yaml_to_c_source import AspnYamlToCSource
 from .aspn_yaml_to_c_header import AspnYamlToCHeader
+from .aspn_yaml_to_test_serialize_aspn23 import AspnYamlToTestSerializeAspn23
 from .utils import (
     ASPN_DISABLE_NULLABILITY,
     ASPN_NULLABILITY_MACRO_END,
     ASPN_NULLABILITY_MACRO_START,
+    ASPN_NONNULL_MACRO,
     ASPN_NULLABLE_MACRO,
     ASPN_PREFIX,
     format_and_write_to_file,
@@ -22,19 +25,27 @@ ASPN_PREFIX_LOWER = ASPN_PREFIX.lower()
 
 
 class AspnCBackend(Backend):
-    def __init__(self):
+    def __init__(self, c_layout: str = 'declaration'):
         self.c_source_generator = AspnYamlToCSource()
-        self.c_header_generator = AspnYamlToCHeader()
+        # See AspnYamlToCHeader for the c_layout values
+        self.c_header_generator = AspnYamlToCHeader(c_layout)
+        self.bench_generator = AspnYamlToBenchAspn23(self.c_source_generator)
+        self.test_serialize_generator = AspnYamlToTestSerializeAspn23(
+            self.bench_generator
+        )
         self.all_types_enum = []
         self.all_source_files = []
+        # Names of the programs in benchmarks/, run by `meson test --benchmark`
+        self.all_benchmarks = []
+        # Names of the programs in tests/, run by `meson test`
+        self.all_tests = []
         self.all_aliases = ''
-        self.free_cases = ''
-        self.type_string_cases = ''
-        self.aspn_type_get_time_cases = ''
-        self.aspn_type_set_time_cases = ''
-        self.aspn_copy_message_cases = ''
+        self.message_type_wrappers = ''
+        self.message_type_infos = ''
         self.enums_in_current_struct = []
         self.messages_types_includes = ''
+        # Headers of the messages only, included by types.c
+        self.messages_includes = ''
 
     def _remove_existing_output_files(self):
         for file in glob(f"{self.output_folder}/*.h"):
@@ -43,6 +54,12 @@ class AspnCBackend(Backend):
         for file in glob(f"{self.output_folder}/*.c"):
             remove(file)
 
+        for file in glob(f"{self.benchmark_folder}/*.c"):
+            remove(file)
+
+        for file in glob(f"{self.test_folder}/*.c"):
+            remove(file)
+
     def _generate_meson_build(self):
         print("Generating meson.build")
         meson_build_template = dedent(dedent(dedent("""
@@ -55,16 +72,21 @@ class AspnCBackend(Backend):
 
             aspn_c_inc_dir = include_directories('src')
 
+            # The thread-safe message pools use the platform mutex
+            aspn_c_thread_dep = dependency('threads')
+
             if not get_option('aspn-cpp-xtensor-py').disabled()
                 # Used by python bindings module in ASPN-C++.
                 aspn_c_static_lib_no_asan = static_library('aspn_no_asan',
                                         sources: aspn_sources,
                                         override_options: ['b_coverage=false',
-                                                        'b_sanitize=none'],
-                                        include_directories: aspn_c_inc_dir)
+                                                        'b_sanitize=none'] + aspn_unity_options,
+                                        include_directories: aspn_c_inc_dir,
+                                        dependencies: aspn_c_thread_dep)
 
             aspn_c_no_asan_dep = declare_dependency(link_whole: aspn_c_static_lib_no_asan,
-                                    include_directories: aspn_c_inc_dir)
+                                    include_directories: aspn_c_inc_dir,
+                                    dependencies: aspn_c_thread_dep)
 
             endif
 
@@ -73,6 +95,8 @@ class AspnCBackend(Backend):
                 aspn_c_libs = both_libraries('aspn',
                                         sources: aspn_sources,
                                         include_directories: aspn_c_inc_dir,
+                                        dependencies: aspn_c_thread_dep,
+                                        override_options: aspn_unity_options,
                                         soversion: meson.project_version(),
                                         install: true)
 
@@ -85,6 +109,10 @@ class AspnCBackend(Backend):
                 endforeach
                 install_headers('src/aspn23/aspn.h', install_dir: get_option('includedir') + '/aspn23')
                 install_headers('src/aspn23/common.h', install_dir: get_option('includedir') + '/aspn23')
+                install_headers('src/aspn23/fwd.h', install_dir: get_option('includedir') + '/aspn23')
+                install_headers('src/aspn23/compare.h', install_dir: get_option('includedir') + '/aspn23')
+                install_headers('src/aspn23/serialize.h', install_dir: get_option('includedir') + '/aspn23')
+                install_headers('src/aspn23/reflect.h', install_dir: get_option('includedir') + '/aspn23')
                 install_headers('src/aspn23/messages_and_types.h', install_dir: get_option('includedir') + '/aspn23')
 
                 aspn_runtime_types = [
@@ -100,6 +128,24 @@ class AspnCBackend(Backend):
 
                 meson.override_dependency('aspn23', aspn_c_dep)
 
+                aspn_c_benchmarks = [
+                {benchmarks}
+                ]
+                foreach bench : aspn_c_benchmarks
+                    benchmark(bench, executable(bench, 'benchmarks/' + bench + '.c',
+                                                dependencies: aspn_c_dep,
+                                                build_by_default: false))
+                endforeach
+
+                aspn_c_tests = [
+                {tests}
+                ]
+                foreach name : aspn_c_tests
+                    test(name, executable(name, 'tests/' + name + '.c',
+                                          dependencies: [aspn_c_dep, aspn_c_thread_dep],
+                                          build_by_default: false))
+                endforeach
+
             else # get_option('aspn-c-main-library')
 
                 aspn_c_dep = disabler()
@@ -112,6 +158,10 @@ class AspnCBackend(Backend):
         meson_build = meson_build_template.format(
             sources='\n'.join(self.all_source_files),
             types=types_meson,
+            benchmarks=',\n'.join(
+                f"    '{name}'" for name in self.all_benchmarks
+            ),
+            tests=',\n'.join(f"    '{name}'" for name in self.all_tests),
             ASPN_DIR=ASPN_DIR,
         )
         meson_build_filename = self.output_folder.replace(
@@ -120,6 +170,223 @@ class AspnCBackend(Backend):
         with open(meson_build_filename, "w", encoding="utf-8") as f:
             f.write(meson_build)
 
+    def _generate_fwd_header(self):
+        print("Generating fwd.h")
+        typedefs = '\n'.join(
+            f'typedef struct {struct.struct_name} {struct.struct_name};'
+            for struct in self.c_source_generator.structs
+        )
+        fwd_h = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            *
+            * Forward declarations of every ASPN-C struct. The typedefs live here rather
+            * than next to the struct definitions, so a header that only handles a type
+            * through pointers can include this file instead of the type's header, and
+            * is not rebuilt when that type changes.
+            */
+
+            #pragma once
+
+            {typedefs}
+
+            /*
+            * An alias for cases where the object has been up-casted and should be
+            * down-casted before using it.
+            */
+            typedef {ASPN_PREFIX}TypeHeader AspnBase;
+        """
+
+        output_filepath = join(self.output_folder, "fwd.h")
+        format_and_write_to_file(fwd_h, output_filepath)
+
+    def _generate_reflect_header(self):
+        print("Generating reflect.h")
+        reflect_h = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            *
+            * Field-level description of every ASPN-C struct, so loggers, exporters and
+            * other generic tools can walk any message without per-type code. Each
+            * struct has a constant {ASPN_PREFIX_LOWER}_<struct>_struct_info table, and the table of a
+            * message is also reachable from its type with {ASPN_PREFIX_LOWER}_message_struct_info().
+            *
+            * A field is an element type and a shape. The elements of a field are at
+            * {ASPN_PREFIX_LOWER}_field_data() and there are {ASPN_PREFIX_LOWER}_field_count() of them, in
+            * row-major order for matrices.
+            */
+
+            #pragma once
+
+            #include <stddef.h>
+            #include <stdint.h>
+            #include <string.h>
+            #ifndef __cplusplus
+            #	include <stdbool.h>
+            #endif
+
+            #ifdef __cplusplus
+            extern "C" {{
+            #endif
+
+            /* Type of the elements of a field */
+            typedef enum {ASPN_PREFIX}FieldType {{
+                {ASPN_PREFIX.upper()}_FIELD_BOOL,
+                {ASPN_PREFIX.upper()}_FIELD_CHAR,
+                {ASPN_PREFIX.upper()}_FIELD_INT8,
+                {ASPN_PREFIX.upper()}_FIELD_UINT8,
+                {ASPN_PREFIX.upper()}_FIELD_INT16,
+                {ASPN_PREFIX.upper()}_FIELD_UINT16,
+                {ASPN_PREFIX.upper()}_FIELD_INT32,
+                {ASPN_PREFIX.upper()}_FIELD_UINT32,
+                {ASPN_PREFIX.upper()}_FIELD_INT64,
+                {ASPN_PREFIX.upper()}_FIELD_UINT64,
+                {ASPN_PREFIX.upper()}_FIELD_FLOAT,
+                {ASPN_PREFIX.upper()}_FIELD_DOUBLE,
+                /* A C enum, whose values are listed in enum_values */
+                {ASPN_PREFIX.upper()}_FIELD_ENUM,
+                /* A nested ASPN type, described by struct_info */
+                {ASPN_PREFIX.upper()}_FIELD_STRUCT
+            }} {ASPN_PREFIX}FieldType;
+
+            /* How the elements of a field are stored in the struct */
+            typedef enum {ASPN_PREFIX}FieldShape {{
+                /* A single element */
+                {ASPN_PREFIX.upper()}_SHAPE_SCALAR,
+                /* rows elements, or rows x cols elements, stored in the struct */
+                {ASPN_PREFIX.upper()}_SHAPE_FIXED_ARRAY,
+                {ASPN_PREFIX.upper()}_SHAPE_FIXED_MATRIX,
+                /* A pointer to elements counted by the length field(s) of the field */
+                {ASPN_PREFIX.upper()}_SHAPE_ARRAY,
+                {ASPN_PREFIX.upper()}_SHAPE_MATRIX,
+                /* A NUL-terminated char* */
+                {ASPN_PREFIX.upper()}_SHAPE_STRING
+            }} {ASPN_PREFIX}FieldShape;
+
+            /* Value of the field index members of {ASPN_PREFIX}FieldInfo that do not refer to a field */
+            #define {ASPN_PREFIX.upper()}_NO_FIELD ((size_t)-1)
+
+            /* A named value of an enum field */
+            typedef struct {ASPN_PREFIX}EnumValue {{
+                const char* name;
+                int32_t value;
+            }} {ASPN_PREFIX}EnumValue;
+
+            struct {ASPN_PREFIX}StructInfo;
+
+            typedef struct {ASPN_PREFIX}FieldInfo {{
+                const char* name;
+                {ASPN_PREFIX}FieldType type;
+                {ASPN_PREFIX}FieldShape shape;
+                /* offsetof() the field in its struct */
+                size_t offset;
+                /* sizeof() one element */
+                size_t element_size;
+                /* Dimensions of fixed-size arrays and matrices, 1 for scalars, 0 when variable */
+                size_t rows;
+                size_t cols;
+                /* Index in the fields of the struct of the fields holding the rows and cols of
+                 * an array or matrix, or {ASPN_PREFIX.upper()}_NO_FIELD. Arrays only have rows. */
+                size_t rows_field;
+                size_t cols_field;
+                /* Index of the bool field telling whether a nested type is valid, or {ASPN_PREFIX.upper()}_NO_FIELD */
+                size_t condition_field;
+                /* true if the field is optional in the ICD */
+                bool nullable;
+                /* For {ASPN_PREFIX.upper()}_FIELD_STRUCT fields, the description of the nested type */
+                const struct {ASPN_PREFIX}StructInfo* struct_info;
+                /* For {ASPN_PREFIX.upper()}_FIELD_ENUM fields, the names of the values of the enum */
+                const {ASPN_PREFIX}EnumValue* enum_values;
+                size_t num_enum_values;
+            }} {ASPN_PREFIX}FieldInfo;
+
+            typedef struct {ASPN_PREFIX}StructInfo {{
+                /* Name of the C struct */
+                const char* name;
+                /* sizeof() the struct */
+                size_t size;
+                size_t num_fields;
+                /* The fields, in declaration order */
+                const {ASPN_PREFIX}FieldInfo* fields;
+            }} {ASPN_PREFIX}StructInfo;
+
+            /* Address of the field in the struct at self */
+            static inline const void* {ASPN_PREFIX_LOWER}_field_address(const void* self, const {ASPN_PREFIX}FieldInfo* field) {{
+                return (const unsigned char*)self + field->offset;
+            }}
+
+            /* Address of the first element of the field, following the pointer of arrays, matrices and strings */
+            static inline const void* {ASPN_PREFIX_LOWER}_field_data(const void* self, const {ASPN_PREFIX}FieldInfo* field) {{
+                const void* pointer;
+                if (field->shape < {ASPN_PREFIX.upper()}_SHAPE_ARRAY) return {ASPN_PREFIX_LOWER}_field_address(self, field);
+                memcpy(&pointer, {ASPN_PREFIX_LOWER}_field_address(self, field), sizeof(pointer));
+                return pointer;
+            }}
+
+            /**
+            * Read an integer, bool, char or enum element, widened to int64_t. uint64_t
+            * values above INT64_MAX wrap around. Returns 0 for other element types.
+            */
+            static inline int64_t {ASPN_PREFIX_LOWER}_field_load_int(const void* element, const {ASPN_PREFIX}FieldInfo* field) {{
+                switch (field->type) {{
+                    case {ASPN_PREFIX.upper()}_FIELD_BOOL: return *(const bool*)element;
+                    case {ASPN_PREFIX.upper()}_FIELD_CHAR: return *(const char*)element;
+                    case {ASPN_PREFIX.upper()}_FIELD_INT8: return *(const int8_t*)element;
+                    case {ASPN_PREFIX.upper()}_FIELD_UINT8: return *(const uint8_t*)element;
+                    case {ASPN_PREFIX.upper()}_FIELD_INT16: return *(const int16_t*)element;
+                    case {ASPN_PREFIX.upper()}_FIELD_UINT16: return *(const uint16_t*)element;
+                    case {ASPN_PREFIX.upper()}_FIELD_INT32: return *(const int32_t*)element;
+                    case {ASPN_PREFIX.upper()}_FIELD_UINT32: return *(const uint32_t*)element;
+                    case {ASPN_PREFIX.upper()}_FIELD_INT64: return *(const int64_t*)element;
+                    case {ASPN_PREFIX.upper()}_FIELD_UINT64: return (int64_t)*(const uint64_t*)element;
+                    case {ASPN_PREFIX.upper()}_FIELD_ENUM:
+                        if (field->element_size == sizeof(int8_t)) return *(const int8_t*)element;
+                        if (field->element_size == sizeof(int16_t)) return *(const int16_t*)element;
+                        return *(const int32_t*)element;
+                    default: return 0;
+                }}
+            }}
+
+            /**
+            * Number of elements of the field in the struct at self described by info:
+            * 1 for scalars, the fixed or length field dimensions of arrays and matrices
+            * (0 if their pointer is NULL), and strlen() of strings (0 if NULL).
+            */
+            static inline size_t {ASPN_PREFIX_LOWER}_field_count(const void* self, const {ASPN_PREFIX}StructInfo* info, const {ASPN_PREFIX}FieldInfo* field) {{
+                const void* data = {ASPN_PREFIX_LOWER}_field_data(self, field);
+                size_t rows = field->rows;
+                size_t cols = field->cols;
+                if (field->shape < {ASPN_PREFIX.upper()}_SHAPE_ARRAY) return rows * cols;
+                if (data == NULL) return 0;
+                if (field->shape == {ASPN_PREFIX.upper()}_SHAPE_STRING) return strlen((const char*)data);
+                if (field->rows_field != {ASPN_PREFIX.upper()}_NO_FIELD) {{
+                    const {ASPN_PREFIX}FieldInfo* length = &info->fields[field->rows_field];
+                    rows = (size_t){ASPN_PREFIX_LOWER}_field_load_int({ASPN_PREFIX_LOWER}_field_address(self, length), length);
+                }}
+                if (field->cols_field != {ASPN_PREFIX.upper()}_NO_FIELD) {{
+                    const {ASPN_PREFIX}FieldInfo* length = &info->fields[field->cols_field];
+                    cols = (size_t){ASPN_PREFIX_LOWER}_field_load_int({ASPN_PREFIX_LOWER}_field_address(self, length), length);
+                }}
+                return rows * cols;
+            }}
+
+            /* Name of an enum value of the field, or NULL if the value has no name */
+            static inline const char* {ASPN_PREFIX_LOWER}_enum_value_name(const {ASPN_PREFIX}FieldInfo* field, int32_t value) {{
+                for (size_t ii = 0; ii < field->num_enum_values; ii++)
+                    if (field->enum_values[ii].value == value) return field->enum_values[ii].name;
+                return NULL;
+            }}
+
+            #ifdef __cplusplus
+            }}  // extern "C"
+            #endif
+        """
+
+        output_filepath = join(self.output_folder, "reflect.h")
+        format_and_write_to_file(reflect_h, output_filepath)
+
     def _generate_unversioned_header(self):
         print("Generating aspn.h and aspn.c")
         aspn_h_template = f"""
@@ -128,6 +395,12 @@ class AspnCBackend(Backend):
             * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
             */
 
+            /*
+            * Convenience umbrella including all of ASPN-C, plus unversioned Aspn* aliases
+            * of its types and functions. Generated code never includes it; it includes
+            * only the headers of the types it references, see fwd.h.
+            */
+
             #pragma once
 
             #ifdef __cplusplus
@@ -136,7 +409,26 @@ class AspnCBackend(Backend):
 
             #include "types.h"
             typedef enum Aspn23MessageType AspnMessageType;
+            typedef {ASPN_PREFIX}MessageTypeInfo AspnMessageTypeInfo;
             #define aspn_free {ASPN_PREFIX_LOWER}_free
+            #define aspn_message_type_info {ASPN_PREFIX_LOWER}_message_type_info
+            #define aspn_message_size {ASPN_PREFIX_LOWER}_message_size
+            #define aspn_is_pod {ASPN_PREFIX_LOWER}_is_pod
+            #define aspn_message_equals {ASPN_PREFIX_LOWER}_message_equals
+            #define aspn_message_hash {ASPN_PREFIX_LOWER}_message_hash
+            #define ASPN_EQUALS_NAN_EQUAL {ASPN_PREFIX.upper()}_EQUALS_NAN_EQUAL
+            #define aspn_message_serialized_size {ASPN_PREFIX_LOWER}_message_serialized_size
+            #define aspn_message_serialize {ASPN_PREFIX_LOWER}_message_serialize
+            #define aspn_message_deserialize {ASPN_PREFIX_LOWER}_message_deserialize
+            #define ASPN_SERIAL_HEADER_SIZE {ASPN_PREFIX.upper()}_SERIAL_HEADER_SIZE
+            #define aspn_peek_frame {ASPN_PREFIX_LOWER}_peek_frame
+            #define aspn_message_struct_info {ASPN_PREFIX_LOWER}_message_struct_info
+            #define aspn_field_address {ASPN_PREFIX_LOWER}_field_address
+            #define aspn_field_data {ASPN_PREFIX_LOWER}_field_data
+            #define aspn_field_load_int {ASPN_PREFIX_LOWER}_field_load_int
+            #define aspn_field_count {ASPN_PREFIX_LOWER}_field_count
+            #define aspn_enum_value_name {ASPN_PREFIX_LOWER}_enum_value_name
+            #define aspn_register_message_type {ASPN_PREFIX_LOWER}_register_message_type
             #define aspn_runtime_type_get_name {ASPN_PREFIX_LOWER}_runtime_type_get_name
 
             #include "utils.h"
@@ -145,7 +437,63 @@ class AspnCBackend(Backend):
             #define aspn_set_time {ASPN_PREFIX_LOWER}_set_time
             #define aspn_copy_message {ASPN_PREFIX_LOWER}_copy_message
 
+            #include "allocator.h"
+            typedef {ASPN_PREFIX}Allocator AspnAllocator;
+            typedef {ASPN_PREFIX}Arena AspnArena;
+            #define aspn_set_allocator {ASPN_PREFIX_LOWER}_set_allocator
+            #define aspn_get_allocator {ASPN_PREFIX_LOWER}_get_allocator
+            #define aspn_mem_alloc {ASPN_PREFIX_LOWER}_mem_alloc
+            #define aspn_mem_calloc {ASPN_PREFIX_LOWER}_mem_calloc
+            #define aspn_mem_free {ASPN_PREFIX_LOWER}_mem_free
+            #define aspn_mem_strdup {ASPN_PREFIX_LOWER}_mem_strdup
+            #define aspn_arena_init {ASPN_PREFIX_LOWER}_arena_init
+            #define aspn_arena_new {ASPN_PREFIX_LOWER}_arena_new
+            #define aspn_arena_destroy {ASPN_PREFIX_LOWER}_arena_destroy
+            #define aspn_arena_alloc {ASPN_PREFIX_LOWER}_arena_alloc
+            #define aspn_arena_reset {ASPN_PREFIX_LOWER}_arena_reset
+            #define aspn_arena_allocator {ASPN_PREFIX_LOWER}_arena_allocator
+
+            #include "pool.h"
+            typedef {ASPN_PREFIX}Pool AspnPool;
+            typedef {ASPN_PREFIX}PoolStats AspnPoolStats;
+            #define aspn_pool_create {ASPN_PREFIX_LOWER}_pool_create
+            #define aspn_pool_create_thread_safe {ASPN_PREFIX_LOWER}_pool_create_thread_safe
+            #define aspn_pool_destroy {ASPN_PREFIX_LOWER}_pool_destroy
+            #define aspn_pool_acquire {ASPN_PREFIX_LOWER}_pool_acquire
+            #define aspn_pool_release {ASPN_PREFIX_LOWER}_pool_release
+            #define aspn_pool_get_stats {ASPN_PREFIX_LOWER}_pool_get_stats
+
+            #include "ring.h"
+            typedef {ASPN_PREFIX}Ring AspnRing;
+            typedef {ASPN_PREFIX}RingStats AspnRingStats;
+            #define ASPN_RING_MULTI_PRODUCER {ASPN_PREFIX.upper()}_RING_MULTI_PRODUCER
+            #define ASPN_RING_DROP_OLDEST {ASPN_PREFIX.upper()}_RING_DROP_OLDEST
+            #define aspn_ring_create {ASPN_PREFIX_LOWER}_ring_create
+            #define aspn_ring_destroy {ASPN_PREFIX_LOWER}_ring_destroy
+            #define aspn_ring_push {ASPN_PREFIX_LOWER}_ring_push
+            #define aspn_ring_pop {ASPN_PREFIX_LOWER}_ring_pop
+            #define aspn_ring_push_batch {ASPN_PREFIX_LOWER}_ring_push_batch
+            #define aspn_ring_pop_batch {ASPN_PREFIX_LOWER}_ring_pop_batch
+            #define aspn_ring_occupancy {ASPN_PREFIX_LOWER}_ring_occupancy
+            #define aspn_ring_get_stats {ASPN_PREFIX_LOWER}_ring_get_stats
+
+            #include "merge.h"
+            typedef {ASPN_PREFIX}Merger AspnMerger;
+            typedef {ASPN_PREFIX}MergerStats AspnMergerStats;
+            #define aspn_merger_create {ASPN_PREFIX_LOWER}_merger_create
+            #define aspn_merger_destroy {ASPN_PREFIX_LOWER}_merger_destroy
+            #define aspn_merger_push {ASPN_PREFIX_LOWER}_merger_push
+            #define aspn_merger_close {ASPN_PREFIX_LOWER}_merger_close
+            #define aspn_merger_pop {ASPN_PREFIX_LOWER}_merger_pop
+            #define aspn_merger_drain {ASPN_PREFIX_LOWER}_merger_drain
+            #define aspn_merger_get_stats {ASPN_PREFIX_LOWER}_merger_get_stats
+            #define aspn_merge_sorted_arrays {ASPN_PREFIX_LOWER}_merge_sorted_arrays
+
             #include "messages_and_types.h"
+            typedef {ASPN_PREFIX}ArrayView AspnArrayView;
+            typedef {ASPN_PREFIX}FieldInfo AspnFieldInfo;
+            typedef {ASPN_PREFIX}StructInfo AspnStructInfo;
+            typedef {ASPN_PREFIX}EnumValue AspnEnumValue;
             {{aliases}}
 
             #ifdef __cplusplus
@@ -165,6 +513,12 @@ class AspnCBackend(Backend):
             * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
             */
 
+            /*
+            * Convenience umbrella including the header of every message and type.
+            * Generated code never includes it, so editing one message only rebuilds
+            * the sources that reference it.
+            */
+
             #pragma once
 
             {includes}
@@ -193,12 +547,6 @@ class AspnCBackend(Backend):
             #include <{ASPN_PREFIX_LOWER}/TypeTimestamp.h>
             #include <{ASPN_PREFIX_LOWER}/TypeHeader.h>
 
-            /*
-            * An alias for cases where the object has been up-casted and should be
-            * down-casted before using it.
-            */
-            typedef {ASPN_PREFIX}TypeHeader AspnBase;
-
             bool {ASPN_PREFIX_LOWER}_is_core_message(AspnBase* base);
 
             {ASPN_PREFIX}TypeTimestamp {ASPN_PREFIX_LOWER}_get_time(const AspnBase* base);
@@ -218,44 +566,43 @@ class AspnCBackend(Backend):
             */
 
             #include <{ASPN_PREFIX_LOWER}/utils.h>
-            #include <{ASPN_PREFIX_LOWER}/messages_and_types.h>
 
             bool {ASPN_PREFIX_LOWER}_is_core_message(AspnBase* base) {{
                 if (base == NULL) {{
-                    printf("is_core_message received a NULL pointer\\n");
+                    fprintf(stderr, "is_core_message received a NULL pointer\\n");
                     return false;
                 }}
                 return base->message_type <= ASPN_LAST_MESSAGE;
             }}
 
+            static const {ASPN_PREFIX}MessageTypeInfo* timed_type_info(const AspnBase* base, const char* caller) {{
+                const {ASPN_PREFIX}MessageTypeInfo* info = {ASPN_PREFIX_LOWER}_message_type_info(base->message_type);
+                if (info == NULL || info->time_offset == {ASPN_PREFIX_UPPER}_NO_TIME_OFFSET) {{
+                    fprintf(stderr, "%s: cannot access time of message of type %i\\n", caller, base->message_type);
+                    return NULL;
+                }}
+                return info;
+            }}
+
             {ASPN_PREFIX}TypeTimestamp {ASPN_PREFIX_LOWER}_get_time(const AspnBase* base) {{
-                switch(base->message_type) {{
-                {aspn_type_get_time_cases}
-                default: {{
-                    printf("{ASPN_PREFIX_LOWER}_get_time: cannot get time from message of type %i\\n", base->message_type);
-                    Aspn23TypeTimestamp out = {{0}};
+                const {ASPN_PREFIX}MessageTypeInfo* info = timed_type_info(base, "{ASPN_PREFIX_LOWER}_get_time");
+                if (info == NULL) {{
+                    {ASPN_PREFIX}TypeTimestamp out = {{0}};
                     return out;
                 }}
-                }}
+                return *(const {ASPN_PREFIX}TypeTimestamp*)((const char*)base + info->time_offset);
             }}
 
             void {ASPN_PREFIX_LOWER}_set_time(AspnBase* base, {ASPN_PREFIX}TypeTimestamp time) {{
-                switch(base->message_type) {{
-                {aspn_type_set_time_cases}
-                default: {{
-                    printf("{ASPN_PREFIX_LOWER}_set_time: cannot get time from message of type %i\\n", base->message_type);
-                    return;
-                }}
-                }}
+                const {ASPN_PREFIX}MessageTypeInfo* info = timed_type_info(base, "{ASPN_PREFIX_LOWER}_set_time");
+                if (info == NULL) return;
+                *({ASPN_PREFIX}TypeTimestamp*)((char*)base + info->time_offset) = time;
             }}
 
             AspnBase* {ASPN_PREFIX_LOWER}_copy_message(AspnBase* base) {{
-                switch(base->message_type) {{
-                {aspn_copy_message_cases}
-                default: {{
-                    return NULL;
-                }}
-                }}
+                const {ASPN_PREFIX}MessageTypeInfo* info = {ASPN_PREFIX_LOWER}_message_type_info(base->message_type);
+                if (info == NULL || info->copy == NULL) return NULL;
+                return info->copy(base);
             }}
         """
 
@@ -267,9 +614,7 @@ class AspnCBackend(Backend):
         source_contents = utils_c_template.format(
             ASPN_PREFIX=ASPN_PREFIX,
             ASPN_PREFIX_LOWER=ASPN_PREFIX_LOWER,
-            aspn_type_get_time_cases=self.aspn_type_get_time_cases,
-            aspn_type_set_time_cases=self.aspn_type_set_time_cases,
-            aspn_copy_message_cases=self.aspn_copy_message_cases,
+            ASPN_PREFIX_UPPER=ASPN_PREFIX.upper(),
         )
         output_filepath = join(self.output_folder, "utils.c")
         format_and_write_to_file(source_contents, output_filepath)
@@ -279,6 +624,12 @@ class AspnCBackend(Backend):
         types_h_template = """
             #pragma once
 
+            #include <stddef.h>
+            #include <stdint.h>
+            #ifndef __cplusplus
+            #	include <stdbool.h>
+            #endif
+
             #ifdef __cplusplus
             extern "C" {{
             #endif
@@ -309,6 +660,108 @@ class AspnCBackend(Backend):
 
             #define ASPN_NUM_MESSAGES {num_messages}
 
+            /* Value of {ASPN_PREFIX}MessageTypeInfo.time_offset for types without a time_of_validity */
+            #define {ASPN_PREFIX_UPPER}_NO_TIME_OFFSET ((size_t)-1)
+
+            /* Number of extension types that can be added with {ASPN_PREFIX_LOWER}_register_message_type() */
+            #ifndef {ASPN_PREFIX_UPPER}_MAX_EXTENDED_MESSAGE_TYPES
+            #	define {ASPN_PREFIX_UPPER}_MAX_EXTENDED_MESSAGE_TYPES 64
+            #endif
+
+            struct {ASPN_PREFIX}TypeHeader;
+            struct {ASPN_PREFIX}Allocator;
+            struct {ASPN_PREFIX}StructInfo;
+
+            /**
+            * Runtime description of a message type. The generic functions operating on
+            * messages ({ASPN_PREFIX_LOWER}_free(), {ASPN_PREFIX_LOWER}_get_time(), {ASPN_PREFIX_LOWER}_copy_message(), ...)
+            * dispatch through a constant table of these, indexed by message type.
+            */
+            typedef struct {ASPN_PREFIX}MessageTypeInfo {{
+                {ASPN_PREFIX}MessageType type;
+                const char* name;
+                /* sizeof() the message struct */
+                size_t size;
+                /* offsetof() its time_of_validity field, or {ASPN_PREFIX_UPPER}_NO_TIME_OFFSET */
+                size_t time_offset;
+                void (*free)(void* pointer);
+                struct {ASPN_PREFIX}TypeHeader* (*copy)(struct {ASPN_PREFIX}TypeHeader* base);
+                bool (*copy_into)(struct {ASPN_PREFIX}TypeHeader* dst, const struct {ASPN_PREFIX}TypeHeader* src);
+                /* true if the message owns no heap memory, so copying size bytes copies it */
+                bool is_pod;
+                bool (*equals)(const struct {ASPN_PREFIX}TypeHeader* a, const struct {ASPN_PREFIX}TypeHeader* b, unsigned flags);
+                uint64_t (*hash)(const struct {ASPN_PREFIX}TypeHeader* base);
+                size_t (*serialized_size)(const struct {ASPN_PREFIX}TypeHeader* base);
+                size_t (*serialize)(const struct {ASPN_PREFIX}TypeHeader* base, uint8_t* buf, size_t len);
+                struct {ASPN_PREFIX}TypeHeader* (*deserialize)(const uint8_t* buf, size_t len, const struct {ASPN_PREFIX}Allocator* allocator);
+                /* Field-level description of the message struct, see reflect.h */
+                const struct {ASPN_PREFIX}StructInfo* struct_info;
+            }} {ASPN_PREFIX}MessageTypeInfo;
+
+            /**
+            * Returns the description of a message type, or NULL if the type is neither
+            * an ASPN message nor a registered extension.
+            */
+            const {ASPN_PREFIX}MessageTypeInfo* {ASPN_PREFIX_LOWER}_message_type_info({ASPN_PREFIX}MessageType type);
+
+            /* Returns sizeof() the struct of a message type, or 0 if the type is unknown. */
+            size_t {ASPN_PREFIX_LOWER}_message_size({ASPN_PREFIX}MessageType type);
+
+            /**
+            * Returns the field-level description of the struct of a message type, or
+            * NULL if the type is unknown or was registered without one.
+            */
+            const struct {ASPN_PREFIX}StructInfo* {ASPN_PREFIX_LOWER}_message_struct_info({ASPN_PREFIX}MessageType type);
+
+            /**
+            * Returns true if messages of the type own no heap memory, so containers can
+            * copy them with a single memcpy of {ASPN_PREFIX_LOWER}_message_size() bytes and
+            * release them without calling {ASPN_PREFIX_LOWER}_free() on their members.
+            * Messages with variable-length arrays, matrices or strings are not POD; for
+            * them, the type's copy_into() copies the fixed-size part with one memcpy and
+            * then only the arrays.
+            */
+            bool {ASPN_PREFIX_LOWER}_is_pod({ASPN_PREFIX}MessageType type);
+
+            /**
+            * Compare two messages of any type with their generated _equals() function.
+            * Messages of different types are never equal.
+            */
+            bool {ASPN_PREFIX_LOWER}_message_equals(const struct {ASPN_PREFIX}TypeHeader* a, const struct {ASPN_PREFIX}TypeHeader* b, unsigned flags);
+
+            /* Hash a message of any type with its generated _hash() function. Returns 0 for unknown types. */
+            uint64_t {ASPN_PREFIX_LOWER}_message_hash(const struct {ASPN_PREFIX}TypeHeader* base);
+
+            /* Size of a message of any type once serialized, see the generated _serialized_size(). */
+            size_t {ASPN_PREFIX_LOWER}_message_serialized_size(const struct {ASPN_PREFIX}TypeHeader* base);
+
+            /**
+            * Serialize a message of any type with its generated _serialize() function.
+            * Returns the number of bytes written, or 0 if buf is too small or the type
+            * cannot be serialized.
+            */
+            size_t {ASPN_PREFIX_LOWER}_message_serialize(const struct {ASPN_PREFIX}TypeHeader* base, uint8_t* buf, size_t len);
+
+            /**
+            * Deserialize a message of any type, picking the generated _deserialize()
+            * function from the type tag of the frame. The message is a single block,
+            * released with allocator->free(), or {ASPN_PREFIX_LOWER}_mem_free() if allocator is
+            * NULL. Returns NULL if buf is malformed or holds an unknown type.
+            */
+            struct {ASPN_PREFIX}TypeHeader* {ASPN_PREFIX_LOWER}_message_deserialize(const uint8_t* buf, size_t len, const struct {ASPN_PREFIX}Allocator* allocator);
+
+            /**
+            * Register an extension message type in the ASPN_EXTENDED_BEGIN..ASPN_EXTENDED_END
+            * range, so the generic message functions can handle it. The description is
+            * copied, but its name must outlive the registration. Returns false if the type
+            * is outside the extended range, is already registered, or if
+            * {ASPN_PREFIX_UPPER}_MAX_EXTENDED_MESSAGE_TYPES types are registered already.
+            *
+            * Registration is not synchronized; register all types before messages are
+            * handled by other threads.
+            */
+            bool {ASPN_PREFIX_LOWER}_register_message_type(const {ASPN_PREFIX}MessageTypeInfo* info);
+
             void {ASPN_PREFIX_LOWER}_free(void* pointer);
 
             char* {ASPN_PREFIX_LOWER}_runtime_type_get_name({ASPN_PREFIX}MessageType type);
@@ -319,34 +772,129 @@ class AspnCBackend(Backend):
         """
 
         types_c_template = """
-            #include <{ASPN_PREFIX_LOWER}/aspn.h>
             #include "types.h"
+            #include "utils.h"
+            {messages_includes}
+
+            {message_type_wrappers}
+
+            static const {ASPN_PREFIX}MessageTypeInfo message_types[ASPN_NUM_MESSAGES] = {{
+                [ASPN_UNDEFINED] = {{ASPN_UNDEFINED, "UNDEFINED", 0, {ASPN_PREFIX_UPPER}_NO_TIME_OFFSET, NULL, NULL, NULL, false, NULL, NULL, NULL, NULL, NULL, NULL}},
+                {message_type_infos}
+            }};
+
+            static {ASPN_PREFIX}MessageTypeInfo extended_types[{ASPN_PREFIX_UPPER}_MAX_EXTENDED_MESSAGE_TYPES];
+            static size_t num_extended_types = 0;
+
+            const {ASPN_PREFIX}MessageTypeInfo* {ASPN_PREFIX_LOWER}_message_type_info({ASPN_PREFIX}MessageType type) {{
+                if ((size_t)type < ASPN_NUM_MESSAGES) return &message_types[type];
+                for (size_t ii = 0; ii < num_extended_types; ii++)
+                    if (extended_types[ii].type == type) return &extended_types[ii];
+                return NULL;
+            }}
+
+            size_t {ASPN_PREFIX_LOWER}_message_size({ASPN_PREFIX}MessageType type) {{
+                const {ASPN_PREFIX}MessageTypeInfo* info = {ASPN_PREFIX_LOWER}_message_type_info(type);
+                return (info == NULL) ? 0 : info->size;
+            }}
+
+            const {ASPN_PREFIX}StructInfo* {ASPN_PREFIX_LOWER}_message_struct_info({ASPN_PREFIX}MessageType type) {{
+                const {ASPN_PREFIX}MessageTypeInfo* info = {ASPN_PREFIX_LOWER}_message_type_info(type);
+                return (info == NULL) ? NULL : info->struct_info;
+            }}
+
+            bool {ASPN_PREFIX_LOWER}_is_pod({ASPN_PREFIX}MessageType type) {{
+                const {ASPN_PREFIX}MessageTypeInfo* info = {ASPN_PREFIX_LOWER}_message_type_info(type);
+                return info != NULL && info->is_pod;
+            }}
+
+            bool {ASPN_PREFIX_LOWER}_message_equals(const AspnBase* a, const AspnBase* b, unsigned flags) {{
+                const {ASPN_PREFIX}MessageTypeInfo* info;
+                if (a == b) return true;
+                if (a == NULL || b == NULL || a->message_type != b->message_type) return false;
+                info = {ASPN_PREFIX_LOWER}_message_type_info(a->message_type);
+                if (info == NULL || info->equals == NULL) {{
+                    fprintf(stderr, "{ASPN_PREFIX_LOWER}_message_equals: cannot compare messages of type %i\\n", a->message_type);
+                    return false;
+                }}
+                return info->equals(a, b, flags);
+            }}
+
+            uint64_t {ASPN_PREFIX_LOWER}_message_hash(const AspnBase* base) {{
+                const {ASPN_PREFIX}MessageTypeInfo* info;
+                if (base == NULL) return 0;
+                info = {ASPN_PREFIX_LOWER}_message_type_info(base->message_type);
+                if (info == NULL || info->hash == NULL) {{
+                    fprintf(stderr, "{ASPN_PREFIX_LOWER}_message_hash: cannot hash message of type %i\\n", base->message_type);
+                    return 0;
+                }}
+                return info->hash(base);
+            }}
+
+            size_t {ASPN_PREFIX_LOWER}_message_serialized_size(const AspnBase* base) {{
+                const {ASPN_PREFIX}MessageTypeInfo* info;
+                if (base == NULL) return 0;
+                info = {ASPN_PREFIX_LOWER}_message_type_info(base->message_type);
+                if (info == NULL || info->serialized_size == NULL) {{
+                    fprintf(stderr, "{ASPN_PREFIX_LOWER}_message_serialized_size: cannot serialize message of type %i\\n", base->message_type);
+                    return 0;
+                }}
+                return info->serialized_size(base);
+            }}
+
+            size_t {ASPN_PREFIX_LOWER}_message_serialize(const AspnBase* base, uint8_t* buf, size_t len) {{
+                const {ASPN_PREFIX}MessageTypeInfo* info;
+                if (base == NULL || buf == NULL) return 0;
+                info = {ASPN_PREFIX_LOWER}_message_type_info(base->message_type);
+                if (info == NULL || info->serialize == NULL) {{
+                    fprintf(stderr, "{ASPN_PREFIX_LOWER}_message_serialize: cannot serialize message of type %i\\n", base->message_type);
+                    return 0;
+                }}
+                return info->serialize(base, buf, len);
+            }}
+
+            AspnBase* {ASPN_PREFIX_LOWER}_message_deserialize(const uint8_t* buf, size_t len, const {ASPN_PREFIX}Allocator* allocator) {{
+                const {ASPN_PREFIX}MessageTypeInfo* info;
+                {ASPN_PREFIX}Reader reader;
+                uint16_t type;
+                uint32_t payload_size;
+                if (buf == NULL) return NULL;
+                reader.cursor = buf;
+                reader.end = buf + len;
+                if (!{ASPN_PREFIX_LOWER}_read_serial_header(&reader, &type, &payload_size)) return NULL;
+                info = {ASPN_PREFIX_LOWER}_message_type_info(({ASPN_PREFIX}MessageType)type);
+                if (info == NULL || info->deserialize == NULL) return NULL;
+                return info->deserialize(buf, len, allocator);
+            }}
+
+            bool {ASPN_PREFIX_LOWER}_register_message_type(const {ASPN_PREFIX}MessageTypeInfo* info) {{
+                if (info == NULL || info->type < ASPN_EXTENDED_BEGIN || info->type > ASPN_EXTENDED_END) return false;
+                if ({ASPN_PREFIX_LOWER}_message_type_info(info->type) != NULL) return false;
+                if (num_extended_types == {ASPN_PREFIX_UPPER}_MAX_EXTENDED_MESSAGE_TYPES) return false;
+                extended_types[num_extended_types++] = *info;
+                return true;
+            }}
 
             void {ASPN_PREFIX_LOWER}_free(void* pointer) {{
                 {ASPN_PREFIX}TypeHeader* self = ({ASPN_PREFIX}TypeHeader*)pointer;
+                const {ASPN_PREFIX}MessageTypeInfo* info;
                 if (NULL == self) return;
 
-                switch(self->message_type) {{
-                case ASPN_UNDEFINED:
-                    break;
-                {aspn_free_cases}
-                default: {{
-                    printf("{ASPN_PREFIX_LOWER}_free: cannot free message of type %i\\n", self->message_type);
-                    break;
-                }}
+                info = {ASPN_PREFIX_LOWER}_message_type_info(self->message_type);
+                if (info == NULL) {{
+                    fprintf(stderr, "{ASPN_PREFIX_LOWER}_free: cannot free message of type %i\\n", self->message_type);
+                    return;
                 }}
+                if (info->free != NULL) info->free(pointer);
             }}
 
             char* {ASPN_PREFIX_LOWER}_runtime_type_get_name({ASPN_PREFIX}MessageType type) {{
-                switch(type) {{
-                case ASPN_UNDEFINED:
-                    return "UNDEFINED";
-                {aspn_type_string_cases}
-                default: {{
-                    printf("{ASPN_PREFIX_LOWER}_runtime_type_get_name: cannot get name from message of type %i\\n", type);
+                const {ASPN_PREFIX}MessageTypeInfo* info = {ASPN_PREFIX_LOWER}_message_type_info(type);
+                if (info == NULL) {{
+                    fprintf(stderr, "{ASPN_PREFIX_LOWER}_runtime_type_get_name: cannot get name from message of type %i\\n", type);
                     return NULL;
                 }}
-                }}
+                return (char*)info->name;
             }}
         """
 
@@ -357,123 +905,2036 @@ class AspnCBackend(Backend):
             last_type=self.all_types_enum[-1],
             ASPN_PREFIX=ASPN_PREFIX,
             ASPN_PREFIX_LOWER=ASPN_PREFIX_LOWER,
+            ASPN_PREFIX_UPPER=ASPN_PREFIX.upper(),
             num_messages=len(self.all_types_enum) + 1,
         )
         output_filepath = join(self.output_folder, "types.h")
         format_and_write_to_file(header_contents, output_filepath)
 
         source_contents = types_c_template.format(
-            aspn_free_cases=self.free_cases,
-            aspn_type_string_cases=self.type_string_cases,
+            message_type_wrappers=self.message_type_wrappers,
+            message_type_infos=self.message_type_infos,
+            messages_includes=self.messages_includes,
             ASPN_PREFIX=ASPN_PREFIX,
             ASPN_PREFIX_LOWER=ASPN_PREFIX_LOWER,
+            ASPN_PREFIX_UPPER=ASPN_PREFIX.upper(),
         )
         output_filepath = join(self.output_folder, "types.c")
         format_and_write_to_file(source_contents, output_filepath)
 
-    def _generate_common_header(self):
-        print("Generating common.h")
-        common_h = f"""
+    def _generate_allocator(self):
+        print("Generating allocator.h and allocator.c")
+        allocator_h = f"""
             /*
             * This code is generated via firehose.
             * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
             */
 
             #pragma once
-            #include <stddef.h>
-            #include <stdlib.h>
-            #include <string.h>
-            #include <stdbool.h>
-            #include <stdio.h>
-            #include <math.h>
 
-            #include "types.h"
+            #include "common.h"
 
-            #ifdef ASPN_NO_STDINT
+            #ifdef __cplusplus
+            extern "C" {{
+            #endif
 
-            typedef char int8_t;
-            typedef short int int16_t;
-            typedef int int32_t;
-            typedef unsigned char uint8_t;
-            typedef unsigned short uint16_t;
-            typedef unsigned int uint32_t;
+            /**
+            * A set of memory management hooks. Every allocation made by ASPN-C
+            * (message structs, variable-length arrays, matrices and strings) goes
+            * through the allocator installed with {ASPN_PREFIX_LOWER}_set_allocator(), and every
+            * {ASPN_PREFIX_LOWER}_*_free() and {ASPN_PREFIX_LOWER}_*_free_members() call releases memory
+            * through it.
+            */
+            typedef struct {ASPN_PREFIX}Allocator {{
+                /* Returns size bytes aligned for any type, or NULL on failure. */
+                void* {ASPN_NULLABLE_MACRO} (*alloc)(size_t size, void* {ASPN_NULLABLE_MACRO} context);
+                /* Releases memory returned by alloc. Must accept NULL. */
+                void (*free)(void* {ASPN_NULLABLE_MACRO} pointer, void* {ASPN_NULLABLE_MACRO} context);
+                /* Passed unchanged to alloc and free. */
+                void* {ASPN_NULLABLE_MACRO} context;
+            }} {ASPN_PREFIX}Allocator;
 
-            #	ifdef ASPN_LONG_LONG
-            typedef long long int64_t;
-            typedef unsigned long long uint64_t;
-            #	else
-            typedef long int64_t;
-            typedef unsigned long uint64_t;
-            #	endif
+            /**
+            * Install the allocator used by all ASPN-C functions. The struct is copied.
+            * Passing NULL restores the default malloc()/free() allocator.
+            *
+            * This is process-global state and is not synchronized. Install an
+            * allocator before any messages are created, and only release messages
+            * through the allocator they were created with.
+            */
+            void {ASPN_PREFIX_LOWER}_set_allocator(const {ASPN_PREFIX}Allocator* {ASPN_NULLABLE_MACRO} allocator);
 
-            #else
-            #	include <stdint.h>
-            #endif
+            /* Returns the currently installed allocator. */
+            const {ASPN_PREFIX}Allocator* {ASPN_PREFIX_LOWER}_get_allocator(void);
 
-            #ifndef __cplusplus
-            #	ifdef ASPN_NO_BOOL
-            #		define false 0
-            #		define true 1
-            #		define bool int
-            #	else
-            #		include <stdbool.h>
-            #	endif
-            #endif
+            /* Allocate, zero-allocate, free and duplicate through the current allocator. */
+            void* {ASPN_NULLABLE_MACRO} {ASPN_PREFIX_LOWER}_mem_alloc(size_t size);
+            void* {ASPN_NULLABLE_MACRO} {ASPN_PREFIX_LOWER}_mem_calloc(size_t count, size_t size);
+            void {ASPN_PREFIX_LOWER}_mem_free(void* {ASPN_NULLABLE_MACRO} pointer);
+            char* {ASPN_NULLABLE_MACRO} {ASPN_PREFIX_LOWER}_mem_strdup(const char* {ASPN_NULLABLE_MACRO} string);
 
-            #ifndef __has_feature
-            #	define __has_feature(x) 0
-            #endif
+            /* Alignment of every block handed out by an {ASPN_PREFIX}Arena. */
+            #define {ASPN_PREFIX.upper()}_ARENA_ALIGNMENT 16
 
-            /**
-            * Define a set of pragmas and attributes to instrument code to define whether or
-            * not pointers may be null. This feature attempts to gracefully disable itself
-            * if the current compiler is unable to support static analysis of nullability.
-            * However, if this automatic disabling fails, the user may define {ASPN_DISABLE_NULLABILITY}
-            * to force nullability checks off. In this case, the burden is
-            * still on the user to not set NULL to pointers defined as not NULL.
-            */
-            #if __has_feature(nullability) && defined(_Pragma) && !defined({ASPN_DISABLE_NULLABILITY})
+            /* Rounds size up to a multiple of {ASPN_PREFIX.upper()}_ARENA_ALIGNMENT. */
+            #define {ASPN_PREFIX.upper()}_ALIGN_UP(size) \\
+                (((size) + ({ASPN_PREFIX.upper()}_ARENA_ALIGNMENT - 1)) & ~(size_t)({ASPN_PREFIX.upper()}_ARENA_ALIGNMENT - 1))
 
             /**
-            * Indicates that pointers should be assumed to be not NULL unless
-            * they are explicitly marked with {ASPN_NULLABLE_MACRO}.
-            *
-            * All pointers in type and function definitions declared in the region between
-            * {ASPN_NULLABILITY_MACRO_START} and {ASPN_NULLABILITY_MACRO_END} in a file are
-            * by default not NULL-able. For example, consider the following code:
-            *
-            *  #include <{ASPN_DIR}/aspn.h>
-            *
-            *  // After this macro, all pointers are assumed to be not NULL-able unless
-            *  // otherwise marked
-            *  {ASPN_NULLABILITY_MACRO_START}
-            *
-            *  // This function takes a int pointer parameter that must not be null
-            *  int foo(int* a) {{ ... }}
-            *  // This function takes a int pointer parameter that may be null
-            *  int bar(int* {ASPN_NULLABLE_MACRO} a) {{ ... }}
-            *
-            *  ...
+            * A bump allocator over a single contiguous buffer. Allocation is a pointer
+            * increment and freeing individual blocks is a no-op; all memory is released
+            * at once with {ASPN_PREFIX_LOWER}_arena_reset(). This makes it possible to create
+            * and drop whole batches of messages without per-field heap traffic:
             *
-            *  // Invalid-- parameter a cannot be NULL
-            *  foo(NULL);
-            *  // OK-- Parameter explicitly marked as nullable
-            *  bar(NULL);
+            *  {ASPN_PREFIX}Arena* arena = {ASPN_PREFIX_LOWER}_arena_new(1 << 20);
+            *  {ASPN_PREFIX}Allocator allocator = {ASPN_PREFIX_LOWER}_arena_allocator(arena);
+            *  {ASPN_PREFIX_LOWER}_set_allocator(&allocator);
+            *  for (;;) {{
+            *      // ... create, use and drop messages ...
+            *      {ASPN_PREFIX_LOWER}_arena_reset(arena);
+            *  }}
             *
-            *  {ASPN_NULLABILITY_MACRO_END}
-            *
-            * Users of types within a ASPN_ASSUME_NONNULL region must ensure that pointer fields and
-            * arguments are not populated with a NULL value when passing them across ASPN API
-            * boundaries. Pointers explicitly annotated with {ASPN_NULLABLE_MACRO} are still nullable,
-            * even when within such a region.
+            * Calling {ASPN_PREFIX_LOWER}_*_free() on messages in an arena is allowed and does
+            * nothing. An arena is not thread-safe.
             */
-            #	define {ASPN_NULLABILITY_MACRO_START} _Pragma("clang assume_nonnull begin")
+            typedef struct {ASPN_PREFIX}Arena {{
+                unsigned char* {ASPN_NULLABLE_MACRO} buffer;
+                size_t capacity;
+                /* Bytes currently handed out. */
+                size_t used;
+                /* Largest value of used since the arena was created. */
+                size_t high_water;
+                /* Allocations that failed because the arena was full. */
+                size_t failed_allocations;
+                bool owns_buffer;
+            }} {ASPN_PREFIX}Arena;
 
-            /**
-            * Ending a default not NULL region started by {ASPN_NULLABILITY_MACRO_START}. Definitions
-            * after a {ASPN_NULLABILITY_MACRO_END} return to ambiguous nullability unless otherwise
-            * explicitly marked. */
-            #	define {ASPN_NULLABILITY_MACRO_END} _Pragma("clang assume_nonnull end")
+            /* Initialize an arena over a caller-owned buffer. */
+            void {ASPN_PREFIX_LOWER}_arena_init({ASPN_PREFIX}Arena* arena, void* buffer, size_t capacity);
+
+            /* Create an arena with a buffer of capacity bytes from malloc(). */
+            {ASPN_PREFIX}Arena* {ASPN_NULLABLE_MACRO} {ASPN_PREFIX_LOWER}_arena_new(size_t capacity);
+
+            /* Release an arena created with {ASPN_PREFIX_LOWER}_arena_new(). */
+            void {ASPN_PREFIX_LOWER}_arena_destroy({ASPN_PREFIX}Arena* {ASPN_NULLABLE_MACRO} arena);
+
+            /* Returns an aligned block of size bytes, or NULL if the arena is exhausted. */
+            void* {ASPN_NULLABLE_MACRO} {ASPN_PREFIX_LOWER}_arena_alloc({ASPN_PREFIX}Arena* arena, size_t size);
+
+            /* Release every block of the arena at once. */
+            void {ASPN_PREFIX_LOWER}_arena_reset({ASPN_PREFIX}Arena* arena);
+
+            /* Returns an allocator that allocates from the arena. */
+            {ASPN_PREFIX}Allocator {ASPN_PREFIX_LOWER}_arena_allocator({ASPN_PREFIX}Arena* arena);
+
+            #ifdef __cplusplus
+            }}  // extern "C"
+            #endif
+        """
+
+        allocator_c = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            */
+
+            #include "allocator.h"
+
+            static void* default_alloc(size_t size, void* context) {{
+                (void)context;
+                return malloc(size);
+            }}
+
+            static void default_free(void* pointer, void* context) {{
+                (void)context;
+                free(pointer);
+            }}
+
+            static const {ASPN_PREFIX}Allocator default_allocator = {{default_alloc, default_free, NULL}};
+
+            static {ASPN_PREFIX}Allocator current_allocator = {{default_alloc, default_free, NULL}};
+
+            void {ASPN_PREFIX_LOWER}_set_allocator(const {ASPN_PREFIX}Allocator* allocator) {{
+                current_allocator = (allocator != NULL) ? *allocator : default_allocator;
+            }}
+
+            const {ASPN_PREFIX}Allocator* {ASPN_PREFIX_LOWER}_get_allocator(void) {{
+                return &current_allocator;
+            }}
+
+            void* {ASPN_PREFIX_LOWER}_mem_alloc(size_t size) {{
+                return current_allocator.alloc(size, current_allocator.context);
+            }}
+
+            void* {ASPN_PREFIX_LOWER}_mem_calloc(size_t count, size_t size) {{
+                void* pointer;
+                if (size != 0 && count > (size_t)-1 / size) return NULL;
+                pointer = current_allocator.alloc(count * size, current_allocator.context);
+                if (pointer != NULL) memset(pointer, 0, count * size);
+                return pointer;
+            }}
+
+            void {ASPN_PREFIX_LOWER}_mem_free(void* pointer) {{
+                if (pointer != NULL) current_allocator.free(pointer, current_allocator.context);
+            }}
+
+            char* {ASPN_PREFIX_LOWER}_mem_strdup(const char* string) {{
+                size_t len;
+                char* out;
+                if (string == NULL) return NULL;
+                len = strlen(string) + 1;
+                out = (char*){ASPN_PREFIX_LOWER}_mem_alloc(len);
+                if (out != NULL) memcpy(out, string, len);
+                return out;
+            }}
+
+            void {ASPN_PREFIX_LOWER}_arena_init({ASPN_PREFIX}Arena* arena, void* buffer, size_t capacity) {{
+                arena->buffer = (unsigned char*)buffer;
+                arena->capacity = (buffer != NULL) ? capacity : 0;
+                arena->used = 0;
+                arena->high_water = 0;
+                arena->failed_allocations = 0;
+                arena->owns_buffer = false;
+            }}
+
+            {ASPN_PREFIX}Arena* {ASPN_PREFIX_LOWER}_arena_new(size_t capacity) {{
+                {ASPN_PREFIX}Arena* arena = ({ASPN_PREFIX}Arena*)malloc(sizeof({ASPN_PREFIX}Arena));
+                if (arena == NULL) return NULL;
+                {ASPN_PREFIX_LOWER}_arena_init(arena, malloc(capacity), capacity);
+                if (arena->buffer == NULL) {{
+                    free(arena);
+                    return NULL;
+                }}
+                arena->owns_buffer = true;
+                return arena;
+            }}
+
+            void {ASPN_PREFIX_LOWER}_arena_destroy({ASPN_PREFIX}Arena* arena) {{
+                if (arena == NULL) return;
+                if (arena->owns_buffer) free(arena->buffer);
+                free(arena);
+            }}
+
+            void* {ASPN_PREFIX_LOWER}_arena_alloc({ASPN_PREFIX}Arena* arena, size_t size) {{
+                size_t offset = {ASPN_PREFIX.upper()}_ALIGN_UP(arena->used);
+                if (offset < arena->used || size > arena->capacity - offset || offset > arena->capacity) {{
+                    arena->failed_allocations++;
+                    return NULL;
+                }}
+                arena->used = offset + size;
+                if (arena->used > arena->high_water) arena->high_water = arena->used;
+                return arena->buffer + offset;
+            }}
+
+            void {ASPN_PREFIX_LOWER}_arena_reset({ASPN_PREFIX}Arena* arena) {{
+                arena->used = 0;
+            }}
+
+            static void* arena_alloc_hook(size_t size, void* context) {{
+                return {ASPN_PREFIX_LOWER}_arena_alloc(({ASPN_PREFIX}Arena*)context, size);
+            }}
+
+            static void arena_free_hook(void* pointer, void* context) {{
+                /* Arena memory is only released by {ASPN_PREFIX_LOWER}_arena_reset() */
+                (void)pointer;
+                (void)context;
+            }}
+
+            {ASPN_PREFIX}Allocator {ASPN_PREFIX_LOWER}_arena_allocator({ASPN_PREFIX}Arena* arena) {{
+                {ASPN_PREFIX}Allocator allocator;
+                allocator.alloc = arena_alloc_hook;
+                allocator.free = arena_free_hook;
+                allocator.context = arena;
+                return allocator;
+            }}
+        """
+
+        self.all_source_files += [f'    \'src/{ASPN_DIR}/allocator.c\',']
+
+        output_filepath = join(self.output_folder, "allocator.h")
+        format_and_write_to_file(allocator_h, output_filepath)
+        output_filepath = join(self.output_folder, "allocator.c")
+        format_and_write_to_file(allocator_c, output_filepath)
+
+    def _generate_compare_header(self):
+        print("Generating compare.h")
+        compare_h = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            */
+
+            #pragma once
+
+            #include <stddef.h>
+            #include <stdint.h>
+            #include <string.h>
+            #ifndef __cplusplus
+            #	include <stdbool.h>
+            #endif
+
+            #ifdef __cplusplus
+            extern "C" {{
+            #endif
+
+            /* Flags of the generated _equals() functions */
+            enum {{
+                /* Treat two NaN values as equal */
+                {ASPN_PREFIX.upper()}_EQUALS_NAN_EQUAL = 1 << 0
+            }};
+
+            /* Initial value of the 64-bit FNV-1a hashes computed by the generated _hash() functions */
+            #define {ASPN_PREFIX.upper()}_HASH_INIT UINT64_C(0xcbf29ce484222325)
+            #define {ASPN_PREFIX.upper()}_HASH_PRIME UINT64_C(0x100000001b3)
+
+            static inline uint64_t {ASPN_PREFIX_LOWER}_hash_bytes(uint64_t hash, const void* data, size_t size) {{
+                const unsigned char* bytes = (const unsigned char*)data;
+                for (size_t ii = 0; ii < size; ii++) {{
+                    hash ^= bytes[ii];
+                    hash *= {ASPN_PREFIX.upper()}_HASH_PRIME;
+                }}
+                return hash;
+            }}
+
+            /* Hashes the value least significant byte first, so the hash does not depend on endianness */
+            static inline uint64_t {ASPN_PREFIX_LOWER}_hash_u64(uint64_t hash, uint64_t value) {{
+                for (int ii = 0; ii < 8; ii++) {{
+                    hash ^= (value >> (8 * ii)) & 0xff;
+                    hash *= {ASPN_PREFIX.upper()}_HASH_PRIME;
+                }}
+                return hash;
+            }}
+
+            /* Hashes -0.0 as 0.0 and every NaN alike, matching {ASPN_PREFIX.upper()}_EQUALS_NAN_EQUAL */
+            static inline uint64_t {ASPN_PREFIX_LOWER}_hash_double(uint64_t hash, double value) {{
+                uint64_t bits;
+                if (value != value) return {ASPN_PREFIX_LOWER}_hash_u64(hash, UINT64_C(0x7ff8000000000000));
+                if (value == 0.0) value = 0.0;
+                memcpy(&bits, &value, sizeof(bits));
+                return {ASPN_PREFIX_LOWER}_hash_u64(hash, bits);
+            }}
+
+            static inline bool {ASPN_PREFIX_LOWER}_double_equals(double a, double b, unsigned flags) {{
+                return a == b || ((flags & {ASPN_PREFIX.upper()}_EQUALS_NAN_EQUAL) && a != a && b != b);
+            }}
+
+            static inline bool {ASPN_PREFIX_LOWER}_float_equals(float a, float b, unsigned flags) {{
+                return a == b || ((flags & {ASPN_PREFIX.upper()}_EQUALS_NAN_EQUAL) && a != a && b != b);
+            }}
+
+            #ifdef __cplusplus
+            }}  // extern "C"
+            #endif
+        """
+
+        output_filepath = join(self.output_folder, "compare.h")
+        format_and_write_to_file(compare_h, output_filepath)
+
+    def _generate_serialize_header(self):
+        print("Generating serialize.h")
+        serialize_h = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            *
+            * Compact binary encoding of ASPN-C structs, independent of LCM and DDS. A
+            * serialized struct is a frame:
+            *
+            *  offset 0: uint16_t type tag, the {ASPN_PREFIX}MessageType of a message, or
+            *            ASPN_UNDEFINED for a type that is not a message
+            *  offset 2: uint32_t payload length in bytes
+            *  offset 6: payload
+            *
+            * Every value is little-endian. The payload holds the fields of the struct in
+            * two groups, each in declaration order:
+            *
+            *  1. Scalars, enums and fixed-size arrays and matrices of them. Integers and
+            *     floating point values keep their C size, bool is a uint8_t and enums
+            *     are int32_t. Array lengths are ordinary scalar fields, so they are
+            *     always known before the arrays they size.
+            *  2. Nested types, variable-length arrays and matrices, and strings. A
+            *     nested type is its own payload, omitted when the has_ field guarding it
+            *     is false. Arrays and matrices are their elements in row-major order. A
+            *     string is a uint32_t byte count followed by the bytes without the
+            *     terminator, or just {ASPN_PREFIX.upper()}_SERIAL_NULL_STRING for NULL.
+            *
+            * Runs of integers and floating point values are copied with a single
+            * memcpy on little-endian hosts, and byte-swapped on big-endian hosts.
+            */
+
+            #pragma once
+
+            #include <stddef.h>
+            #include <stdint.h>
+            #include <string.h>
+            #ifndef __cplusplus
+            #	include <stdbool.h>
+            #endif
+
+            #ifdef __cplusplus
+            extern "C" {{
+            #endif
+
+            /* Size of the type tag and payload length preceding every payload */
+            #define {ASPN_PREFIX.upper()}_SERIAL_HEADER_SIZE 6
+
+            /* Byte count written in place of a NULL string */
+            #define {ASPN_PREFIX.upper()}_SERIAL_NULL_STRING UINT32_C(0xFFFFFFFF)
+
+            #if defined(__BYTE_ORDER__) && defined(__ORDER_BIG_ENDIAN__) && __BYTE_ORDER__ == __ORDER_BIG_ENDIAN__
+            #	define {ASPN_PREFIX.upper()}_BIG_ENDIAN 1
+            #else
+            #	define {ASPN_PREFIX.upper()}_BIG_ENDIAN 0
+            #endif
+
+            /* The unread part of a serialized buffer */
+            typedef struct {ASPN_PREFIX}Reader {{
+                const uint8_t* cursor;
+                const uint8_t* end;
+            }} {ASPN_PREFIX}Reader;
+
+            /* Copy count elements of size bytes, reversing the bytes of each element */
+            static inline void {ASPN_PREFIX_LOWER}_swap_copy(void* dst, const void* src, size_t count, size_t size) {{
+                unsigned char* out = (unsigned char*)dst;
+                const unsigned char* in = (const unsigned char*)src;
+                for (size_t ii = 0; ii < count; ii++)
+                    for (size_t jj = 0; jj < size; jj++) out[ii * size + jj] = in[ii * size + size - 1 - jj];
+            }}
+
+            /* Write count elements of size bytes at cursor, little-endian. Returns the new cursor. */
+            static inline uint8_t* {ASPN_PREFIX_LOWER}_write_le(uint8_t* cursor, const void* src, size_t count, size_t size) {{
+                size_t bytes = count * size;
+                if (bytes == 0) return cursor;
+            #if {ASPN_PREFIX.upper()}_BIG_ENDIAN
+                if (size > 1) {{
+                    {ASPN_PREFIX_LOWER}_swap_copy(cursor, src, count, size);
+                    return cursor + bytes;
+                }}
+            #endif
+                memcpy(cursor, src, bytes);
+                return cursor + bytes;
+            }}
+
+            static inline uint8_t* {ASPN_PREFIX_LOWER}_write_zeros(uint8_t* cursor, size_t bytes) {{
+                if (bytes > 0) memset(cursor, 0, bytes);
+                return cursor + bytes;
+            }}
+
+            /**
+            * Read count little-endian elements of size bytes into dst, or skip them if
+            * dst is NULL. Returns false, without moving the reader, if the input is too
+            * short.
+            */
+            static inline bool {ASPN_PREFIX_LOWER}_read_le({ASPN_PREFIX}Reader* reader, void* dst, size_t count, size_t size) {{
+                size_t available = (size_t)(reader->end - reader->cursor);
+                if (size != 0 && count > available / size) return false;
+                if (dst != NULL && count > 0) {{
+            #if {ASPN_PREFIX.upper()}_BIG_ENDIAN
+                    if (size > 1)
+                        {ASPN_PREFIX_LOWER}_swap_copy(dst, reader->cursor, count, size);
+                    else
+            #endif
+                        memcpy(dst, reader->cursor, count * size);
+                }}
+                reader->cursor += count * size;
+                return true;
+            }}
+
+            /**
+            * Store rows * cols in count, returning false if that many elements of at
+            * least one byte each cannot be left in the input. Rejects corrupt lengths
+            * before anything is allocated for them.
+            */
+            static inline bool {ASPN_PREFIX_LOWER}_serial_count(const {ASPN_PREFIX}Reader* reader, uint64_t rows, uint64_t cols, size_t* count) {{
+                size_t available = (size_t)(reader->end - reader->cursor);
+                if (cols != 0 && rows > available / cols) return false;
+                *count = (size_t)(rows * cols);
+                return true;
+            }}
+
+            /**
+            * Read count little-endian elements of size bytes at cursor into dst. The
+            * caller guarantees the input is long enough.
+            */
+            static inline void {ASPN_PREFIX_LOWER}_load_le(void* dst, const uint8_t* cursor, size_t size) {{
+            #if {ASPN_PREFIX.upper()}_BIG_ENDIAN
+                if (size > 1) {{
+                    {ASPN_PREFIX_LOWER}_swap_copy(dst, cursor, 1, size);
+                    return;
+                }}
+            #endif
+                memcpy(dst, cursor, size);
+            }}
+
+            static inline uint8_t* {ASPN_PREFIX_LOWER}_write_serial_header(uint8_t* cursor, uint16_t type, uint32_t payload_size) {{
+                cursor = {ASPN_PREFIX_LOWER}_write_le(cursor, &type, 1, sizeof(type));
+                return {ASPN_PREFIX_LOWER}_write_le(cursor, &payload_size, 1, sizeof(payload_size));
+            }}
+
+            /**
+            * Read the frame header at the reader. Returns false if the input is shorter
+            * than the frame, otherwise limits the reader to the payload.
+            */
+            static inline bool {ASPN_PREFIX_LOWER}_read_serial_header({ASPN_PREFIX}Reader* reader, uint16_t* type, uint32_t* payload_size) {{
+                if (!{ASPN_PREFIX_LOWER}_read_le(reader, type, 1, sizeof(*type))) return false;
+                if (!{ASPN_PREFIX_LOWER}_read_le(reader, payload_size, 1, sizeof(*payload_size))) return false;
+                if (*payload_size > (size_t)(reader->end - reader->cursor)) return false;
+                reader->end = reader->cursor + *payload_size;
+                return true;
+            }}
+
+            /**
+            * Returns the type tag and the size of the whole frame at buf, without
+            * decoding it, so serialized messages can be routed and forwarded as they
+            * are. Returns false if buf holds less than a whole frame.
+            */
+            static inline bool {ASPN_PREFIX_LOWER}_peek_frame(const uint8_t* buf, size_t len, uint16_t* type, size_t* frame_size) {{
+                {ASPN_PREFIX}Reader reader;
+                uint32_t payload_size;
+                reader.cursor = buf;
+                reader.end = buf + len;
+                if (!{ASPN_PREFIX_LOWER}_read_serial_header(&reader, type, &payload_size)) return false;
+                *frame_size = {ASPN_PREFIX.upper()}_SERIAL_HEADER_SIZE + (size_t)payload_size;
+                return true;
+            }}
+
+            /**
+            * Elements of an array, matrix or string inside a serialized buffer, as
+            * returned by the accessors of the generated views. data points at count
+            * little-endian elements and is not aligned; data is NULL for NULL strings.
+            */
+            typedef struct {ASPN_PREFIX}ArrayView {{
+                const uint8_t* data;
+                size_t count;
+            }} {ASPN_PREFIX}ArrayView;
+
+            #ifdef __cplusplus
+            }}  // extern "C"
+            #endif
+        """
+
+        output_filepath = join(self.output_folder, "serialize.h")
+        format_and_write_to_file(serialize_h, output_filepath)
+
+    def _generate_pool(self):
+        print("Generating pool.h and pool.c")
+        pool_h = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            */
+
+            #pragma once
+
+            #include "common.h"
+
+            #ifdef __cplusplus
+            extern "C" {{
+            #endif
+
+            /**
+            * A per-type object pool. Released messages are kept on a freelist, together
+            * with the arrays, matrices and strings they own, and handed out again by
+            * {ASPN_PREFIX_LOWER}_pool_acquire(). Filling an acquired message with
+            * {ASPN_PREFIX_LOWER}_<type>_copy_into() then reuses those buffers, so a
+            * steady stream of same-shape messages does not touch the allocator:
+            *
+            *  {ASPN_PREFIX}Pool* pool = {ASPN_PREFIX_LOWER}_pool_create(ASPN_MEASUREMENT_IMU, 64);
+            *  for (;;) {{
+            *      {ASPN_PREFIX}MeasurementImu* imu = ({ASPN_PREFIX}MeasurementImu*){ASPN_PREFIX_LOWER}_pool_acquire(pool);
+            *      {ASPN_PREFIX_LOWER}_measurement_imu_copy_into(imu, sample);
+            *      // ... publish ...
+            *      {ASPN_PREFIX_LOWER}_pool_release(pool, (AspnBase*)imu);
+            *  }}
+            *  {ASPN_PREFIX_LOWER}_pool_destroy(pool);
+            */
+            typedef struct {ASPN_PREFIX}Pool {ASPN_PREFIX}Pool;
+
+            typedef struct {ASPN_PREFIX}PoolStats {{
+                /* Acquires served from the freelist */
+                uint64_t hits;
+                /* Acquires that had to allocate a new message */
+                uint64_t misses;
+                /* Releases that found the freelist full and freed the message */
+                uint64_t discards;
+                /* Messages currently acquired and not yet released */
+                size_t outstanding;
+                /* Largest value of outstanding since the pool was created */
+                size_t high_water;
+                /* Messages currently on the freelist */
+                size_t free_count;
+            }} {ASPN_PREFIX}PoolStats;
+
+            /**
+            * Create a pool for messages of the given type that keeps at most capacity
+            * released messages. The pool must only be used by one thread at a time.
+            * Returns NULL if the type is unknown (see {ASPN_PREFIX_LOWER}_register_message_type())
+            * or allocation fails.
+            */
+            {ASPN_PREFIX}Pool* {ASPN_NULLABLE_MACRO} {ASPN_PREFIX_LOWER}_pool_create({ASPN_PREFIX}MessageType type, size_t capacity);
+
+            /* Same as {ASPN_PREFIX_LOWER}_pool_create(), but the pool may be shared between threads. */
+            {ASPN_PREFIX}Pool* {ASPN_NULLABLE_MACRO} {ASPN_PREFIX_LOWER}_pool_create_thread_safe({ASPN_PREFIX}MessageType type, size_t capacity);
+
+            /**
+            * Free the pool and every message on its freelist. Messages still acquired
+            * from the pool stay valid and must be released with {ASPN_PREFIX_LOWER}_free().
+            */
+            void {ASPN_PREFIX_LOWER}_pool_destroy({ASPN_PREFIX}Pool* {ASPN_NULLABLE_MACRO} pool);
+
+            /**
+            * Returns a message of the pool's type, or NULL if allocation fails. A message
+            * taken from the freelist still holds the contents of its previous use; a newly
+            * allocated one is zero-initialized. Either way its header's message_type is set
+            * and it can be filled with {ASPN_PREFIX_LOWER}_<type>_copy_into().
+            */
+            AspnBase* {ASPN_NULLABLE_MACRO} {ASPN_PREFIX_LOWER}_pool_acquire({ASPN_PREFIX}Pool* pool);
+
+            /**
+            * Return a message to the pool. It must have been created by
+            * {ASPN_PREFIX_LOWER}_pool_acquire() or by the regular {ASPN_PREFIX_LOWER}_<type>_new() or
+            * _copy() functions, never by the _contiguous() ones. If the freelist is full,
+            * the message is freed. Messages of another type are freed with {ASPN_PREFIX_LOWER}_free().
+            */
+            void {ASPN_PREFIX_LOWER}_pool_release({ASPN_PREFIX}Pool* pool, AspnBase* {ASPN_NULLABLE_MACRO} message);
+
+            /* Copy the current statistics of the pool to stats. */
+            void {ASPN_PREFIX_LOWER}_pool_get_stats({ASPN_PREFIX}Pool* pool, {ASPN_PREFIX}PoolStats* stats);
+
+            #ifdef __cplusplus
+            }}  // extern "C"
+            #endif
+        """
+
+        pool_c = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            */
+
+            #include "pool.h"
+            #include "TypeHeader.h"
+
+            #ifdef _WIN32
+            #	include <windows.h>
+            typedef SRWLOCK PoolLock;
+            #	define POOL_LOCK_INIT(lock) InitializeSRWLock(lock)
+            #	define POOL_LOCK(lock) AcquireSRWLockExclusive(lock)
+            #	define POOL_UNLOCK(lock) ReleaseSRWLockExclusive(lock)
+            #	define POOL_LOCK_DESTROY(lock) ((void)(lock))
+            #else
+            #	include <pthread.h>
+            typedef pthread_mutex_t PoolLock;
+            #	define POOL_LOCK_INIT(lock) pthread_mutex_init(lock, NULL)
+            #	define POOL_LOCK(lock) pthread_mutex_lock(lock)
+            #	define POOL_UNLOCK(lock) pthread_mutex_unlock(lock)
+            #	define POOL_LOCK_DESTROY(lock) pthread_mutex_destroy(lock)
+            #endif
+
+            struct {ASPN_PREFIX}Pool {{
+                const {ASPN_PREFIX}MessageTypeInfo* info;
+                AspnBase** free_list;
+                size_t capacity;
+                {ASPN_PREFIX}PoolStats stats;
+                bool thread_safe;
+                PoolLock lock;
+            }};
+
+            static {ASPN_PREFIX}Pool* pool_create({ASPN_PREFIX}MessageType type, size_t capacity, bool thread_safe) {{
+                const {ASPN_PREFIX}MessageTypeInfo* info = {ASPN_PREFIX_LOWER}_message_type_info(type);
+                {ASPN_PREFIX}Pool* pool;
+                if (info == NULL || info->size == 0 || info->free == NULL) return NULL;
+                pool = ({ASPN_PREFIX}Pool*)calloc(1, sizeof({ASPN_PREFIX}Pool));
+                if (pool == NULL) return NULL;
+                pool->free_list = (AspnBase**)calloc(capacity > 0 ? capacity : 1, sizeof(AspnBase*));
+                if (pool->free_list == NULL) {{
+                    free(pool);
+                    return NULL;
+                }}
+                pool->info = info;
+                pool->capacity = capacity;
+                pool->thread_safe = thread_safe;
+                if (thread_safe) POOL_LOCK_INIT(&pool->lock);
+                return pool;
+            }}
+
+            {ASPN_PREFIX}Pool* {ASPN_PREFIX_LOWER}_pool_create({ASPN_PREFIX}MessageType type, size_t capacity) {{
+                return pool_create(type, capacity, false);
+            }}
+
+            {ASPN_PREFIX}Pool* {ASPN_PREFIX_LOWER}_pool_create_thread_safe({ASPN_PREFIX}MessageType type, size_t capacity) {{
+                return pool_create(type, capacity, true);
+            }}
+
+            void {ASPN_PREFIX_LOWER}_pool_destroy({ASPN_PREFIX}Pool* pool) {{
+                if (pool == NULL) return;
+                for (size_t ii = 0; ii < pool->stats.free_count; ii++) pool->info->free(pool->free_list[ii]);
+                if (pool->thread_safe) POOL_LOCK_DESTROY(&pool->lock);
+                free(pool->free_list);
+                free(pool);
+            }}
+
+            AspnBase* {ASPN_PREFIX_LOWER}_pool_acquire({ASPN_PREFIX}Pool* pool) {{
+                AspnBase* message = NULL;
+                if (pool->thread_safe) POOL_LOCK(&pool->lock);
+                if (pool->stats.free_count > 0) {{
+                    message = pool->free_list[--pool->stats.free_count];
+                    pool->stats.hits++;
+                }} else {{
+                    pool->stats.misses++;
+                }}
+                pool->stats.outstanding++;
+                if (pool->stats.outstanding > pool->stats.high_water)
+                    pool->stats.high_water = pool->stats.outstanding;
+                if (pool->thread_safe) POOL_UNLOCK(&pool->lock);
+
+                if (message == NULL) {{
+                    /* Allocate outside of the lock */
+                    message = (AspnBase*){ASPN_PREFIX_LOWER}_mem_calloc(1, pool->info->size);
+                    if (message == NULL) {{
+                        if (pool->thread_safe) POOL_LOCK(&pool->lock);
+                        pool->stats.outstanding--;
+                        if (pool->thread_safe) POOL_UNLOCK(&pool->lock);
+                        return NULL;
+                    }}
+                }}
+                message->message_type = pool->info->type;
+                return message;
+            }}
+
+            void {ASPN_PREFIX_LOWER}_pool_release({ASPN_PREFIX}Pool* pool, AspnBase* message) {{
+                bool kept = false;
+                if (message == NULL) return;
+                if (message->message_type != pool->info->type) {{
+                    {ASPN_PREFIX_LOWER}_free(message);
+                    return;
+                }}
+                if (pool->thread_safe) POOL_LOCK(&pool->lock);
+                if (pool->stats.outstanding > 0) pool->stats.outstanding--;
+                if (pool->stats.free_count < pool->capacity) {{
+                    pool->free_list[pool->stats.free_count++] = message;
+                    kept = true;
+                }} else {{
+                    pool->stats.discards++;
+                }}
+                if (pool->thread_safe) POOL_UNLOCK(&pool->lock);
+                if (!kept) pool->info->free(message);
+            }}
+
+            void {ASPN_PREFIX_LOWER}_pool_get_stats({ASPN_PREFIX}Pool* pool, {ASPN_PREFIX}PoolStats* stats) {{
+                if (pool->thread_safe) POOL_LOCK(&pool->lock);
+                *stats = pool->stats;
+                if (pool->thread_safe) POOL_UNLOCK(&pool->lock);
+            }}
+        """
+
+        test_pool_c = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            */
+
+            #include <stdio.h>
+            #include <string.h>
+
+            #include <{ASPN_DIR}/TypeHeader.h>
+            #include <{ASPN_DIR}/allocator.h>
+            #include <{ASPN_DIR}/pool.h>
+
+            #ifdef _WIN32
+            #	include <windows.h>
+            #else
+            #	include <pthread.h>
+            #endif
+
+            #define CHECK(condition)                                                 \\
+                do {{                                                                 \\
+                    if (!(condition)) {{                                             \\
+                        fprintf(stderr, "%s:%d: CHECK(%s) failed\\n", __FILE__, __LINE__, #condition); \\
+                        return 1;                                                   \\
+                    }}                                                               \\
+                }} while (0)
+
+            #define TEST_TYPE (({ASPN_PREFIX}MessageType)ASPN_EXTENDED_BEGIN)
+            #define OTHER_TYPE (({ASPN_PREFIX}MessageType)(ASPN_EXTENDED_BEGIN + 1))
+            #define THREAD_TYPE (({ASPN_PREFIX}MessageType)(ASPN_EXTENDED_BEGIN + 2))
+            #define UNKNOWN_TYPE (({ASPN_PREFIX}MessageType)(ASPN_EXTENDED_BEGIN + 3))
+
+            #define NUM_THREADS 8
+            #define NUM_ROUNDS 10000
+            #define PER_ROUND 4
+            #define THREAD_CAPACITY 16
+
+            /* Minimal messages, registered as extensions so the test does not depend on
+            * the messages of the ICD. */
+            typedef struct {{
+                AspnBase header;
+                size_t payload;
+            }} TestMessage;
+
+            /* Number of messages freed by count_free(), only used single-threaded */
+            static size_t num_freed = 0;
+
+            static void count_free(void* pointer) {{
+                num_freed++;
+                {ASPN_PREFIX_LOWER}_mem_free(pointer);
+            }}
+
+            static bool register_type({ASPN_PREFIX}MessageType type, const char* name, void (*free_function)(void*)) {{
+                {ASPN_PREFIX}MessageTypeInfo info = {{0}};
+                info.type = type;
+                info.name = name;
+                info.size = sizeof(TestMessage);
+                info.time_offset = {ASPN_PREFIX.upper()}_NO_TIME_OFFSET;
+                info.free = free_function;
+                return {ASPN_PREFIX_LOWER}_register_message_type(&info);
+            }}
+
+            static int test_single_thread(void) {{
+                {ASPN_PREFIX}Pool* pool = {ASPN_PREFIX_LOWER}_pool_create(TEST_TYPE, 2);
+                {ASPN_PREFIX}PoolStats stats, before;
+                AspnBase* messages[3];
+                TestMessage* other;
+
+                CHECK(pool != NULL);
+                CHECK({ASPN_PREFIX_LOWER}_pool_create(UNKNOWN_TYPE, 2) == NULL);
+
+                /* An empty pool allocates, zero-initialized */
+                for (size_t ii = 0; ii < 3; ii++) {{
+                    messages[ii] = {ASPN_PREFIX_LOWER}_pool_acquire(pool);
+                    CHECK(messages[ii] != NULL);
+                    CHECK(messages[ii]->message_type == TEST_TYPE);
+                    CHECK(((TestMessage*)messages[ii])->payload == 0);
+                    ((TestMessage*)messages[ii])->payload = ii + 1;
+                }}
+                {ASPN_PREFIX_LOWER}_pool_get_stats(pool, &stats);
+                CHECK(stats.hits == 0 && stats.misses == 3 && stats.discards == 0);
+                CHECK(stats.outstanding == 3 && stats.high_water == 3 && stats.free_count == 0);
+
+                /* The third release finds the freelist full */
+                for (size_t ii = 0; ii < 3; ii++) {ASPN_PREFIX_LOWER}_pool_release(pool, messages[ii]);
+                {ASPN_PREFIX_LOWER}_pool_get_stats(pool, &stats);
+                CHECK(stats.discards == 1 && num_freed == 1);
+                CHECK(stats.outstanding == 0 && stats.high_water == 3 && stats.free_count == 2);
+
+                /* Acquires are served from the freelist, with their previous contents */
+                messages[0] = {ASPN_PREFIX_LOWER}_pool_acquire(pool);
+                messages[1] = {ASPN_PREFIX_LOWER}_pool_acquire(pool);
+                CHECK(messages[0] != NULL && messages[1] != NULL);
+                CHECK(((TestMessage*)messages[0])->payload == 2);
+                CHECK(((TestMessage*)messages[1])->payload == 1);
+                {ASPN_PREFIX_LOWER}_pool_get_stats(pool, &stats);
+                CHECK(stats.hits == 2 && stats.misses == 3);
+                CHECK(stats.outstanding == 2 && stats.high_water == 3 && stats.free_count == 0);
+                {ASPN_PREFIX_LOWER}_pool_release(pool, messages[0]);
+                {ASPN_PREFIX_LOWER}_pool_release(pool, messages[1]);
+
+                /* NULL and messages of another type leave the pool untouched */
+                {ASPN_PREFIX_LOWER}_pool_get_stats(pool, &before);
+                other = (TestMessage*){ASPN_PREFIX_LOWER}_mem_calloc(1, sizeof(TestMessage));
+                CHECK(other != NULL);
+                other->header.message_type = OTHER_TYPE;
+                {ASPN_PREFIX_LOWER}_pool_release(pool, NULL);
+                {ASPN_PREFIX_LOWER}_pool_release(pool, &other->header);
+                CHECK(num_freed == 2);
+                {ASPN_PREFIX_LOWER}_pool_get_stats(pool, &stats);
+                CHECK(memcmp(&stats, &before, sizeof(stats)) == 0);
+
+                /* Destroying the pool frees its freelist */
+                {ASPN_PREFIX_LOWER}_pool_destroy(pool);
+                CHECK(num_freed == 4);
+                return 0;
+            }}
+
+            #ifdef _WIN32
+            static DWORD WINAPI thread_main(LPVOID argument) {{
+            #else
+            static void* thread_main(void* argument) {{
+            #endif
+                {ASPN_PREFIX}Pool* pool = ({ASPN_PREFIX}Pool*)argument;
+                AspnBase* messages[PER_ROUND];
+                for (size_t round = 0; round < NUM_ROUNDS; round++) {{
+                    for (size_t ii = 0; ii < PER_ROUND; ii++) {{
+                        messages[ii] = {ASPN_PREFIX_LOWER}_pool_acquire(pool);
+                        if (messages[ii] != NULL) ((TestMessage*)messages[ii])->payload = round;
+                    }}
+                    for (size_t ii = 0; ii < PER_ROUND; ii++) {ASPN_PREFIX_LOWER}_pool_release(pool, messages[ii]);
+                }}
+                return 0;
+            }}
+
+            static int test_thread_safe(void) {{
+                {ASPN_PREFIX}Pool* pool = {ASPN_PREFIX_LOWER}_pool_create_thread_safe(THREAD_TYPE, THREAD_CAPACITY);
+                {ASPN_PREFIX}PoolStats stats;
+            #ifdef _WIN32
+                HANDLE threads[NUM_THREADS];
+            #else
+                pthread_t threads[NUM_THREADS];
+            #endif
+
+                CHECK(pool != NULL);
+                for (size_t ii = 0; ii < NUM_THREADS; ii++) {{
+            #ifdef _WIN32
+                    threads[ii] = CreateThread(NULL, 0, thread_main, pool, 0, NULL);
+                    CHECK(threads[ii] != NULL);
+            #else
+                    CHECK(pthread_create(&threads[ii], NULL, thread_main, pool) == 0);
+            #endif
+                }}
+                for (size_t ii = 0; ii < NUM_THREADS; ii++) {{
+            #ifdef _WIN32
+                    WaitForSingleObject(threads[ii], INFINITE);
+                    CloseHandle(threads[ii]);
+            #else
+                    pthread_join(threads[ii], NULL);
+            #endif
+                }}
+
+                /* Every allocated message ended up either on the freelist or discarded */
+                {ASPN_PREFIX_LOWER}_pool_get_stats(pool, &stats);
+                CHECK(stats.hits + stats.misses == (uint64_t)NUM_THREADS * NUM_ROUNDS * PER_ROUND);
+                CHECK(stats.misses == stats.free_count + stats.discards);
+                CHECK(stats.outstanding == 0 && stats.free_count <= THREAD_CAPACITY);
+                CHECK(stats.high_water >= PER_ROUND && stats.high_water <= NUM_THREADS * PER_ROUND);
+                {ASPN_PREFIX_LOWER}_pool_destroy(pool);
+                return 0;
+            }}
+
+            int main(void) {{
+                if (!register_type(TEST_TYPE, "TEST_MESSAGE", count_free)) return 1;
+                if (!register_type(OTHER_TYPE, "OTHER_MESSAGE", count_free)) return 1;
+                if (!register_type(THREAD_TYPE, "THREAD_MESSAGE", {ASPN_PREFIX_LOWER}_mem_free)) return 1;
+                if (test_single_thread() != 0) return 1;
+                if (test_thread_safe() != 0) return 1;
+                printf("test_pool passed\\n");
+                return 0;
+            }}
+        """
+
+        self.all_source_files += [f'    \'src/{ASPN_DIR}/pool.c\',']
+        self.all_tests += ['test_pool']
+
+        output_filepath = join(self.output_folder, "pool.h")
+        format_and_write_to_file(pool_h, output_filepath)
+        output_filepath = join(self.output_folder, "pool.c")
+        format_and_write_to_file(pool_c, output_filepath)
+        output_filepath = join(self.test_folder, "test_pool.c")
+        format_and_write_to_file(test_pool_c, output_filepath)
+
+    def _generate_ring(self):
+        print("Generating ring.h and ring.c")
+        ring_h = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            */
+
+            #pragma once
+
+            #include "common.h"
+
+            #ifdef __cplusplus
+            extern "C" {{
+            #endif
+
+            /**
+            * A bounded lock-free ring of message pointers for handing messages from
+            * driver threads to a consumer thread without mutexes. Ownership of a
+            * message moves into the ring on a successful push and out of it on pop.
+            *
+            * Any number of threads may pop. Only one thread may push unless the ring
+            * was created with {ASPN_PREFIX.upper()}_RING_MULTI_PRODUCER.
+            */
+            typedef struct {ASPN_PREFIX}Ring {ASPN_PREFIX}Ring;
+
+            /* Flags for {ASPN_PREFIX_LOWER}_ring_create() */
+            enum {{
+                /* Allow pushes from several threads at once */
+                {ASPN_PREFIX.upper()}_RING_MULTI_PRODUCER = 1 << 0,
+                /* When full, free the oldest message instead of rejecting the push */
+                {ASPN_PREFIX.upper()}_RING_DROP_OLDEST = 1 << 1
+            }};
+
+            typedef struct {ASPN_PREFIX}RingStats {{
+                /* Messages accepted by push */
+                uint64_t pushed;
+                /* Messages returned by pop */
+                uint64_t popped;
+                /* Pushes rejected because the ring was full */
+                uint64_t dropped;
+                /* Oldest messages freed to make room, with {ASPN_PREFIX.upper()}_RING_DROP_OLDEST */
+                uint64_t evicted;
+                /* Sum of {ASPN_PREFIX_LOWER}_message_size() of the pushed messages */
+                uint64_t bytes_pushed;
+                /* Messages currently in the ring */
+                size_t occupancy;
+                /* Largest occupancy seen by a push */
+                size_t high_water;
+                size_t capacity;
+            }} {ASPN_PREFIX}RingStats;
+
+            /**
+            * Create a ring holding up to capacity messages, rounded up to a power of
+            * two. flags is a combination of the {ASPN_PREFIX.upper()}_RING_* flags. Returns NULL if
+            * capacity is 0 or allocation fails.
+            */
+            {ASPN_PREFIX}Ring* {ASPN_NULLABLE_MACRO} {ASPN_PREFIX_LOWER}_ring_create(size_t capacity, unsigned flags);
+
+            /**
+            * Free the ring and, with {ASPN_PREFIX_LOWER}_free(), every message still in it. No other
+            * thread may use the ring at this point.
+            */
+            void {ASPN_PREFIX_LOWER}_ring_destroy({ASPN_PREFIX}Ring* {ASPN_NULLABLE_MACRO} ring);
+
+            /**
+            * Push a message. Returns false if message is NULL or the ring is full (and
+            * not drop-oldest), in which case the caller still owns the message.
+            */
+            bool {ASPN_PREFIX_LOWER}_ring_push({ASPN_PREFIX}Ring* ring, AspnBase* {ASPN_NULLABLE_MACRO} message);
+
+            /* Pop the oldest message, or return NULL if the ring is empty. */
+            AspnBase* {ASPN_NULLABLE_MACRO} {ASPN_PREFIX_LOWER}_ring_pop({ASPN_PREFIX}Ring* ring);
+
+            /**
+            * Push messages in order until one does not fit. Returns the number
+            * pushed; the caller keeps ownership of the rest.
+            */
+            size_t {ASPN_PREFIX_LOWER}_ring_push_batch({ASPN_PREFIX}Ring* ring, AspnBase* const* messages, size_t count);
+
+            /* Pop up to max_count messages into messages and return how many were popped. */
+            size_t {ASPN_PREFIX_LOWER}_ring_pop_batch({ASPN_PREFIX}Ring* ring, AspnBase** messages, size_t max_count);
+
+            /* Approximate number of messages in the ring. */
+            size_t {ASPN_PREFIX_LOWER}_ring_occupancy(const {ASPN_PREFIX}Ring* ring);
+
+            /* Copy the counters of the ring to stats. The counters are read without a common snapshot. */
+            void {ASPN_PREFIX_LOWER}_ring_get_stats(const {ASPN_PREFIX}Ring* ring, {ASPN_PREFIX}RingStats* stats);
+
+            #ifdef __cplusplus
+            }}  // extern "C"
+            #endif
+        """
+
+        ring_c = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            */
+
+            #include <stdint.h>
+            #include <stdlib.h>
+
+            #include "ring.h"
+            #include "TypeHeader.h"
+
+            /*
+            * Bounded queue after Dmitry Vyukov: every cell carries a sequence number
+            * telling producers and consumers whose turn it is, so a push or pop only
+            * contends on its own position counter.
+            */
+
+            #if defined(__GNUC__) || defined(__clang__)
+            #	define RING_LOAD(p) __atomic_load_n(p, __ATOMIC_ACQUIRE)
+            #	define RING_LOAD_RELAXED(p) __atomic_load_n(p, __ATOMIC_RELAXED)
+            #	define RING_STORE(p, v) __atomic_store_n(p, v, __ATOMIC_RELEASE)
+            #	define RING_STORE_RELAXED(p, v) __atomic_store_n(p, v, __ATOMIC_RELAXED)
+            #	define RING_CAS(p, expected, desired) \\
+            		__atomic_compare_exchange_n(p, expected, desired, true, __ATOMIC_RELAXED, __ATOMIC_RELAXED)
+            #	define RING_ADD(p, v) ((void)__atomic_fetch_add(p, v, __ATOMIC_RELAXED))
+            #elif defined(_WIN64)
+            #	include <windows.h>
+            #	define RING_LOAD(p) ((size_t)InterlockedOr64((volatile LONG64*)(p), 0))
+            #	define RING_LOAD_RELAXED(p) RING_LOAD(p)
+            #	define RING_STORE(p, v) ((void)InterlockedExchange64((volatile LONG64*)(p), (LONG64)(v)))
+            #	define RING_STORE_RELAXED(p, v) RING_STORE(p, v)
+            static bool ring_cas(volatile size_t* p, size_t* expected, size_t desired) {{
+                size_t seen = (size_t)InterlockedCompareExchange64((volatile LONG64*)p, (LONG64)desired, (LONG64)*expected);
+                if (seen == *expected) return true;
+                *expected = seen;
+                return false;
+            }}
+            #	define RING_CAS(p, expected, desired) ring_cas(p, expected, desired)
+            #	define RING_ADD(p, v) ((void)InterlockedExchangeAdd64((volatile LONG64*)(p), (LONG64)(v)))
+            #else
+            #	error "{ASPN_PREFIX_LOWER}_ring needs GCC/Clang atomic builtins or a 64-bit Windows target"
+            #endif
+
+            #define RING_CACHE_LINE 64
+
+            typedef struct {{
+                size_t sequence;
+                AspnBase* message;
+            }} RingCell;
+
+            struct {ASPN_PREFIX}Ring {{
+                RingCell* cells;
+                size_t mask;
+                unsigned flags;
+                char pad0[RING_CACHE_LINE];
+                size_t enqueue_pos;
+                char pad1[RING_CACHE_LINE - sizeof(size_t)];
+                size_t dequeue_pos;
+                char pad2[RING_CACHE_LINE - sizeof(size_t)];
+                /* Written by producers */
+                uint64_t pushed;
+                uint64_t dropped;
+                uint64_t evicted;
+                uint64_t bytes_pushed;
+                size_t high_water;
+                char pad3[RING_CACHE_LINE];
+                /* Written by consumers */
+                uint64_t popped;
+            }};
+
+            {ASPN_PREFIX}Ring* {ASPN_PREFIX_LOWER}_ring_create(size_t capacity, unsigned flags) {{
+                {ASPN_PREFIX}Ring* ring;
+                size_t size = 1;
+                if (capacity == 0) return NULL;
+                while (size < capacity) {{
+                    if (size > SIZE_MAX / 2 / sizeof(RingCell)) return NULL;
+                    size *= 2;
+                }}
+                ring = ({ASPN_PREFIX}Ring*)calloc(1, sizeof({ASPN_PREFIX}Ring));
+                if (ring == NULL) return NULL;
+                ring->cells = (RingCell*)calloc(size, sizeof(RingCell));
+                if (ring->cells == NULL) {{
+                    free(ring);
+                    return NULL;
+                }}
+                for (size_t ii = 0; ii < size; ii++) ring->cells[ii].sequence = ii;
+                ring->mask = size - 1;
+                ring->flags = flags;
+                return ring;
+            }}
+
+            void {ASPN_PREFIX_LOWER}_ring_destroy({ASPN_PREFIX}Ring* ring) {{
+                AspnBase* message;
+                if (ring == NULL) return;
+                while ((message = {ASPN_PREFIX_LOWER}_ring_pop(ring)) != NULL) {ASPN_PREFIX_LOWER}_free(message);
+                free(ring->cells);
+                free(ring);
+            }}
+
+            static bool ring_try_push({ASPN_PREFIX}Ring* ring, AspnBase* message) {{
+                size_t pos = RING_LOAD_RELAXED(&ring->enqueue_pos);
+                RingCell* cell;
+                for (;;) {{
+                    cell = &ring->cells[pos & ring->mask];
+                    intptr_t diff = (intptr_t)RING_LOAD(&cell->sequence) - (intptr_t)pos;
+                    if (diff == 0) {{
+                        if (!(ring->flags & {ASPN_PREFIX.upper()}_RING_MULTI_PRODUCER)) {{
+                            RING_STORE_RELAXED(&ring->enqueue_pos, pos + 1);
+                            break;
+                        }}
+                        if (RING_CAS(&ring->enqueue_pos, &pos, pos + 1)) break;
+                    }} else if (diff < 0) {{
+                        return false;
+                    }} else {{
+                        pos = RING_LOAD_RELAXED(&ring->enqueue_pos);
+                    }}
+                }}
+                cell->message = message;
+                RING_STORE(&cell->sequence, pos + 1);
+                return true;
+            }}
+
+            static AspnBase* ring_try_pop({ASPN_PREFIX}Ring* ring) {{
+                size_t pos = RING_LOAD_RELAXED(&ring->dequeue_pos);
+                RingCell* cell;
+                AspnBase* message;
+                for (;;) {{
+                    cell = &ring->cells[pos & ring->mask];
+                    intptr_t diff = (intptr_t)RING_LOAD(&cell->sequence) - (intptr_t)(pos + 1);
+                    if (diff == 0) {{
+                        if (RING_CAS(&ring->dequeue_pos, &pos, pos + 1)) break;
+                    }} else if (diff < 0) {{
+                        return NULL;
+                    }} else {{
+                        pos = RING_LOAD_RELAXED(&ring->dequeue_pos);
+                    }}
+                }}
+                message = cell->message;
+                RING_STORE(&cell->sequence, pos + ring->mask + 1);
+                return message;
+            }}
+
+            bool {ASPN_PREFIX_LOWER}_ring_push({ASPN_PREFIX}Ring* ring, AspnBase* message) {{
+                uint64_t bytes;
+                size_t occupancy;
+                size_t high_water;
+                if (message == NULL) return false;
+                /* The message belongs to a consumer as soon as it is pushed */
+                bytes = (uint64_t){ASPN_PREFIX_LOWER}_message_size(message->message_type);
+                while (!ring_try_push(ring, message)) {{
+                    AspnBase* oldest;
+                    if (!(ring->flags & {ASPN_PREFIX.upper()}_RING_DROP_OLDEST)) {{
+                        RING_ADD(&ring->dropped, 1);
+                        return false;
+                    }}
+                    /* An empty pop means a consumer made room in the meantime */
+                    oldest = ring_try_pop(ring);
+                    if (oldest != NULL) {{
+                        RING_ADD(&ring->evicted, 1);
+                        {ASPN_PREFIX_LOWER}_free(oldest);
+                    }}
+                }}
+                RING_ADD(&ring->pushed, 1);
+                RING_ADD(&ring->bytes_pushed, bytes);
+
+                occupancy = {ASPN_PREFIX_LOWER}_ring_occupancy(ring);
+                high_water = RING_LOAD_RELAXED(&ring->high_water);
+                while (occupancy > high_water && !RING_CAS(&ring->high_water, &high_water, occupancy)) {{
+                }}
+                return true;
+            }}
+
+            AspnBase* {ASPN_PREFIX_LOWER}_ring_pop({ASPN_PREFIX}Ring* ring) {{
+                AspnBase* message = ring_try_pop(ring);
+                if (message != NULL) RING_ADD(&ring->popped, 1);
+                return message;
+            }}
+
+            size_t {ASPN_PREFIX_LOWER}_ring_push_batch({ASPN_PREFIX}Ring* ring, AspnBase* const* messages, size_t count) {{
+                size_t pushed = 0;
+                while (pushed < count && {ASPN_PREFIX_LOWER}_ring_push(ring, messages[pushed])) pushed++;
+                return pushed;
+            }}
+
+            size_t {ASPN_PREFIX_LOWER}_ring_pop_batch({ASPN_PREFIX}Ring* ring, AspnBase** messages, size_t max_count) {{
+                size_t popped = 0;
+                while (popped < max_count && (messages[popped] = ring_try_pop(ring)) != NULL) popped++;
+                if (popped > 0) RING_ADD(&ring->popped, popped);
+                return popped;
+            }}
+
+            size_t {ASPN_PREFIX_LOWER}_ring_occupancy(const {ASPN_PREFIX}Ring* ring) {{
+                size_t dequeue_pos = RING_LOAD_RELAXED(&ring->dequeue_pos);
+                size_t enqueue_pos = RING_LOAD_RELAXED(&ring->enqueue_pos);
+                size_t occupancy = enqueue_pos - dequeue_pos;
+                /* The two positions are not read atomically together */
+                if (occupancy > ring->mask + 1) return enqueue_pos < dequeue_pos ? 0 : ring->mask + 1;
+                return occupancy;
+            }}
+
+            void {ASPN_PREFIX_LOWER}_ring_get_stats(const {ASPN_PREFIX}Ring* ring, {ASPN_PREFIX}RingStats* stats) {{
+                stats->pushed = RING_LOAD_RELAXED(&ring->pushed);
+                stats->popped = RING_LOAD_RELAXED(&ring->popped);
+                stats->dropped = RING_LOAD_RELAXED(&ring->dropped);
+                stats->evicted = RING_LOAD_RELAXED(&ring->evicted);
+                stats->bytes_pushed = RING_LOAD_RELAXED(&ring->bytes_pushed);
+                stats->occupancy = {ASPN_PREFIX_LOWER}_ring_occupancy(ring);
+                stats->high_water = RING_LOAD_RELAXED(&ring->high_water);
+                stats->capacity = ring->mask + 1;
+            }}
+        """
+
+        test_ring_c = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            */
+
+            #include <stdio.h>
+
+            #include <{ASPN_DIR}/TypeHeader.h>
+            #include <{ASPN_DIR}/allocator.h>
+            #include <{ASPN_DIR}/ring.h>
+
+            #ifdef _WIN32
+            #	include <windows.h>
+            #else
+            #	include <pthread.h>
+            #endif
+
+            #define CHECK(condition)                                                 \\
+                do {{                                                                 \\
+                    if (!(condition)) {{                                             \\
+                        fprintf(stderr, "%s:%d: CHECK(%s) failed\\n", __FILE__, __LINE__, #condition); \\
+                        return 1;                                                   \\
+                    }}                                                               \\
+                }} while (0)
+
+            #define TEST_TYPE (({ASPN_PREFIX}MessageType)ASPN_EXTENDED_BEGIN)
+
+            #define NUM_PRODUCERS 4
+            #define NUM_CONSUMERS 4
+            #define PER_PRODUCER 50000
+            #define THREAD_CAPACITY 64
+            /* Marks the messages telling the consumers to stop */
+            #define STOP_PRODUCER NUM_PRODUCERS
+
+            /* A minimal message, registered as an extension so the test does not depend
+            * on the messages of the ICD. */
+            typedef struct {{
+                AspnBase header;
+                size_t producer;
+                size_t sequence;
+            }} TestMessage;
+
+            static AspnBase* new_message(size_t producer, size_t sequence) {{
+                TestMessage* message = (TestMessage*){ASPN_PREFIX_LOWER}_mem_calloc(1, sizeof(TestMessage));
+                if (message == NULL) return NULL;
+                message->header.message_type = TEST_TYPE;
+                message->producer = producer;
+                message->sequence = sequence;
+                return &message->header;
+            }}
+
+            static int test_single_thread(void) {{
+                {ASPN_PREFIX}Ring* ring = {ASPN_PREFIX_LOWER}_ring_create(3, 0);
+                {ASPN_PREFIX}RingStats stats;
+                AspnBase* messages[6];
+                AspnBase* popped[6];
+
+                CHECK(ring != NULL);
+                CHECK({ASPN_PREFIX_LOWER}_ring_create(0, 0) == NULL);
+                for (size_t ii = 0; ii < 6; ii++) {{
+                    messages[ii] = new_message(0, ii);
+                    CHECK(messages[ii] != NULL);
+                }}
+
+                /* NULL is rejected without touching the counters */
+                CHECK(!{ASPN_PREFIX_LOWER}_ring_push(ring, NULL));
+                {ASPN_PREFIX_LOWER}_ring_get_stats(ring, &stats);
+                CHECK(stats.pushed == 0 && stats.dropped == 0 && stats.capacity == 4);
+
+                /* A full ring rejects pushes and the caller keeps the message */
+                CHECK({ASPN_PREFIX_LOWER}_ring_push_batch(ring, messages, 6) == 4);
+                CHECK(!{ASPN_PREFIX_LOWER}_ring_push(ring, messages[5]));
+                {ASPN_PREFIX_LOWER}_ring_get_stats(ring, &stats);
+                CHECK(stats.pushed == 4 && stats.dropped == 2 && stats.evicted == 0);
+                CHECK(stats.occupancy == 4 && stats.high_water == 4);
+                CHECK(stats.bytes_pushed == 4 * sizeof(TestMessage));
+                CHECK({ASPN_PREFIX_LOWER}_ring_pop_batch(ring, popped, 6) == 4);
+                CHECK({ASPN_PREFIX_LOWER}_ring_pop(ring) == NULL);
+                for (size_t ii = 0; ii < 4; ii++) CHECK(popped[ii] == messages[ii]);
+                {ASPN_PREFIX_LOWER}_ring_get_stats(ring, &stats);
+                CHECK(stats.popped == 4 && stats.occupancy == 0);
+                {ASPN_PREFIX_LOWER}_ring_destroy(ring);
+
+                /* A drop-oldest ring frees the oldest messages to make room */
+                ring = {ASPN_PREFIX_LOWER}_ring_create(4, {ASPN_PREFIX.upper()}_RING_DROP_OLDEST);
+                CHECK(ring != NULL);
+                for (size_t ii = 0; ii < 4; ii++) {ASPN_PREFIX_LOWER}_ring_push(ring, popped[ii]);
+                CHECK({ASPN_PREFIX_LOWER}_ring_push_batch(ring, messages + 4, 2) == 2);
+                {ASPN_PREFIX_LOWER}_ring_get_stats(ring, &stats);
+                CHECK(stats.pushed == 6 && stats.dropped == 0 && stats.evicted == 2);
+                CHECK(stats.pushed == stats.popped + stats.evicted + stats.occupancy);
+                CHECK({ASPN_PREFIX_LOWER}_ring_pop(ring) == messages[2]);
+                {ASPN_PREFIX_LOWER}_free(messages[2]);
+
+                /* Destroying the ring frees the messages still in it */
+                {ASPN_PREFIX_LOWER}_ring_destroy(ring);
+                return 0;
+            }}
+
+            typedef struct {{
+                {ASPN_PREFIX}Ring* ring;
+                size_t index;
+                /* Filled in by the thread */
+                uint64_t attempts;
+                uint64_t dropped;
+                uint64_t consumed;
+                bool in_order;
+            }} ThreadState;
+
+            #ifdef _WIN32
+            typedef HANDLE Thread;
+            typedef DWORD ThreadResult;
+            #	define THREAD_CALL WINAPI
+            #else
+            typedef pthread_t Thread;
+            typedef void* ThreadResult;
+            #	define THREAD_CALL
+            #endif
+
+            static bool start_thread(Thread* thread, ThreadResult(THREAD_CALL* function)(void*), ThreadState* state) {{
+            #ifdef _WIN32
+                *thread = CreateThread(NULL, 0, (LPTHREAD_START_ROUTINE)function, state, 0, NULL);
+                return *thread != NULL;
+            #else
+                return pthread_create(thread, NULL, function, state) == 0;
+            #endif
+            }}
+
+            static void join_thread(Thread thread) {{
+            #ifdef _WIN32
+                WaitForSingleObject(thread, INFINITE);
+                CloseHandle(thread);
+            #else
+                pthread_join(thread, NULL);
+            #endif
+            }}
+
+            static ThreadResult THREAD_CALL producer_main(void* argument) {{
+                ThreadState* state = (ThreadState*)argument;
+                for (size_t ii = 0; ii < PER_PRODUCER; ii++) {{
+                    AspnBase* message = new_message(state->index, ii);
+                    if (message == NULL) break;
+                    state->attempts++;
+                    if (!{ASPN_PREFIX_LOWER}_ring_push(state->ring, message)) {{
+                        state->dropped++;
+                        {ASPN_PREFIX_LOWER}_free(message);
+                    }}
+                }}
+                return 0;
+            }}
+
+            /* Pops until a stop message, checking that each producer's messages arrive in order */
+            static ThreadResult THREAD_CALL consumer_main(void* argument) {{
+                ThreadState* state = (ThreadState*)argument;
+                size_t next[NUM_PRODUCERS] = {{0}};
+                state->in_order = true;
+                for (;;) {{
+                    TestMessage* message = (TestMessage*){ASPN_PREFIX_LOWER}_ring_pop(state->ring);
+                    size_t producer;
+                    if (message == NULL) continue;
+                    producer = message->producer;
+                    if (producer == STOP_PRODUCER) {{
+                        {ASPN_PREFIX_LOWER}_free(message);
+                        break;
+                    }}
+                    if (message->sequence < next[producer]) state->in_order = false;
+                    next[producer] = message->sequence + 1;
+                    state->consumed++;
+                    {ASPN_PREFIX_LOWER}_free(message);
+                }}
+                return 0;
+            }}
+
+            static int test_threads(unsigned flags) {{
+                {ASPN_PREFIX}Ring* ring = {ASPN_PREFIX_LOWER}_ring_create(THREAD_CAPACITY, flags);
+                {ASPN_PREFIX}RingStats stats;
+                ThreadState producers[NUM_PRODUCERS] = {{{{0}}}};
+                ThreadState consumers[NUM_CONSUMERS] = {{{{0}}}};
+                Thread producer_threads[NUM_PRODUCERS];
+                Thread consumer_threads[NUM_CONSUMERS];
+                uint64_t attempts = 0, dropped = 0, consumed = 0;
+
+                CHECK(ring != NULL);
+                for (size_t ii = 0; ii < NUM_CONSUMERS; ii++) {{
+                    consumers[ii].ring = ring;
+                    CHECK(start_thread(&consumer_threads[ii], consumer_main, &consumers[ii]));
+                }}
+                for (size_t ii = 0; ii < NUM_PRODUCERS; ii++) {{
+                    producers[ii].ring = ring;
+                    producers[ii].index = ii;
+                    CHECK(start_thread(&producer_threads[ii], producer_main, &producers[ii]));
+                }}
+                for (size_t ii = 0; ii < NUM_PRODUCERS; ii++) {{
+                    join_thread(producer_threads[ii]);
+                    attempts += producers[ii].attempts;
+                    dropped += producers[ii].dropped;
+                }}
+                CHECK(attempts == (uint64_t)NUM_PRODUCERS * PER_PRODUCER);
+
+                /* Every consumer takes exactly one stop message, queued after all others */
+                for (size_t ii = 0; ii < NUM_CONSUMERS; ii++) {{
+                    AspnBase* stop = new_message(STOP_PRODUCER, ii);
+                    CHECK(stop != NULL);
+                    for (attempts++; !{ASPN_PREFIX_LOWER}_ring_push(ring, stop); attempts++) dropped++;
+                }}
+                for (size_t ii = 0; ii < NUM_CONSUMERS; ii++) {{
+                    join_thread(consumer_threads[ii]);
+                    consumed += consumers[ii].consumed;
+                    CHECK(consumers[ii].in_order);
+                }}
+
+                /* Rejected pushes are counted as dropped, not as pushed */
+                {ASPN_PREFIX_LOWER}_ring_get_stats(ring, &stats);
+                CHECK(stats.dropped == dropped);
+                CHECK(stats.pushed + stats.dropped == attempts);
+                CHECK(stats.pushed == stats.popped + stats.evicted);
+                CHECK(stats.popped == consumed + NUM_CONSUMERS);
+                CHECK(stats.occupancy == 0 && stats.high_water <= stats.capacity);
+                if (flags & {ASPN_PREFIX.upper()}_RING_DROP_OLDEST) {{
+                    CHECK(stats.dropped == 0);
+                }} else {{
+                    CHECK(stats.evicted == 0);
+                }}
+                {ASPN_PREFIX_LOWER}_ring_destroy(ring);
+                return 0;
+            }}
+
+            static void test_message_free(void* pointer) {{ {ASPN_PREFIX_LOWER}_mem_free(pointer); }}
+
+            int main(void) {{
+                {ASPN_PREFIX}MessageTypeInfo info = {{0}};
+                info.type = TEST_TYPE;
+                info.name = "TEST_MESSAGE";
+                info.size = sizeof(TestMessage);
+                info.time_offset = {ASPN_PREFIX.upper()}_NO_TIME_OFFSET;
+                info.free = test_message_free;
+                if (!{ASPN_PREFIX_LOWER}_register_message_type(&info)) return 1;
+
+                if (test_single_thread() != 0) return 1;
+                if (test_threads({ASPN_PREFIX.upper()}_RING_MULTI_PRODUCER) != 0) return 1;
+                if (test_threads({ASPN_PREFIX.upper()}_RING_MULTI_PRODUCER | {ASPN_PREFIX.upper()}_RING_DROP_OLDEST) != 0) return 1;
+                printf("test_ring passed\\n");
+                return 0;
+            }}
+        """
+
+        self.all_source_files += [f'    \'src/{ASPN_DIR}/ring.c\',']
+        self.all_tests += ['test_ring']
+
+        output_filepath = join(self.output_folder, "ring.h")
+        format_and_write_to_file(ring_h, output_filepath)
+        output_filepath = join(self.output_folder, "ring.c")
+        format_and_write_to_file(ring_c, output_filepath)
+        output_filepath = join(self.test_folder, "test_ring.c")
+        format_and_write_to_file(test_ring_c, output_filepath)
+
+    def _generate_merge(self):
+        print("Generating merge.h and merge.c")
+        merge_h = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            */
+
+            #pragma once
+
+            #include "common.h"
+
+            #ifdef __cplusplus
+            extern "C" {{
+            #endif
+
+            /**
+            * Merges messages from several sources into time_of_validity order. Each
+            * source is a FIFO that must be pushed in time order; a binary heap over the
+            * heads of the sources yields the earliest message in O(log N) for N sources.
+            *
+            * A message is released once every open source has a message buffered, so
+            * nothing earlier can still arrive, or once it is at least lateness_nsec older
+            * than the newest message pushed to any source. The latter bounds how long a
+            * slow or silent source can hold back the output. Messages without a
+            * time_of_validity are released as soon as they reach the head of their source.
+            */
+            typedef struct {ASPN_PREFIX}Merger {ASPN_PREFIX}Merger;
+
+            typedef struct {ASPN_PREFIX}MergerStats {{
+                uint64_t pushed;
+                uint64_t popped;
+                /* Messages pushed with a time before that of an already popped message */
+                uint64_t late;
+                /* Messages currently buffered, and the largest number buffered at once */
+                size_t buffered;
+                size_t high_water;
+            }} {ASPN_PREFIX}MergerStats;
+
+            /* Returns NULL if num_sources is 0 or allocation fails. */
+            {ASPN_PREFIX}Merger* {ASPN_NULLABLE_MACRO} {ASPN_PREFIX_LOWER}_merger_create(size_t num_sources, int64_t lateness_nsec);
+
+            /* Free the merger and, with {ASPN_PREFIX_LOWER}_free(), every message still buffered. */
+            void {ASPN_PREFIX_LOWER}_merger_destroy({ASPN_PREFIX}Merger* {ASPN_NULLABLE_MACRO} merger);
+
+            /**
+            * Append a message to a source, taking ownership of it. Returns false, and
+            * leaves the message with the caller, if the source is out of range or
+            * closed, or if allocation fails.
+            */
+            bool {ASPN_PREFIX_LOWER}_merger_push({ASPN_PREFIX}Merger* merger, size_t source, AspnBase* message);
+
+            /* Mark a source as finished, so the merger no longer waits for it. */
+            void {ASPN_PREFIX_LOWER}_merger_close({ASPN_PREFIX}Merger* merger, size_t source);
+
+            /**
+            * Returns the earliest buffered message if it may be released (see
+            * {ASPN_PREFIX}Merger), else NULL. The caller owns the returned message.
+            */
+            AspnBase* {ASPN_NULLABLE_MACRO} {ASPN_PREFIX_LOWER}_merger_pop({ASPN_PREFIX}Merger* merger);
+
+            /**
+            * Returns the earliest buffered message regardless of the reorder window,
+            * or NULL if nothing is buffered. Use it to flush at the end of a stream.
+            */
+            AspnBase* {ASPN_NULLABLE_MACRO} {ASPN_PREFIX_LOWER}_merger_drain({ASPN_PREFIX}Merger* merger);
+
+            void {ASPN_PREFIX_LOWER}_merger_get_stats(const {ASPN_PREFIX}Merger* merger, {ASPN_PREFIX}MergerStats* stats);
+
+            /**
+            * Merge num_arrays arrays of messages, each sorted by time_of_validity, into
+            * out, which must have room for the sum of counts. Ties keep the order of the
+            * arrays. Ownership of the messages does not change. Returns the number of
+            * messages written, or 0 if scratch memory could not be allocated.
+            */
+            size_t {ASPN_PREFIX_LOWER}_merge_sorted_arrays(AspnBase* const* const* arrays, const size_t* counts, size_t num_arrays, AspnBase** out);
+
+            #ifdef __cplusplus
+            }}  // extern "C"
+            #endif
+        """
+
+        merge_c = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            */
+
+            #include <stdlib.h>
+            #include <string.h>
+
+            #include "merge.h"
+            #include "TypeHeader.h"
+            #include "TypeTimestamp.h"
+
+            /* Sorts messages without a time_of_validity first, so they are never held back */
+            #define UNTIMED INT64_MIN
+
+            typedef struct {{
+                int64_t time;
+                size_t index;
+            }} HeapEntry;
+
+            static bool heap_less(const HeapEntry* a, const HeapEntry* b) {{
+                return a->time < b->time || (a->time == b->time && a->index < b->index);
+            }}
+
+            static void heap_sift_up(HeapEntry* heap, size_t pos) {{
+                HeapEntry entry = heap[pos];
+                while (pos > 0) {{
+                    size_t parent = (pos - 1) / 2;
+                    if (!heap_less(&entry, &heap[parent])) break;
+                    heap[pos] = heap[parent];
+                    pos = parent;
+                }}
+                heap[pos] = entry;
+            }}
+
+            static void heap_sift_down(HeapEntry* heap, size_t size, size_t pos) {{
+                HeapEntry entry = heap[pos];
+                for (;;) {{
+                    size_t child = 2 * pos + 1;
+                    if (child >= size) break;
+                    if (child + 1 < size && heap_less(&heap[child + 1], &heap[child])) child++;
+                    if (!heap_less(&heap[child], &entry)) break;
+                    heap[pos] = heap[child];
+                    pos = child;
+                }}
+                heap[pos] = entry;
+            }}
+
+            static int64_t message_time(const AspnBase* message) {{
+                const {ASPN_PREFIX}MessageTypeInfo* info = {ASPN_PREFIX_LOWER}_message_type_info(message->message_type);
+                if (info == NULL || info->time_offset == {ASPN_PREFIX.upper()}_NO_TIME_OFFSET) return UNTIMED;
+                return ((const {ASPN_PREFIX}TypeTimestamp*)((const char*)message + info->time_offset))->elapsed_nsec;
+            }}
+
+            typedef struct {{
+                AspnBase* message;
+                int64_t time;
+            }} QueuedMessage;
+
+            typedef struct {{
+                QueuedMessage* queue;
+                size_t head;
+                size_t count;
+                size_t capacity;
+                bool closed;
+            }} MergeSource;
+
+            struct {ASPN_PREFIX}Merger {{
+                MergeSource* sources;
+                size_t num_sources;
+                /* One entry per source with buffered messages, keyed by its head */
+                HeapEntry* heap;
+                size_t heap_size;
+                /* Open sources without buffered messages */
+                size_t waiting;
+                int64_t lateness_nsec;
+                int64_t newest_time;
+                int64_t last_popped_time;
+                {ASPN_PREFIX}MergerStats stats;
+            }};
+
+            {ASPN_PREFIX}Merger* {ASPN_PREFIX_LOWER}_merger_create(size_t num_sources, int64_t lateness_nsec) {{
+                {ASPN_PREFIX}Merger* merger;
+                if (num_sources == 0) return NULL;
+                merger = ({ASPN_PREFIX}Merger*)calloc(1, sizeof({ASPN_PREFIX}Merger));
+                if (merger == NULL) return NULL;
+                merger->sources = (MergeSource*)calloc(num_sources, sizeof(MergeSource));
+                merger->heap = (HeapEntry*)calloc(num_sources, sizeof(HeapEntry));
+                if (merger->sources == NULL || merger->heap == NULL) {{
+                    free(merger->sources);
+                    free(merger->heap);
+                    free(merger);
+                    return NULL;
+                }}
+                merger->num_sources = num_sources;
+                merger->waiting = num_sources;
+                merger->lateness_nsec = lateness_nsec < 0 ? 0 : lateness_nsec;
+                merger->newest_time = UNTIMED;
+                merger->last_popped_time = UNTIMED;
+                return merger;
+            }}
+
+            void {ASPN_PREFIX_LOWER}_merger_destroy({ASPN_PREFIX}Merger* merger) {{
+                if (merger == NULL) return;
+                for (size_t ii = 0; ii < merger->num_sources; ii++) {{
+                    MergeSource* source = &merger->sources[ii];
+                    for (size_t jj = 0; jj < source->count; jj++)
+                        {ASPN_PREFIX_LOWER}_free(source->queue[(source->head + jj) % source->capacity].message);
+                    free(source->queue);
+                }}
+                free(merger->sources);
+                free(merger->heap);
+                free(merger);
+            }}
+
+            static bool source_grow(MergeSource* source) {{
+                size_t capacity = source->capacity > 0 ? 2 * source->capacity : 16;
+                QueuedMessage* queue = (QueuedMessage*)malloc(capacity * sizeof(QueuedMessage));
+                if (queue == NULL) return false;
+                for (size_t ii = 0; ii < source->count; ii++)
+                    queue[ii] = source->queue[(source->head + ii) % source->capacity];
+                free(source->queue);
+                source->queue = queue;
+                source->head = 0;
+                source->capacity = capacity;
+                return true;
+            }}
+
+            bool {ASPN_PREFIX_LOWER}_merger_push({ASPN_PREFIX}Merger* merger, size_t source_index, AspnBase* message) {{
+                MergeSource* source;
+                QueuedMessage queued;
+                if (source_index >= merger->num_sources) return false;
+                source = &merger->sources[source_index];
+                if (source->closed) return false;
+                if (source->count == source->capacity && !source_grow(source)) return false;
+
+                queued.message = message;
+                queued.time = message_time(message);
+                source->queue[(source->head + source->count) % source->capacity] = queued;
+                if (source->count++ == 0) {{
+                    merger->heap[merger->heap_size].time = queued.time;
+                    merger->heap[merger->heap_size].index = source_index;
+                    heap_sift_up(merger->heap, merger->heap_size++);
+                    merger->waiting--;
+                }}
+
+                if (queued.time > merger->newest_time) merger->newest_time = queued.time;
+                if (queued.time != UNTIMED && queued.time < merger->last_popped_time) merger->stats.late++;
+                merger->stats.pushed++;
+                if (++merger->stats.buffered > merger->stats.high_water) merger->stats.high_water = merger->stats.buffered;
+                return true;
+            }}
+
+            void {ASPN_PREFIX_LOWER}_merger_close({ASPN_PREFIX}Merger* merger, size_t source_index) {{
+                MergeSource* source;
+                if (source_index >= merger->num_sources) return;
+                source = &merger->sources[source_index];
+                if (source->closed) return;
+                source->closed = true;
+                if (source->count == 0) merger->waiting--;
+            }}
+
+            static AspnBase* merger_take_head({ASPN_PREFIX}Merger* merger) {{
+                MergeSource* source = &merger->sources[merger->heap[0].index];
+                QueuedMessage queued = source->queue[source->head];
+                source->head = (source->head + 1) % source->capacity;
+                if (--source->count > 0) {{
+                    merger->heap[0].time = source->queue[source->head].time;
+                }} else {{
+                    merger->heap[0] = merger->heap[--merger->heap_size];
+                    if (!source->closed) merger->waiting++;
+                }}
+                if (merger->heap_size > 0) heap_sift_down(merger->heap, merger->heap_size, 0);
+
+                if (queued.time > merger->last_popped_time) merger->last_popped_time = queued.time;
+                merger->stats.popped++;
+                merger->stats.buffered--;
+                return queued.message;
+            }}
+
+            AspnBase* {ASPN_PREFIX_LOWER}_merger_pop({ASPN_PREFIX}Merger* merger) {{
+                int64_t time;
+                if (merger->heap_size == 0) return NULL;
+                time = merger->heap[0].time;
+                if (merger->waiting > 0 && time != UNTIMED &&
+                    (time > merger->newest_time || merger->newest_time - time < merger->lateness_nsec))
+                    return NULL;
+                return merger_take_head(merger);
+            }}
+
+            AspnBase* {ASPN_PREFIX_LOWER}_merger_drain({ASPN_PREFIX}Merger* merger) {{
+                if (merger->heap_size == 0) return NULL;
+                return merger_take_head(merger);
+            }}
+
+            void {ASPN_PREFIX_LOWER}_merger_get_stats(const {ASPN_PREFIX}Merger* merger, {ASPN_PREFIX}MergerStats* stats) {{
+                *stats = merger->stats;
+            }}
+
+            size_t {ASPN_PREFIX_LOWER}_merge_sorted_arrays(AspnBase* const* const* arrays, const size_t* counts, size_t num_arrays, AspnBase** out) {{
+                HeapEntry* heap = (HeapEntry*)malloc((num_arrays > 0 ? num_arrays : 1) * sizeof(HeapEntry));
+                size_t* cursors = (size_t*)calloc(num_arrays > 0 ? num_arrays : 1, sizeof(size_t));
+                size_t heap_size = 0;
+                size_t written = 0;
+                if (heap == NULL || cursors == NULL) {{
+                    free(heap);
+                    free(cursors);
+                    return 0;
+                }}
+                for (size_t ii = 0; ii < num_arrays; ii++) {{
+                    if (counts[ii] == 0) continue;
+                    heap[heap_size].time = message_time(arrays[ii][0]);
+                    heap[heap_size].index = ii;
+                    heap_sift_up(heap, heap_size++);
+                }}
+                while (heap_size > 0) {{
+                    size_t array = heap[0].index;
+                    out[written++] = arrays[array][cursors[array]++];
+                    if (cursors[array] < counts[array])
+                        heap[0].time = message_time(arrays[array][cursors[array]]);
+                    else
+                        heap[0] = heap[--heap_size];
+                    if (heap_size > 0) heap_sift_down(heap, heap_size, 0);
+                }}
+                free(heap);
+                free(cursors);
+                return written;
+            }}
+        """
+
+        bench_merge_c = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            *
+            * Measures the throughput of {ASPN_PREFIX_LOWER}_merger and {ASPN_PREFIX_LOWER}_merge_sorted_arrays
+            * against the number of sources, and prints the results as JSON.
+            */
+
+            #if !defined(_WIN32) && !defined(_POSIX_C_SOURCE)
+            #	define _POSIX_C_SOURCE 199309L
+            #endif
+
+            #include <stddef.h>
+            #include <stdio.h>
+            #include <stdlib.h>
+            #include <time.h>
+
+            #include <{ASPN_DIR}/TypeHeader.h>
+            #include <{ASPN_DIR}/TypeTimestamp.h>
+            #include <{ASPN_DIR}/merge.h>
+
+            #ifdef _WIN32
+            #	include <windows.h>
+            #endif
+
+            #define NUM_MESSAGES (1 << 20)
+            #define LATENESS_NSEC 1000000
+
+            /* A minimal timed message, registered as an extension so the benchmark does
+            * not depend on the messages of the ICD. */
+            typedef struct {{
+                AspnBase header;
+                {ASPN_PREFIX}TypeTimestamp time_of_validity;
+            }} BenchMessage;
+
+            static void bench_message_free(void* pointer) {{ (void)pointer; }}
+
+            static double now_sec(void) {{
+            #ifdef _WIN32
+                LARGE_INTEGER count, frequency;
+                QueryPerformanceCounter(&count);
+                QueryPerformanceFrequency(&frequency);
+                return (double)count.QuadPart / (double)frequency.QuadPart;
+            #else
+                struct timespec ts;
+                clock_gettime(CLOCK_MONOTONIC, &ts);
+                return (double)ts.tv_sec + 1e-9 * (double)ts.tv_nsec;
+            #endif
+            }}
+
+            int main(void) {{
+                static const size_t source_counts[] = {{1, 2, 4, 8, 16, 32, 64, 128}};
+                const size_t num_runs = sizeof(source_counts) / sizeof(source_counts[0]);
+                {ASPN_PREFIX}MessageTypeInfo info = {{0}};
+                BenchMessage* messages = (BenchMessage*)calloc(NUM_MESSAGES, sizeof(BenchMessage));
+                AspnBase** inputs = (AspnBase**)malloc(NUM_MESSAGES * sizeof(AspnBase*));
+                AspnBase** out = (AspnBase**)malloc(NUM_MESSAGES * sizeof(AspnBase*));
+                AspnBase** arrays[128];
+                size_t counts[128];
+                unsigned seed = 1;
+
+                if (messages == NULL || inputs == NULL || out == NULL) return 1;
+                info.type = ASPN_EXTENDED_BEGIN;
+                info.name = "BENCH_MESSAGE";
+                info.size = sizeof(BenchMessage);
+                info.time_offset = offsetof(BenchMessage, time_of_validity);
+                info.free = bench_message_free;
+                if (!{ASPN_PREFIX_LOWER}_register_message_type(&info)) return 1;
+
+                printf("{{\\"benchmark\\": \\"merge\\", \\"messages\\": %d, \\"results\\": [\\n", NUM_MESSAGES);
+                for (size_t run = 0; run < num_runs; run++) {{
+                    size_t num_sources = source_counts[run];
+                    size_t per_source = NUM_MESSAGES / num_sources;
+                    size_t total = per_source * num_sources;
+                    {ASPN_PREFIX}Merger* merger = {ASPN_PREFIX_LOWER}_merger_create(num_sources, LATENESS_NSEC);
+                    size_t popped = 0;
+                    double start, merger_sec, arrays_sec;
+
+                    /* Source ss holds messages ss, ss + N, ss + 2N, ... of a 1 kHz stream with
+                    * up to 100 us of jitter, so neighbouring sources interleave. */
+                    for (size_t ss = 0; ss < num_sources; ss++) {{
+                        arrays[ss] = inputs + ss * per_source;
+                        counts[ss] = per_source;
+                        for (size_t ii = 0; ii < per_source; ii++) {{
+                            BenchMessage* message = &messages[ss * per_source + ii];
+                            seed = seed * 1103515245u + 12345u;
+                            message->header.message_type = ASPN_EXTENDED_BEGIN;
+                            message->time_of_validity.elapsed_nsec =
+                                (int64_t)(ii * num_sources + ss) * 1000000 + (int64_t)((seed >> 16) % 100000);
+                            arrays[ss][ii] = &message->header;
+                        }}
+                    }}
+
+                    start = now_sec();
+                    for (size_t ii = 0; ii < per_source; ii++) {{
+                        for (size_t ss = 0; ss < num_sources; ss++) {{
+                            {ASPN_PREFIX_LOWER}_merger_push(merger, ss, arrays[ss][ii]);
+                            while ({ASPN_PREFIX_LOWER}_merger_pop(merger) != NULL) popped++;
+                        }}
+                    }}
+                    while ({ASPN_PREFIX_LOWER}_merger_drain(merger) != NULL) popped++;
+                    merger_sec = now_sec() - start;
+                    {ASPN_PREFIX_LOWER}_merger_destroy(merger);
+
+                    start = now_sec();
+                    if ({ASPN_PREFIX_LOWER}_merge_sorted_arrays((AspnBase* const* const*)arrays, counts, num_sources, out) != total) return 1;
+                    arrays_sec = now_sec() - start;
+                    if (popped != total) return 1;
+
+                    printf("  {{\\"sources\\": %zu, \\"merger_msgs_per_sec\\": %.0f, \\"arrays_msgs_per_sec\\": %.0f}}%s\\n",
+                        num_sources, (double)total / merger_sec, (double)total / arrays_sec,
+                        run + 1 < num_runs ? "," : "");
+                }}
+                printf("]}}\\n");
+
+                free(messages);
+                free(inputs);
+                free(out);
+                return 0;
+            }}
+        """
+
+        self.all_source_files += [f'    \'src/{ASPN_DIR}/merge.c\',']
+        self.all_benchmarks += ['bench_merge']
+
+        output_filepath = join(self.output_folder, "merge.h")
+        format_and_write_to_file(merge_h, output_filepath)
+        output_filepath = join(self.output_folder, "merge.c")
+        format_and_write_to_file(merge_c, output_filepath)
+        output_filepath = join(self.benchmark_folder, "bench_merge.c")
+        format_and_write_to_file(bench_merge_c, output_filepath)
+
+    def _generate_common_header(self):
+        print("Generating common.h")
+        common_h = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            */
+
+            #pragma once
+            #include <stddef.h>
+            #include <stdlib.h>
+            #include <string.h>
+            #include <stdbool.h>
+            #include <stdio.h>
+            #include <math.h>
+
+            #include "types.h"
+            #include "fwd.h"
+
+            #ifdef ASPN_NO_STDINT
+
+            typedef char int8_t;
+            typedef short int int16_t;
+            typedef int int32_t;
+            typedef unsigned char uint8_t;
+            typedef unsigned short uint16_t;
+            typedef unsigned int uint32_t;
+
+            #	ifdef ASPN_LONG_LONG
+            typedef long long int64_t;
+            typedef unsigned long long uint64_t;
+            #	else
+            typedef long int64_t;
+            typedef unsigned long uint64_t;
+            #	endif
+
+            #else
+            #	include <stdint.h>
+            #endif
+
+            #ifndef __cplusplus
+            #	ifdef ASPN_NO_BOOL
+            #		define false 0
+            #		define true 1
+            #		define bool int
+            #	else
+            #		include <stdbool.h>
+            #	endif
+            #endif
+
+            #ifndef __has_feature
+            #	define __has_feature(x) 0
+            #endif
+
+            /**
+            * Define a set of pragmas and attributes to instrument code to define whether or
+            * not pointers may be null. This feature attempts to gracefully disable itself
+            * if the current compiler is unable to support static analysis of nullability.
+            * However, if this automatic disabling fails, the user may define {ASPN_DISABLE_NULLABILITY}
+            * to force nullability checks off. In this case, the burden is
+            * still on the user to not set NULL to pointers defined as not NULL.
+            */
+            #if __has_feature(nullability) && defined(_Pragma) && !defined({ASPN_DISABLE_NULLABILITY})
+
+            /**
+            * Indicates that pointers should be assumed to be not NULL unless
+            * they are explicitly marked with {ASPN_NULLABLE_MACRO}.
+            *
+            * All pointers in type and function definitions declared in the region between
+            * {ASPN_NULLABILITY_MACRO_START} and {ASPN_NULLABILITY_MACRO_END} in a file are
+            * by default not NULL-able. For example, consider the following code:
+            *
+            *  #include <{ASPN_DIR}/aspn.h>
+            *
+            *  // After this macro, all pointers are assumed to be not NULL-able unless
+            *  // otherwise marked
+            *  {ASPN_NULLABILITY_MACRO_START}
+            *
+            *  // This function takes a int pointer parameter that must not be null
+            *  int foo(int* a) {{ ... }}
+            *  // This function takes a int pointer parameter that may be null
+            *  int bar(int* {ASPN_NULLABLE_MACRO} a) {{ ... }}
+            *
+            *  ...
+            *
+            *  // Invalid-- parameter a cannot be NULL
+            *  foo(NULL);
+            *  // OK-- Parameter explicitly marked as nullable
+            *  bar(NULL);
+            *
+            *  {ASPN_NULLABILITY_MACRO_END}
+            *
+            * Users of types within a ASPN_ASSUME_NONNULL region must ensure that pointer fields and
+            * arguments are not populated with a NULL value when passing them across ASPN API
+            * boundaries. Pointers explicitly annotated with {ASPN_NULLABLE_MACRO} are still nullable,
+            * even when within such a region.
+            */
+            #	define {ASPN_NULLABILITY_MACRO_START} _Pragma("clang assume_nonnull begin")
+
+            /**
+            * Ending a default not NULL region started by {ASPN_NULLABILITY_MACRO_START}. Definitions
+            * after a {ASPN_NULLABILITY_MACRO_END} return to ambiguous nullability unless otherwise
+            * explicitly marked. */
+            #	define {ASPN_NULLABILITY_MACRO_END} _Pragma("clang assume_nonnull end")
 
             /**
             * Declare a pointer as NULL-able. This macro should follow the pointer asterisk for the
@@ -481,6 +2942,11 @@ class AspnCBackend(Backend):
             * NULL-able pointer to a non-NULL pointer to int. */
             #	define {ASPN_NULLABLE_MACRO} _Nullable
 
+            /**
+            * Declare a pointer as not NULL-able outside of a {ASPN_NULLABILITY_MACRO_START}
+            * region. Like {ASPN_NULLABLE_MACRO}, this macro should follow the pointer asterisk. */
+            #	define {ASPN_NONNULL_MACRO} _Nonnull
+
             #	pragma clang diagnostic ignored "-Wnullability-extension"
 
             /**
@@ -505,7 +2971,24 @@ class AspnCBackend(Backend):
             * that has the "nullability" feature and do not define {ASPN_DISABLE_NULLABILITY}. */
             #	define {ASPN_NULLABLE_MACRO}
 
+            /**
+            * This macro does nothing. To enable compiler non-null checking, compile using a compiler
+            * that has the "nullability" feature and do not define {ASPN_DISABLE_NULLABILITY}. */
+            #	define {ASPN_NONNULL_MACRO}
+
             #endif
+
+            /* Every allocation made by ASPN-C goes through these hooks */
+            #include "allocator.h"
+
+            /* Helpers of the generated _equals() and _hash() functions */
+            #include "compare.h"
+
+            /* Helpers of the generated _serialize() and _deserialize() functions */
+            #include "serialize.h"
+
+            /* Types of the generated _struct_info tables */
+            #include "reflect.h"
         """
 
         output_filepath = join(self.output_folder, f"common.h")
@@ -523,10 +3006,16 @@ class AspnCBackend(Backend):
     def set_output_root_folder(self, output_root_folder: str):
         self.output_folder = join(output_root_folder, 'src', ASPN_DIR)
         makedirs(self.output_folder, exist_ok=True)
+        self.benchmark_folder = join(output_root_folder, 'benchmarks')
+        makedirs(self.benchmark_folder, exist_ok=True)
+        self.test_folder = join(output_root_folder, 'tests')
+        makedirs(self.test_folder, exist_ok=True)
         self._remove_existing_output_files()
 
         self.c_source_generator.set_output_root_folder(self.output_folder)
         self.c_header_generator.set_output_root_folder(self.output_folder)
+        self.bench_generator.set_output_root_folder(self.benchmark_folder)
+        self.test_serialize_generator.set_output_root_folder(self.test_folder)
 
     def begin_struct(self, struct_name: str):
         self.all_aliases += self.enums_to_aliases(self.enums_in_current_struct)
@@ -550,38 +3039,59 @@ class AspnCBackend(Backend):
             self.all_types_enum += [current_type]
 
             function_name = self.struct_name.lower()
+            struct = f'{ASPN_PREFIX}{filename}'
 
-            self.free_cases += f"""
-            case {current_type}:
-                {ASPN_PREFIX_LOWER}_{function_name}_free(pointer);
-            break;
-            """
+            # The copy functions take the concrete struct, so the table
+            # points at wrappers taking the base type
+            self.message_type_wrappers += f"""
+            static AspnBase* copy_{function_name}(AspnBase* base) {{
+                return (AspnBase*){ASPN_PREFIX_LOWER}_{function_name}_copy(({struct}*)base);
+            }}
 
-            self.type_string_cases += f"""
-            case {current_type}:
-                return "{ASPN_PREFIX.upper()}_{self.struct_name.upper()}";
-            """
+            static bool copy_into_{function_name}(AspnBase* dst, const AspnBase* src) {{
+                return {ASPN_PREFIX_LOWER}_{function_name}_copy_into(({struct}*)dst, (const {struct}*)src);
+            }}
 
-            self.aspn_type_get_time_cases += f"""
-            case {current_type}: {{
-                {ASPN_PREFIX}{filename}* child = ({ASPN_PREFIX}{filename}*) base;
-                return child->time_of_validity;
+            static bool equals_{function_name}(const AspnBase* a, const AspnBase* b, unsigned flags) {{
+                return {ASPN_PREFIX_LOWER}_{function_name}_equals((const {struct}*)a, (const {struct}*)b, flags);
             }}
-            """
 
-            self.aspn_type_set_time_cases += f"""
-            case {current_type}: {{
-                {ASPN_PREFIX}{filename}* child = ({ASPN_PREFIX}{filename}*) base;
-                child->time_of_validity = time;
-                return;
+            static uint64_t hash_{function_name}(const AspnBase* base) {{
+                return {ASPN_PREFIX_LOWER}_{function_name}_hash((const {struct}*)base);
+            }}
+
+            static size_t serialized_size_{function_name}(const AspnBase* base) {{
+                return {ASPN_PREFIX_LOWER}_{function_name}_serialized_size((const {struct}*)base);
             }}
-            """
 
-            self.aspn_copy_message_cases += f"""
-            case {current_type}: {{
-                {ASPN_PREFIX}{filename}* child = ({ASPN_PREFIX}{filename}*) base;
-                return (AspnBase*){ASPN_PREFIX_LOWER}_{function_name}_copy(child);
+            static size_t serialize_{function_name}(const AspnBase* base, uint8_t* buf, size_t len) {{
+                return {ASPN_PREFIX_LOWER}_{function_name}_serialize((const {struct}*)base, buf, len);
             }}
+
+            static AspnBase* deserialize_{function_name}(const uint8_t* buf, size_t len, const {ASPN_PREFIX}Allocator* allocator) {{
+                return (AspnBase*){ASPN_PREFIX_LOWER}_{function_name}_deserialize(buf, len, allocator);
+            }}
+            """
+
+            self.messages_includes += f'#include "{filename}.h"\n'
+
+            self.message_type_infos += f"""
+            [{current_type}] = {{
+                {current_type},
+                "{ASPN_PREFIX.upper()}_{self.struct_name.upper()}",
+                sizeof({struct}),
+                offsetof({struct}, time_of_validity),
+                {ASPN_PREFIX_LOWER}_{function_name}_free,
+                copy_{function_name},
+                copy_into_{function_name},
+                {ASPN_PREFIX.upper()}_{self.struct_name.upper()}_IS_POD,
+                equals_{function_name},
+                hash_{function_name},
+                serialized_size_{function_name},
+                serialize_{function_name},
+                deserialize_{function_name},
+                &{ASPN_PREFIX_LOWER}_{function_name}_struct_info,
+            }},
             """
 
         self.all_source_files += [f'    \'src/{ASPN_DIR}/{filename}.c\',']
@@ -594,8 +3104,10 @@ class AspnCBackend(Backend):
                               typedef {ASPN_PREFIX}{filename} Aspn{filename};
                               #define aspn_{function_name}_new {ASPN_PREFIX_LOWER}_{function_name}_new
                               #define aspn_{function_name}_copy {ASPN_PREFIX_LOWER}_{function_name}_copy
+                              #define aspn_{function_name}_copy_into {ASPN_PREFIX_LOWER}_{function_name}_copy_into
                               #define aspn_{function_name}_free {ASPN_PREFIX_LOWER}_{function_name}_free
                               #define aspn_{function_name}_free_members {ASPN_PREFIX_LOWER}_{function_name}_free_members
+                              #define aspn_{function_name}_struct_info {ASPN_PREFIX_LOWER}_{function_name}_struct_info
                               """
 
     def process_func_ptr_field_with_self(
@@ -754,14 +3266,81 @@ class AspnCBackend(Backend):
 
     def generate(self):
         self.c_source_generator.generate()
+        contiguous_structs = [
+            struct
+            for struct in self.c_source_generator.structs
+            if self.c_source_generator.has_pointers(struct)
+        ]
+        self.c_header_generator.contiguous_structs = {
+            struct.struct_name for struct in contiguous_structs
+        }
+        self.c_header_generator.take_declarations = {
+            struct.struct_name: struct.take_declarations
+            for struct in self.c_source_generator.structs
+            if struct.take_declarations
+        }
+        self.c_header_generator.batch_declarations = {
+            struct.struct_name: struct.batch_declarations
+            for struct in self.c_source_generator.structs
+            if struct.batch_declarations
+        }
+        self.c_header_generator.view_declarations = {
+            struct.struct_name: struct.view_declarations
+            for struct in self.c_source_generator.structs
+        }
+        for struct in self.c_source_generator.structs:
+            function_name = struct.fn_basename[len(ASPN_PREFIX_LOWER) + 1 :]
+            for take_function in struct.take_functions:
+                self.all_aliases += (
+                    f'#define aspn_{function_name}_{take_function} '
+                    f'{struct.fn_basename}_{take_function}\n'
+                )
+            if struct.batch_declarations:
+                self.all_aliases += (
+                    f'typedef {struct.struct_name}Batch '
+                    f'{struct.struct_name.replace(ASPN_PREFIX, "Aspn", 1)}Batch;\n'
+                )
+            for batch_function in struct.batch_functions:
+                self.all_aliases += (
+                    f'#define aspn_{function_name}_{batch_function} '
+                    f'{struct.fn_basename}_{batch_function}\n'
+                )
+            self.all_aliases += (
+                f'typedef {struct.struct_name}View '
+                f'{struct.struct_name.replace(ASPN_PREFIX, "Aspn", 1)}View;\n'
+            )
+            for view_function in struct.view_functions:
+                self.all_aliases += (
+                    f'#define aspn_{function_name}_{view_function} '
+                    f'{struct.fn_basename}_{view_function}\n'
+                )
+        for struct in contiguous_structs:
+            function_name = struct.fn_basename[len(ASPN_PREFIX_LOWER) + 1 :]
+            for suffix in ['new', 'copy', 'free']:
+                self.all_aliases += (
+                    f'#define aspn_{function_name}_{suffix}_contiguous '
+                    f'{struct.fn_basename}_{suffix}_contiguous\n'
+                )
         self.c_header_generator.generate()
+        self.bench_generator.generate()
+        self.all_benchmarks += ['bench_aspn23']
+        self.test_serialize_generator.generate()
+        self.all_tests += ['test_serialize_aspn23']
 
         self.all_aliases += self.enums_to_aliases(self.enums_in_current_struct)
         self.enums_in_current_struct = []
 
         self._generate_common_header()
+        self._generate_fwd_header()
+        self._generate_allocator()
+        self._generate_compare_header()
+        self._generate_serialize_header()
+        self._generate_reflect_header()
         self._generate_unversioned_header()
         self._generate_meta_header()
         self._generate_utils()
+        self._generate_pool()
+        self._generate_ring()
+        self._generate_merge()
         self._generate_types_header()
         self._generate_meson_build()
@@ -7,6 +7,8 @@ from ..backend import Backend
 from .aspn_yaml_to_marshal_lcm_to_c_source import AspnYamlToMarshalLCMToCSource
 from .aspn_yaml_to_marshal_c_to_lcm_source import AspnYamlToMarshalCToLCMSource
 from .aspn_yaml_to_test_marshal_aspn23 import AspnYamlToTestMarshalAspn23
+from .aspn_yaml_to_bench_marshal_aspn23 import AspnYamlToBenchMarshalAspn23
+from .aspn_yaml_to_c_source import AspnYamlToCSource
 from .utils import ASPN_PREFIX, format_and_write_to_file, snake_to_pascal
 
 MARSHAL_LCM_C_DIR = "marshal_lcm_c"
@@ -67,6 +69,12 @@ class AspnCMarshalingBackend(Backend):
             AspnYamlToMarshalCToLCMSource()
         )
         self.test_marshal_aspn23_c_generator = AspnYamlToTestMarshalAspn23()
+        # Only collects the ASPN-C field descriptors the benchmark builds
+        # messages from; it writes no files.
+        self.c_source_generator = AspnYamlToCSource()
+        self.bench_marshal_aspn23_c_generator = AspnYamlToBenchMarshalAspn23(
+            self.c_source_generator
+        )
         self.header_current_struct: Struct = None
         self.header_structs: List[Struct] = []
 
@@ -91,6 +99,9 @@ class AspnCMarshalingBackend(Backend):
         self.test_marshal_aspn23_c_generator.set_output_root_folder(
             self.output_folder
         )
+        self.bench_marshal_aspn23_c_generator.set_output_root_folder(
+            self.output_folder
+        )
 
     def begin_struct(self, struct_name: str):
         self.struct_name = struct_name
@@ -100,6 +111,13 @@ class AspnCMarshalingBackend(Backend):
         self.marshal_lcm_to_c_source_generator.begin_struct(self.struct_name)
         self.marshal_c_to_lcm_source_generator.begin_struct(self.struct_name)
         self.test_marshal_aspn23_c_generator.begin_struct(self.struct_name)
+        self.c_source_generator.begin_struct(self.struct_name)
+        if self.struct_name == 'type_header':
+            # ASPN-C headers start with the message type, which is not part of
+            # the ICD (or of the LCM types) and only added for the C backends
+            self.c_source_generator.process_simple_field(
+                'message_type', f'{ASPN_PREFIX}MessageType', ''
+            )
 
         if self.header_current_struct is not None:
             self.header_structs += [self.header_current_struct]
@@ -158,6 +176,9 @@ class AspnCMarshalingBackend(Backend):
         self.test_marshal_aspn23_c_generator.process_func_ptr_field_with_self(
             field_name, params, return_t, doc_string, nullable
         )
+        self.c_source_generator.process_func_ptr_field_with_self(
+            field_name, params, return_t, doc_string, nullable
+        )
 
     def process_data_pointer_field(
         self,
@@ -177,6 +198,9 @@ class AspnCMarshalingBackend(Backend):
         self.test_marshal_aspn23_c_generator.process_data_pointer_field(
             field_name, type_name, data_len, doc_string, deref, nullable
         )
+        self.c_source_generator.process_data_pointer_field(
+            field_name, type_name, data_len, doc_string, deref, nullable
+        )
 
     def process_matrix_field(
         self,
@@ -196,6 +220,9 @@ class AspnCMarshalingBackend(Backend):
         self.test_marshal_aspn23_c_generator.process_matrix_field(
             field_name, type_name, x, y, doc_string, nullable
         )
+        self.c_source_generator.process_matrix_field(
+            field_name, type_name, x, y, doc_string, nullable
+        )
 
     def process_outer_managed_pointer_field(
         self, field_name: str, field_type_name: str, doc_string: str
@@ -209,6 +236,9 @@ class AspnCMarshalingBackend(Backend):
         self.test_marshal_aspn23_c_generator.process_outer_managed_pointer_field(
             field_name, field_type_name, doc_string
         )
+        self.c_source_generator.process_outer_managed_pointer_field(
+            field_name, field_type_name, doc_string
+        )
 
     def process_outer_managed_pointer_array_field(
         self,
@@ -228,6 +258,9 @@ class AspnCMarshalingBackend(Backend):
         self.test_marshal_aspn23_c_generator.process_outer_managed_pointer_array_field(
             field_name, field_type_name, data_len, doc_string, deref, nullable
         )
+        self.c_source_generator.process_outer_managed_pointer_array_field(
+            field_name, field_type_name, data_len, doc_string, deref, nullable
+        )
 
     def process_string_field(
         self, field_name: str, doc_string: str, nullable: bool = False
@@ -241,6 +274,9 @@ class AspnCMarshalingBackend(Backend):
         self.test_marshal_aspn23_c_generator.process_string_field(
             field_name, doc_string, nullable
         )
+        self.c_source_generator.process_string_field(
+            field_name, doc_string, nullable
+        )
 
     def process_string_array_field(
         self, field_name: str, doc_string: str, nullable: bool = False
@@ -254,6 +290,9 @@ class AspnCMarshalingBackend(Backend):
         self.test_marshal_aspn23_c_generator.process_string_array_field(
             field_name, doc_string, nullable
         )
+        self.c_source_generator.process_string_array_field(
+            field_name, doc_string, nullable
+        )
 
     def process_simple_field(
         self,
@@ -271,6 +310,9 @@ class AspnCMarshalingBackend(Backend):
         self.test_marshal_aspn23_c_generator.process_simple_field(
             field_name, field_type_name, doc_string, nullable
         )
+        self.c_source_generator.process_simple_field(
+            field_name, field_type_name, doc_string, nullable
+        )
 
     def process_class_docstring(self, doc_string: str, nullable: bool = False):
         self.marshal_lcm_to_c_source_generator.process_class_docstring(
@@ -282,6 +324,7 @@ class AspnCMarshalingBackend(Backend):
         self.test_marshal_aspn23_c_generator.process_class_docstring(
             doc_string, nullable
         )
+        self.c_source_generator.process_class_docstring(doc_string, nullable)
 
     def process_inheritance_field(
         self,
@@ -299,6 +342,9 @@ class AspnCMarshalingBackend(Backend):
         self.test_marshal_aspn23_c_generator.process_inheritance_field(
             field_name, field_type_name, doc_string, nullable
         )
+        self.c_source_generator.process_inheritance_field(
+            field_name, field_type_name, doc_string, nullable
+        )
 
     def process_enum(
         self,
@@ -329,11 +375,20 @@ class AspnCMarshalingBackend(Backend):
             doc_string,
             enum_values_doc_strs,
         )
+        self.c_source_generator.process_enum(
+            field_name,
+            field_type_name,
+            enum_values,
+            doc_string,
+            enum_values_doc_strs,
+        )
 
     def generate(self):
         self.marshal_lcm_to_c_source_generator.generate()
         self.marshal_c_to_lcm_source_generator.generate()
         self.test_marshal_aspn23_c_generator.generate()
+        self.c_source_generator.collect_structs()
+        self.bench_marshal_aspn23_c_generator.generate()
 
         self._generate_from_header()
         self._generate_to_header()
@@ -1,6 +1,6 @@
 from os import makedirs, sep
 from shutil import rmtree
-from os.path import join
+from os.path import dirname, join
 from textwrap import dedent
 from typing import List, Union
 from ..backend import Backend
@@ -25,6 +25,31 @@ from .utils import (
 
 ASPN_DIR = ASPN_PREFIX.lower()
 
+# Third party headers of xtensor_bindings.cpp, also precompiled with the
+# xtensor_py variant
+BINDINGS_INCLUDES = """
+#include <pybind11/eval.h>
+#include <pybind11/native_enum.h>
+#include <pybind11/operators.h>
+#include <pybind11/pybind11.h> // Pybind11 import to define Python bindings
+#include <pybind11/stl.h>
+
+#include <xtensor-python/pyarray.hpp> // Numpy bindings
+#include <xtensor-python/pytensor.hpp>
+"""
+
+# Standard headers used by the classes of every variant, precompiled together
+# with the matrix headers
+PCH_STD_INCLUDES = """
+#include <functional>
+#include <iomanip>
+#include <iostream>
+#include <memory>
+#include <stdexcept>
+#include <string>
+#include <vector>
+"""
+
 EXTRA_BINDINGS = {
     'TypeTimestamp': """.def(py::self + py::self)
 	    .def(py::self + double())
@@ -87,7 +112,22 @@ EXTRA_BINDINGS = {
 
 
 class AspnCppBackend(Backend):
-    def __init__(self):
+    """
+    Generates ASPN-C++ for every matrix variant, and the pybind11 bindings
+    of the xtensor_py variant.
+
+    The bindings are split into one translation unit per
+    bindings_per_file ASPN types, so the Python module compiles in
+    parallel with bounded memory per compiler process.
+    """
+
+    def __init__(self, bindings_per_file: int = 1):
+        if bindings_per_file < 1:
+            raise ValueError(
+                'bindings_per_file must be at least 1, got '
+                f'{bindings_per_file}'
+            )
+        self.bindings_per_file = bindings_per_file
         self.source_generators = [
             AspnYamlToXtensorSource(),
             AspnYamlToXtensorPySource(),
@@ -102,11 +142,19 @@ class AspnCppBackend(Backend):
         ]
         self.all_source_files = []
         self.includes = []
+        # Headers of the message classes only, for the sources that dispatch
+        # on the message type
+        self.message_includes = []
+        self.class_names = []
         self.type_get_time_cases = ''
         self.type_set_time_cases = ''
         self.type_convert_message_cpp_cases = ''
         self.type_copy_message_cases = ''
+        # Bindings of the struct being processed, moved to binding_shards as
+        # (struct name, class name, code) when the struct ends
         self.bindings = []
+        self.binding_shards = []
+        self.bindings_sources = []
         self.getters_setters = ''
         self.types = []
         self.all_types = []
@@ -169,6 +217,11 @@ class AspnCppBackend(Backend):
             aspn_xtensor_py_deps = [xtensor_dep, xtensor_python_dep, pybind11_dep]
             aspn_eigen_deps = [aspn_c_dep, eigen_dep]
         """)
+        # Each variant precompiles its heavy headers when aspn-cpp-pch is
+        # true, otherwise cpp_pch is an empty list
+        pch_template = dedent("""
+            aspn_{matrix}_pch = get_option('aspn-cpp-pch') ? '{pch}' : []
+        """)
         matrix_specific_template = dedent("""
             aspn_{matrix}_sources = [
             {sources}
@@ -184,6 +237,8 @@ class AspnCppBackend(Backend):
                     sources: aspn_{matrix}_sources,
                     include_directories: aspn_{matrix}_include,
                     dependencies: aspn_{matrix}_deps,
+                    cpp_pch: aspn_{matrix}_pch,
+                    override_options: aspn_unity_options,
                     soversion: meson.project_version(),
                     install: true)
 
@@ -196,6 +251,11 @@ class AspnCppBackend(Backend):
                     header = source.replace('.cpp', '.hpp')
                     install_headers(header, install_dir: get_option('includedir') + '/aspn23/{matrix}')
                 endforeach
+                install_headers('src/{aspn_dir}/{matrix}/fwd.hpp',
+                    'src/{aspn_dir}/{matrix}/functions.hpp',
+                    'src/{aspn_dir}/{matrix}/views.hpp',
+                    'src/{aspn_dir}/{matrix}/buffers.hpp',
+                    install_dir: get_option('includedir') + '/aspn23/{matrix}')
 
                 pkg = import('pkgconfig')
                 pkg.generate(aspn_{matrix}_libs,
@@ -223,22 +283,38 @@ class AspnCppBackend(Backend):
             all_source_files = [
                 f'    \'{source_file}\',' for source_file in all_source_files
             ]
+            meson_build += pch_template.format(
+                matrix=generator.directory,
+                pch=join('src', ASPN_DIR, self._pch_path(generator)),
+            )
             if type(generator) is AspnYamlToXtensorPyHeader:
                 sources = '\n'.join(all_source_files)
+                bindings_sources = '\n'.join(
+                    f"    'src/{ASPN_DIR}/xtensor_py/{source}',"
+                    for source in ['xtensor_bindings.cpp']
+                    + self.bindings_sources
+                )
                 meson_build += f'''
 aspn_xtensor_py_sources = [
     {sources}
 ]
 
+# add_bindings() and the translation units it calls, one per
+# bindings_per_file ASPN types
+aspn_xtensor_py_bindings_sources = [
+{bindings_sources}
+]
+
 aspn_xtensor_py_dep = disabler()
 
 if not get_option('aspn-cpp-xtensor-py').disabled()
     aspn_xtensor_py_include = include_directories('src')
 
     aspn_xtensor_py_static_lib = static_library('aspn_xtensor_py',
-        sources: [aspn_xtensor_py_sources, 'src/aspn23/xtensor_py/xtensor_bindings.cpp'],
+        sources: [aspn_xtensor_py_sources, aspn_xtensor_py_bindings_sources],
         include_directories: aspn_xtensor_py_include,
-        override_options: ['b_coverage=false', 'b_sanitize=none'],
+        cpp_pch: aspn_xtensor_py_pch,
+        override_options: ['b_coverage=false', 'b_sanitize=none'] + aspn_unity_options,
         dependencies: [aspn_xtensor_py_deps, aspn_c_no_asan_dep])
 
     aspn_xtensor_py_dep = declare_dependency(
@@ -300,30 +376,98 @@ endif
         with open(meson_build_filename, "w", encoding="utf-8") as f:
             f.write(meson_build)
 
-    def _generate_bindings(self):
-        bindings_template = """
-        #include <pybind11/eval.h>
-        #include <pybind11/native_enum.h>
-        #include <pybind11/operators.h>
-        #include <pybind11/pybind11.h> // Pybind11 import to define Python bindings
-        #include <pybind11/stl.h>
+    def _pch_path(self, generator) -> str:
+        return join(
+            generator.directory, 'pch', f'{generator.directory}_pch.hpp'
+        )
 
-        #include <xtensor-python/pyarray.hpp> // Numpy bindings
-        #include <xtensor-python/pytensor.hpp>
+    def _generate_pch_headers(self):
+        pch_template = """
+            // This code is generated via firehose.
+            // DO NOT hand edit code. Make any changes required using the firehose repo instead.
+            //
+            // Precompiled with every source of the {directory} variant, see aspn-cpp-pch in
+            // meson_options.txt. Only lists third party and standard headers, so that
+            // editing a message never invalidates it.
+
+            {includes}
+        """
+
+        for generator in self.header_generators:
+            print(f"Generating {self._pch_path(generator)}")
+            output_filepath = join(
+                self.output_folder, self._pch_path(generator)
+            )
+            makedirs(dirname(output_filepath), exist_ok=True)
+            bindings_includes = (
+                BINDINGS_INCLUDES
+                if type(generator) is AspnYamlToXtensorPyHeader
+                else ''
+            )
+            # The matrix headers may repeat standard ones (e.g. <vector> for
+            # stl), so keep the first occurrence of every header
+            includes = {}
+            for line in (
+                PCH_STD_INCLUDES
+                + generator.matrix_includes()
+                + '\n'
+                + bindings_includes
+            ).splitlines():
+                header = line.split('//')[0].strip()
+                if header and header not in includes:
+                    includes[header] = line.strip()
+            pch = pch_template.format(
+                directory=generator.directory,
+                includes='\n'.join(includes.values()),
+            )
+            format_and_write_to_file(pch, output_filepath)
+
+    def _generate_bindings(self):
+        shards_h_template = """
+        #pragma once
 
-        #include "aspn_xtensor.hpp"
+        {bindings_includes}
+        #include <sstream>
 
         // Used to pass parameter types by grouping a comma-separated collection of arguments to be passed
         // in as a single macro argument. Can be passed to constructor macros or overloaded function macros
         #define PARAMS(...) __VA_ARGS__
 
-        using namespace aspn_xtensor;
         namespace py = pybind11;
 
+        // Each registers the enums and the class of one ASPN type. add_bindings() calls them in ICD
+        // order, so types are registered before the messages using them and TypeHeader before the
+        // classes deriving from it.
+        {declarations}
+        """
+
+        shard_template = """
+        #include "xtensor_bindings_shards.hpp"
+        {includes}
+
+        using namespace aspn_xtensor;
+
+        {functions}
+        """
+
+        function_template = """
+        void add_{struct_name}_bindings(pybind11::module& m) {{
+            {bindings}
+        }}
+        """
+
+        bindings_template = """
+        #include "xtensor_bindings_shards.hpp"
+        #include "TypeTimestamp.hpp"
+
+        using namespace aspn_xtensor;
+
         void add_bindings(pybind11::module& m) {{
             m.doc() = "ASPN C++ Xtensor";
 
-            {bindings}
+            {types_enum}
+
+            {calls}
 
             m.def("to_type_timestamp",
                 py::overload_cast<double>(&aspn_xtensor::to_type_timestamp),
@@ -341,7 +485,7 @@ endif
 
         types_enum = f'''
         py::native_enum<{ASPN_PREFIX}MessageType>(m, "AspnMessageType", "enum.Enum")
-        .value("ASPN_UNDEFINED", AspnMessageType::ASPN_UNDEFINED)
+        .value("ASPN_UNDEFINED", {ASPN_PREFIX}MessageType::ASPN_UNDEFINED)
         '''
         for type in self.all_types + [
             'ASPN_EXTENDED_BEGIN',
@@ -349,8 +493,63 @@ endif
         ]:
             types_enum += f'.value("{type}", {ASPN_PREFIX}MessageType::{type})'
         types_enum += '.finalize();'
-        self.bindings += [types_enum]
 
+        self._end_struct_bindings()
+        shards = [
+            self.binding_shards[ii : ii + self.bindings_per_file]
+            for ii in range(
+                0, len(self.binding_shards), self.bindings_per_file
+            )
+        ]
+        self.bindings_sources = []
+        for shard in shards:
+            # Named after the first type it registers
+            filename = f'xtensor_bindings_{shard[0][1]}.cpp'
+            self.bindings_sources.append(filename)
+            shard_cpp = shard_template.format(
+                includes='\n'.join(
+                    f'#include "{class_name}.hpp"'
+                    for _, class_name, _ in shard
+                ),
+                functions='\n'.join(
+                    function_template.format(
+                        struct_name=struct_name, bindings=code
+                    )
+                    for struct_name, _, code in shard
+                ),
+            )
+            output_filepath = join(self.output_folder, 'xtensor_py', filename)
+            format_and_write_to_file(shard_cpp, output_filepath)
+
+        shards_h = shards_h_template.format(
+            bindings_includes=BINDINGS_INCLUDES,
+            declarations='\n'.join(
+                f'void add_{struct_name}_bindings(pybind11::module& m);'
+                for struct_name, _, _ in self.binding_shards
+            ),
+        )
+        output_filepath = join(
+            self.output_folder, 'xtensor_py', 'xtensor_bindings_shards.hpp'
+        )
+        format_and_write_to_file(shards_h, output_filepath)
+
+        bindings = bindings_template.format(
+            types_enum=types_enum,
+            calls='\n'.join(
+                f'add_{struct_name}_bindings(m);'
+                for struct_name, _, _ in self.binding_shards
+            ),
+        )
+        bindings_filename = join(
+            self.output_folder, 'xtensor_py', 'xtensor_bindings.cpp'
+        )
+        format_and_write_to_file(bindings, bindings_filename)
+
+    def _end_struct_bindings(self):
+        """
+        Adds the class binding of the struct being processed to its enum
+        bindings, and moves them to binding_shards.
+        """
         if self.getters_setters != '':
             inheritance = (
                 ', TypeHeader'
@@ -368,41 +567,157 @@ endif
                     extra_bindings=EXTRA_BINDINGS.get(self.class_name, ''),
                 )
             )
+            self.types = []
+            self.getters_setters = ''
 
-        bindings = bindings_template.format(bindings='\n'.join(self.bindings))
-        bindings_filename = join(
-            self.output_folder, 'xtensor_py', 'xtensor_bindings.cpp'
-        )
-        format_and_write_to_file(bindings, bindings_filename)
+        if self.bindings:
+            self.binding_shards.append(
+                (self.struct_name, self.class_name, '\n'.join(self.bindings))
+            )
+            self.bindings = []
 
     def _generate_aspn_root_header(self):
-        aspn_h_template = """
+        fwd_h_template = """
             // This code is generated via firehose.
             // DO NOT hand edit code. Make any changes required using the firehose repo instead.
+            //
+            // Forward declarations of every ASPN-C++ class, for headers that only
+            // handle them through pointers or references.
 
             #pragma once
 
-            #include <functional>
-            #include <memory>
+            namespace {aspn_lower}_{matrix} {{
+
+            {declarations}
+
+            // An alias for cases where the object has been up-casted and should be
+            // down-casted before using it.
+            using AspnBase = TypeHeader;
+
+            }}
+
+            namespace aspn_{matrix} = {aspn_lower}_{matrix};
+        """
+
+        aspn_h_template = """
+            // This code is generated via firehose.
+            // DO NOT hand edit code. Make any changes required using the firehose repo instead.
+            //
+            // Convenience umbrella including all of ASPN-C++ and the unversioned
+            // ASPN-C aliases. Generated code never includes it, so editing one
+            // message only rebuilds the sources that reference it.
+
+            #pragma once
 
             #include <{aspn_lower}/aspn.h>
+
+            #include "fwd.hpp"
+            #include "functions.hpp"
+            #include "views.hpp"
+            #include "buffers.hpp"
             {includes}
+        """
 
-            namespace aspn_{matrix} = {aspn_lower}_{matrix};
+        buffers_h_template = """
+            // This code is generated via firehose.
+            // DO NOT hand edit code. Make any changes required using the firehose repo instead.
+            //
+            // Arrays from the ASPN allocator, which the setters of variable-length
+            // arrays and matrices hand to the underlying ASPN-C structs without
+            // copying them.
+
+            #pragma once
+
+            #include <cstddef>
+            #include <cstring>
+            #include <memory>
+            #include <new>
+
+            #include <{aspn_lower}/allocator.h>
 
             namespace {aspn_lower}_{matrix} {{
 
-            // An alias for cases where the object has been up-casted and should be
-            // down-casted before using it.
-            using AspnBase = TypeHeader;
+            struct AspnBufferDeleter {{
+                void operator()(void* pointer) const {{ {aspn_lower}_mem_free(pointer); }}
+            }};
+
+            template <class T>
+            using AspnBuffer = std::unique_ptr<T[], AspnBufferDeleter>;
+
+            /**
+            * Allocates a zero-initialized AspnBuffer of \p count elements. Throws
+            * std::bad_alloc if the ASPN allocator fails.
+            */
+            template <class T>
+            AspnBuffer<T> make_aspn_buffer(std::size_t count) {{
+                if (count == 0) return nullptr;
+                T* data = static_cast<T*>({aspn_lower}_mem_calloc(count, sizeof(T)));
+                if (data == nullptr) throw std::bad_alloc();
+                return AspnBuffer<T>(data);
+            }}
+
+            /**
+            * Copies \p count elements of \p data into a new AspnBuffer. Throws
+            * std::bad_alloc if the ASPN allocator fails.
+            */
+            template <class T>
+            AspnBuffer<T> copy_to_aspn_buffer(const T* data, std::size_t count) {{
+                if (count == 0) return nullptr;
+                T* copy = static_cast<T*>({aspn_lower}_mem_alloc(count * sizeof(T)));
+                if (copy == nullptr) throw std::bad_alloc();
+                memcpy(copy, data, count * sizeof(T));
+                return AspnBuffer<T>(copy);
+            }}
+
+            }}
+        """
+
+        views_h_template = """
+            // This code is generated via firehose.
+            // DO NOT hand edit code. Make any changes required using the firehose repo instead.
+            //
+            // Types returned by the view_*() accessors: read-only views over the
+            // arrays and matrices of the underlying ASPN-C structs.
+
+            #pragma once
+
+            #include <array>
+            #include <cstddef>
+            #include <span>
+            #include <utility>
+            #include <vector>
+
+            {matrix_includes}
+
+            namespace {aspn_lower}_{matrix} {{
+
+            {aliases}
+
+            }}
+        """
+
+        functions_h_template = """
+            // This code is generated via firehose.
+            // DO NOT hand edit code. Make any changes required using the firehose repo instead.
+
+            #pragma once
+
+            #include <functional>
+            #include <memory>
+
+            #include "fwd.hpp"
+            #include "TypeHeader.hpp"
+            #include "TypeTimestamp.hpp"
+
+            namespace {aspn_lower}_{matrix} {{
 
             bool is_core_message(std::shared_ptr<{aspn_lower}_{matrix}::AspnBase> base);
 
             TypeTimestamp get_time(std::shared_ptr<{aspn_lower}_{matrix}::AspnBase> parent);
             void set_time(std::shared_ptr<{aspn_lower}_{matrix}::AspnBase> parent, TypeTimestamp time);
 
-            TypeTimestamp convert_time(const AspnTypeTimestamp& time);
-            AspnTypeTimestamp convert_time(const TypeTimestamp& time);
+            TypeTimestamp convert_time(const {aspn_prefix}TypeTimestamp& time);
+            {aspn_prefix}TypeTimestamp convert_time(const TypeTimestamp& time);
 
             /**
             * Downcasts \p parent to the type specified by parent->message_type,
@@ -440,7 +755,8 @@ endif
             // This code is generated via firehose.
             // DO NOT hand edit code. Make any changes required using the firehose repo instead.
 
-            #include <{aspn_lower}/{matrix}/aspn_{matrix}.hpp>
+            #include "functions.hpp"
+            {includes}
 
             #include <memory>
             #include <stdexcept>
@@ -477,12 +793,12 @@ endif
                 }}
             }}
 
-            TypeTimestamp convert_time(const AspnTypeTimestamp& time) {{
+            TypeTimestamp convert_time(const {aspn_prefix}TypeTimestamp& time) {{
                 return time.elapsed_nsec;
             }}
 
-            AspnTypeTimestamp convert_time(const TypeTimestamp& time) {{
-                AspnTypeTimestamp out = {{time.get_elapsed_nsec()}};
+            {aspn_prefix}TypeTimestamp convert_time(const TypeTimestamp& time) {{
+                {aspn_prefix}TypeTimestamp out = {{time.get_elapsed_nsec()}};
                 return out;
             }}
 
@@ -511,7 +827,53 @@ endif
 
         """
 
+        declarations = '\n'.join(
+            f'class {class_name};' for class_name in self.class_names
+        )
         for generator in self.header_generators:
+            print(f"Generating fwd.hpp for {generator.directory}")
+            output_filepath = join(
+                self.output_folder, generator.directory, "fwd.hpp"
+            )
+            fwd_h = fwd_h_template.format(
+                matrix=generator.namespace,
+                aspn_lower=ASPN_PREFIX.lower(),
+                declarations=declarations,
+            )
+            format_and_write_to_file(fwd_h, output_filepath)
+
+            print(f"Generating functions.hpp for {generator.directory}")
+            output_filepath = join(
+                self.output_folder, generator.directory, "functions.hpp"
+            )
+            functions_h = functions_h_template.format(
+                matrix=generator.namespace,
+                aspn_lower=ASPN_PREFIX.lower(),
+                aspn_prefix=ASPN_PREFIX,
+            )
+            format_and_write_to_file(functions_h, output_filepath)
+
+            print(f"Generating views.hpp for {generator.directory}")
+            output_filepath = join(
+                self.output_folder, generator.directory, "views.hpp"
+            )
+            views_h = views_h_template.format(
+                matrix=generator.namespace,
+                aspn_lower=ASPN_PREFIX.lower(),
+                matrix_includes=generator.matrix_includes(),
+                aliases=generator.view_aliases(),
+            )
+            format_and_write_to_file(views_h, output_filepath)
+
+            print(f"Generating buffers.hpp for {generator.directory}")
+            output_filepath = join(
+                self.output_folder, generator.directory, "buffers.hpp"
+            )
+            buffers_h = buffers_h_template.format(
+                matrix=generator.namespace, aspn_lower=ASPN_PREFIX.lower()
+            )
+            format_and_write_to_file(buffers_h, output_filepath)
+
             print(f"Generating aspn_{generator.namespace}.hpp")
             output_filepath = join(
                 self.output_folder,
@@ -526,10 +888,7 @@ endif
                 for include in self.includes
             ]
             aspn_h = aspn_h_template.format(
-                matrix=generator.namespace,
-                aspn_lower=ASPN_PREFIX.lower(),
-                aspn_prefix=ASPN_PREFIX,
-                includes='\n'.join(includes),
+                aspn_lower=ASPN_PREFIX.lower(), includes='\n'.join(includes)
             )
             format_and_write_to_file(aspn_h, output_filepath)
 
@@ -540,6 +899,7 @@ endif
                 f"aspn_{generator.namespace}.cpp",
             )
             aspn_c = aspn_c_template.format(
+                includes='\n'.join(self.message_includes),
                 matrix=generator.namespace,
                 aspn_lower=ASPN_PREFIX.lower(),
                 aspn_prefix=ASPN_PREFIX,
@@ -571,25 +931,7 @@ endif
         {getters_setters}{extra_bindings};
         '''
 
-        if self.getters_setters != '':
-            inheritance = (
-                ', TypeHeader'
-                if self.class_name.startswith('Measurement')
-                or self.class_name.startswith('Metadata')
-                or self.class_name == 'Image'
-                else ''
-            )
-            self.bindings.append(
-                self.binding_template.format(
-                    class_name=self.class_name,
-                    types=','.join(self.types),
-                    getters_setters=self.getters_setters,
-                    inheritance=inheritance,
-                    extra_bindings=EXTRA_BINDINGS.get(self.class_name, ''),
-                )
-            )
-            self.types = []
-            self.getters_setters = ''
+        self._end_struct_bindings()
 
         self.struct_name = struct_name
         self.class_name = snake_to_pascal(struct_name)
@@ -641,9 +983,11 @@ endif
             """
 
             self.all_types += [current_type]
+            self.message_includes += [f'#include "{self.class_name}.hpp"']
 
         self.all_source_files += [f'{self.class_name}.cpp']
         self.includes += [f'#include "{self.class_name}.hpp"']
+        self.class_names += [self.class_name]
 
     def process_func_ptr_field_with_self(
         self,
@@ -683,16 +1027,16 @@ endif
             generator.process_data_pointer_field(
                 field_name, type_name, data_len, doc_string, deref, nullable
             )
+        if ASPN_PREFIX in type_name:
+            param_type = f'std::vector<{type_name.removeprefix(ASPN_PREFIX)}>'
+        else:
+            param_type = f'xt::pyarray<{type_name}>'
+        # Variable-length arrays also have an AspnBuffer overload
         self.getters_setters += f'''\
             .def("get_{field_name}", &{self.class_name}::get_{field_name})
-            .def("set_{field_name}", &{self.class_name}::set_{field_name})\
+            .def("set_{field_name}", py::overload_cast<const {param_type}&>(&{self.class_name}::set_{field_name}))\
                              '''
-        if ASPN_PREFIX in type_name:
-            self.types += [
-                f'std::vector<{type_name.removeprefix(ASPN_PREFIX)}>'
-            ]
-        else:
-            self.types += [f'xt::pyarray<{type_name}>']
+        self.types += [param_type]
 
     def process_matrix_field(
         self,
@@ -713,7 +1057,7 @@ endif
             )
         self.getters_setters += f'''\
             .def("get_{field_name}", &{self.class_name}::get_{field_name})
-            .def("set_{field_name}", &{self.class_name}::set_{field_name})
+            .def("set_{field_name}", py::overload_cast<const xt::pyarray<{type_name}>&>(&{self.class_name}::set_{field_name}))
                              '''
         self.types += [f'xt::pyarray<{type_name}>']
 
@@ -810,12 +1154,17 @@ endif
                 field_name, field_type_name, doc_string, nullable
             )
         if not is_length_field(field_name):
+            setter = f'&{self.class_name}::set_{field_name}'
+            if f'{ASPN_PREFIX}Type' in field_type_name:
+                field_type_name = field_type_name.removeprefix(ASPN_PREFIX)
+                # Nested types also have an rvalue overload
+                setter = (
+                    f'py::overload_cast<const {field_type_name}&>({setter})'
+                )
             self.getters_setters += f'''\
             .def("get_{field_name}", &{self.class_name}::get_{field_name})
-            .def("set_{field_name}", &{self.class_name}::set_{field_name})
+            .def("set_{field_name}", {setter})
                              '''
-            if f'{ASPN_PREFIX}Type' in field_type_name:
-                field_type_name = field_type_name.removeprefix(ASPN_PREFIX)
             self.types += [field_type_name]
 
     def process_class_docstring(self, doc_string: str, nullable: bool = False):
@@ -895,5 +1244,6 @@ endif
             generator.generate()
 
         self._generate_aspn_root_header()
-        self._generate_meson_build()
+        self._generate_pch_headers()
         self._generate_bindings()
+        self._generate_meson_build()
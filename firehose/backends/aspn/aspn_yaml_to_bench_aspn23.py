@@ -0,0 +1,322 @@
+from os.path import join
+from textwrap import dedent
+from typing import List
+from firehose.backends.aspn.aspn_yaml_to_c_source import (
+    AspnYamlToCSource,
+    Struct,
+)
+from firehose.backends.aspn.utils import ASPN_PREFIX, format_and_write_to_file
+
+ASPN_PREFIX_LOWER = ASPN_PREFIX.lower()
+
+
+class AspnYamlToBenchAspn23:
+    """
+    Generates benchmarks/bench_aspn23.c, which times the generated
+    constructors, copies and frees of every message type and counts the
+    allocations they make.
+
+    Instead of walking the ICD again, it reuses the field descriptors that
+    AspnYamlToCSource collected, so it must run after that generator.
+    """
+
+    def __init__(self, c_source_generator: AspnYamlToCSource):
+        self.c_source_generator = c_source_generator
+
+    def set_output_root_folder(self, output_root_folder: str):
+        self.output_folder = output_root_folder
+        # Expecting parent AspnCBackend to clear output folder
+
+    def _snake_name(self, struct: Struct) -> str:
+        return struct.fn_basename[len(ASPN_PREFIX_LOWER) + 1 :]
+
+    def _constructor_args(self, struct: Struct):
+        """
+        Returns the declarations of the locals holding the arguments of
+        {struct}_new(), the argument list, and the code releasing the locals.
+        Arrays and matrices get BENCH_LENGTH elements per dimension and
+        nested types are built with their own make_ function.
+        """
+        lengths = {
+            length for field in struct.fields for length in field.length_fields
+        }
+        structs_by_name = self.c_source_generator.structs_by_name
+        locals_ = []
+        args = []
+        cleanup = []
+        for field in struct.fields:
+            name = field.name
+            nested = structs_by_name.get(field.c_type)
+            if field.kind == 'scalar':
+                args.append(
+                    'BENCH_LENGTH' if name in lengths else f'({field.c_type})1'
+                )
+                continue
+            if field.kind == 'enum':
+                args.append(f'({field.c_type})0')
+                continue
+            args.append(name)
+            if field.kind == 'string':
+                locals_.append(f'char {name}[] = "benchmark";')
+            elif field.kind == 'type':
+                locals_.append(
+                    f'{field.c_type}* {name} = make_{self._snake_name(nested)}();'
+                )
+                cleanup.append(f'{nested.fn_basename}_free({name});')
+            else:
+                if field.kind == 'fixed_array':
+                    dims = f'[{field.length}]'
+                elif field.kind == 'fixed_matrix':
+                    dims = f'[{field.length}][{field.length_y}]'
+                elif field.kind == 'matrix':
+                    dims = '[BENCH_LENGTH * BENCH_LENGTH]'
+                else:
+                    dims = '[BENCH_LENGTH]'
+                locals_.append(f'{field.c_type} {name}{dims};')
+                if nested is None:
+                    locals_.append(f'memset({name}, 0, sizeof({name}));')
+                else:
+                    locals_.append(dedent(f"""
+                        {field.c_type}* {name}_element = make_{self._snake_name(nested)}();
+                        for (size_t ii = 0; ii < BENCH_LENGTH; ii++) {name}[ii] = *{name}_element;
+                        """))
+                    cleanup.append(
+                        f'{nested.fn_basename}_free({name}_element);'
+                    )
+        return '\n'.join(locals_), ', '.join(args), '\n'.join(cleanup)
+
+    def _make_function(self, struct: Struct) -> str:
+        locals_, args, cleanup = self._constructor_args(struct)
+        set_type = ''
+        if struct.is_message:
+            set_type = (
+                'if (out != NULL) ((AspnBase*)out)->message_type = '
+                f'ASPN_{self._snake_name(struct).upper()};'
+            )
+        return dedent(f"""
+            static {struct.struct_name}* make_{self._snake_name(struct)}(void) {{
+                {locals_}
+                {struct.struct_name}* out = {struct.fn_basename}_new({args});
+                {cleanup}
+                {set_type}
+                return out;
+            }}
+            """)
+
+    def _bench_function(self, struct: Struct) -> str:
+        locals_, args, cleanup = self._constructor_args(struct)
+        snake = self._snake_name(struct)
+        return dedent(f"""
+            static void bench_{snake}(size_t iterations, BenchResult* result) {{
+                {struct.struct_name}** messages = ({struct.struct_name}**)malloc(BENCH_BATCH * sizeof({struct.struct_name}*));
+                {struct.struct_name}* prototype = make_{snake}();
+                {locals_}
+                result->name = "ASPN_{snake.upper()}";
+                if (messages == NULL || prototype == NULL) exit(1);
+
+                for (size_t done = 0; done < iterations; done += BENCH_BATCH) {{
+                    size_t count = iterations - done < BENCH_BATCH ? iterations - done : BENCH_BATCH;
+                    double start;
+
+                    alloc_counts.allocations = 0;
+                    start = now_ns();
+                    for (size_t ii = 0; ii < count; ii++) messages[ii] = {struct.fn_basename}_new({args});
+                    result->new.ns += now_ns() - start;
+                    result->new.allocations += alloc_counts.allocations;
+
+                    alloc_counts.frees = 0;
+                    start = now_ns();
+                    for (size_t ii = 0; ii < count; ii++) {struct.fn_basename}_free(messages[ii]);
+                    result->free.ns += now_ns() - start;
+                    result->free.allocations += alloc_counts.frees;
+
+                    alloc_counts.allocations = 0;
+                    start = now_ns();
+                    for (size_t ii = 0; ii < count; ii++) messages[ii] = {struct.fn_basename}_copy(prototype);
+                    result->copy.ns += now_ns() - start;
+                    result->copy.allocations += alloc_counts.allocations;
+                    for (size_t ii = 0; ii < count; ii++) {struct.fn_basename}_free(messages[ii]);
+                }}
+                {cleanup}
+
+                bench_generic((AspnBase*)prototype, (AspnBase**)messages, iterations, result);
+                {struct.fn_basename}_free(prototype);
+                free(messages);
+            }}
+            """)
+
+    def make_functions(self) -> str:
+        """
+        Returns the static make_<struct>() functions building an instance of
+        every struct, for benchmarks that need populated messages.
+        """
+        structs = self.c_source_generator.structs
+        declarations = '\n'.join(
+            f'static {s.struct_name}* make_{self._snake_name(s)}(void);'
+            for s in structs
+        )
+        makers = '\n'.join(self._make_function(s) for s in structs)
+        return f'{declarations}\n\n{makers}'
+
+    def generate(self):
+        structs = self.c_source_generator.structs
+        messages: List[Struct] = [s for s in structs if s.is_message]
+
+        includes = '\n'.join(
+            f'#include <{ASPN_PREFIX_LOWER}/{s.struct_name[len(ASPN_PREFIX) :]}.h>'
+            for s in structs
+        )
+        benches = '\n'.join(self._bench_function(s) for s in messages)
+        calls = '\n'.join(
+            f'bench_{self._snake_name(s)}(iterations, &results[{ii}]);'
+            for ii, s in enumerate(messages)
+        )
+
+        c_file_contents = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            *
+            * Times the constructor, copy, copy_message, free and get_time of every ASPN
+            * message and counts the allocations each makes through the ASPN allocator.
+            * Results are printed as JSON, so they can be tracked over time:
+            *
+            *  bench_aspn23 [iterations]
+            */
+
+            #if !defined(_WIN32) && !defined(_POSIX_C_SOURCE)
+            #	define _POSIX_C_SOURCE 199309L
+            #endif
+
+            #include <stdio.h>
+            #include <stdlib.h>
+            #include <string.h>
+            #include <time.h>
+
+            #include <{ASPN_PREFIX_LOWER}/utils.h>
+            {includes}
+
+            #ifdef _WIN32
+            #	include <windows.h>
+            #endif
+
+            /* Elements per dimension of every array and matrix */
+            #define BENCH_LENGTH 16
+            /* Messages alive at once while timing new and free */
+            #define BENCH_BATCH 1024
+            #define BENCH_NUM_MESSAGES {len(messages)}
+
+            typedef struct {{
+                double ns;
+                double allocations;
+            }} BenchOp;
+
+            typedef struct {{
+                const char* name;
+                BenchOp new;
+                BenchOp copy;
+                BenchOp copy_message;
+                BenchOp free;
+                BenchOp get_time;
+                bool has_time;
+            }} BenchResult;
+
+            static struct {{
+                uint64_t allocations;
+                uint64_t frees;
+            }} alloc_counts;
+
+            static void* counting_alloc(size_t size, void* context) {{
+                (void)context;
+                alloc_counts.allocations++;
+                return malloc(size);
+            }}
+
+            static void counting_free(void* pointer, void* context) {{
+                (void)context;
+                if (pointer != NULL) alloc_counts.frees++;
+                free(pointer);
+            }}
+
+            static double now_ns(void) {{
+            #ifdef _WIN32
+                LARGE_INTEGER count, frequency;
+                QueryPerformanceCounter(&count);
+                QueryPerformanceFrequency(&frequency);
+                return 1e9 * (double)count.QuadPart / (double)frequency.QuadPart;
+            #else
+                struct timespec ts;
+                clock_gettime(CLOCK_MONOTONIC, &ts);
+                return 1e9 * (double)ts.tv_sec + (double)ts.tv_nsec;
+            #endif
+            }}
+
+            static void bench_generic(AspnBase* prototype, AspnBase** messages, size_t iterations, BenchResult* result) {{
+                const {ASPN_PREFIX}MessageTypeInfo* info = {ASPN_PREFIX_LOWER}_message_type_info(prototype->message_type);
+                volatile int64_t sink = 0;
+
+                for (size_t done = 0; done < iterations; done += BENCH_BATCH) {{
+                    size_t count = iterations - done < BENCH_BATCH ? iterations - done : BENCH_BATCH;
+                    double start;
+
+                    alloc_counts.allocations = 0;
+                    start = now_ns();
+                    for (size_t ii = 0; ii < count; ii++) messages[ii] = {ASPN_PREFIX_LOWER}_copy_message(prototype);
+                    result->copy_message.ns += now_ns() - start;
+                    result->copy_message.allocations += alloc_counts.allocations;
+                    for (size_t ii = 0; ii < count; ii++) {ASPN_PREFIX_LOWER}_free(messages[ii]);
+                }}
+
+                result->has_time = info != NULL && info->time_offset != {ASPN_PREFIX.upper()}_NO_TIME_OFFSET;
+                if (result->has_time) {{
+                    double start = now_ns();
+                    for (size_t ii = 0; ii < iterations; ii++) sink += {ASPN_PREFIX_LOWER}_get_time(prototype).elapsed_nsec;
+                    result->get_time.ns = now_ns() - start;
+                }}
+                (void)sink;
+            }}
+
+            static void print_op(const char* name, const BenchOp* op, size_t iterations) {{
+                printf("\\"%s_ns\\": %.2f, \\"%s_allocations\\": %.2f", name, op->ns / (double)iterations, name,
+                    op->allocations / (double)iterations);
+            }}
+
+            {self.make_functions()}
+
+            {benches}
+
+            int main(int argc, char** argv) {{
+                size_t iterations = argc > 1 ? (size_t)strtoul(argv[1], NULL, 10) : 100000;
+                static BenchResult results[BENCH_NUM_MESSAGES];
+                {ASPN_PREFIX}Allocator allocator = {{counting_alloc, counting_free, NULL}};
+                if (iterations == 0) iterations = 1;
+                {ASPN_PREFIX_LOWER}_set_allocator(&allocator);
+
+                {calls}
+
+                printf("{{\\"benchmark\\": \\"aspn23\\", \\"iterations\\": %zu, \\"results\\": [\\n", iterations);
+                for (size_t ii = 0; ii < BENCH_NUM_MESSAGES; ii++) {{
+                    const BenchResult* result = &results[ii];
+                    printf("  {{\\"message\\": \\"%s\\", ", result->name);
+                    print_op("new", &result->new, iterations);
+                    printf(", ");
+                    print_op("copy", &result->copy, iterations);
+                    printf(", ");
+                    print_op("copy_message", &result->copy_message, iterations);
+                    printf(", ");
+                    print_op("free", &result->free, iterations);
+                    if (result->has_time)
+                        printf(", \\"get_time_ns\\": %.2f", result->get_time.ns / (double)iterations);
+                    else
+                        printf(", \\"get_time_ns\\": null");
+                    printf("}}%s\\n", ii + 1 < BENCH_NUM_MESSAGES ? "," : "");
+                }}
+                printf("]}}\\n");
+
+                {ASPN_PREFIX_LOWER}_set_allocator(NULL);
+                return 0;
+            }}
+            """
+
+        output_filepath = join(self.output_folder, 'bench_aspn23.c')
+        format_and_write_to_file(c_file_contents, output_filepath)
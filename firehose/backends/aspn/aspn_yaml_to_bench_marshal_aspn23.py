@@ -0,0 +1,187 @@
+from os.path import join
+from textwrap import dedent
+from typing import List
+from firehose.backends.aspn.aspn_yaml_to_bench_aspn23 import (
+    AspnYamlToBenchAspn23,
+)
+from firehose.backends.aspn.aspn_yaml_to_c_source import (
+    AspnYamlToCSource,
+    Struct,
+)
+from firehose.backends.aspn.utils import (
+    ASPN_PREFIX,
+    format_and_write_to_file,
+    snake_to_pascal,
+)
+
+ASPN_PREFIX_LOWER = ASPN_PREFIX.lower()
+
+
+class AspnYamlToBenchMarshalAspn23:
+    """
+    Generates bench_marshal_aspn23.c, which compares the throughput of
+    sending every message through LCM (marshal to the LCM struct, then
+    encode) with the ASPN-C binary serialization, and the same for
+    receiving.
+
+    The messages are built with the make_ functions of bench_aspn23.c, from
+    the field descriptors collected by an AspnYamlToCSource.
+    """
+
+    def __init__(self, c_source_generator: AspnYamlToCSource):
+        self.c_source_generator = c_source_generator
+        self.make_generator = AspnYamlToBenchAspn23(c_source_generator)
+
+    def set_output_root_folder(self, output_root_folder: str):
+        self.output_folder = output_root_folder
+        # Expecting parent AspnCMarshalingBackend to clear output folder
+
+    def _bench_function(self, struct: Struct) -> str:
+        snake = struct.fn_basename[len(ASPN_PREFIX_LOWER) + 1 :]
+        lcm = f'aspn23_lcm_{snake}'
+        pascal = snake_to_pascal(snake)
+        return dedent(f"""
+            static void bench_{snake}(size_t iterations, BenchResult* result) {{
+                {struct.struct_name}* message = make_{snake}();
+                {lcm} lcm_msg;
+                uint8_t* buffer;
+                size_t size;
+                double start;
+                result->name = "ASPN_{snake.upper()}";
+                if (message == NULL) exit(1);
+
+                memset(&lcm_msg, 0, sizeof(lcm_msg));
+                marshal_{ASPN_PREFIX}{pascal}(&lcm_msg, message);
+                result->lcm_bytes = (size_t){lcm}_encoded_size(&lcm_msg);
+                {lcm}_decode_cleanup(&lcm_msg);
+                result->aspn_bytes = {struct.fn_basename}_serialized_size(message);
+                size = result->lcm_bytes > result->aspn_bytes ? result->lcm_bytes : result->aspn_bytes;
+                buffer = (uint8_t*)malloc(size);
+                if (buffer == NULL) exit(1);
+
+                start = now_ns();
+                for (size_t ii = 0; ii < iterations; ii++) {{
+                    marshal_{ASPN_PREFIX}{pascal}(&lcm_msg, message);
+                    {lcm}_encode(buffer, 0, (int)result->lcm_bytes, &lcm_msg);
+                    {lcm}_decode_cleanup(&lcm_msg);
+                }}
+                result->lcm_encode_ns = now_ns() - start;
+
+                start = now_ns();
+                for (size_t ii = 0; ii < iterations; ii++) {{
+                    {struct.struct_name}* out;
+                    {lcm}_decode(buffer, 0, (int)result->lcm_bytes, &lcm_msg);
+                    out = marshal_{lcm}(&lcm_msg);
+                    {lcm}_decode_cleanup(&lcm_msg);
+                    {struct.fn_basename}_free(out);
+                }}
+                result->lcm_decode_ns = now_ns() - start;
+
+                start = now_ns();
+                for (size_t ii = 0; ii < iterations; ii++) {struct.fn_basename}_serialize(message, buffer, size);
+                result->aspn_serialize_ns = now_ns() - start;
+
+                start = now_ns();
+                for (size_t ii = 0; ii < iterations; ii++)
+                    {ASPN_PREFIX_LOWER}_mem_free({struct.fn_basename}_deserialize(buffer, result->aspn_bytes, NULL));
+                result->aspn_deserialize_ns = now_ns() - start;
+
+                free(buffer);
+                {struct.fn_basename}_free(message);
+            }}
+            """)
+
+    def generate(self):
+        structs = self.c_source_generator.structs
+        messages: List[Struct] = [s for s in structs if s.is_message]
+        benches = '\n'.join(self._bench_function(s) for s in messages)
+        calls = '\n'.join(
+            f'bench_{s.fn_basename[len(ASPN_PREFIX_LOWER) + 1 :]}(iterations, &results[{ii}]);'
+            for ii, s in enumerate(messages)
+        )
+
+        c_file_contents = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            *
+            * Compares, for every ASPN message, the LCM path (marshal_*() into the LCM
+            * struct, then encode, and decode then marshal back) with the transport
+            * independent {ASPN_PREFIX_LOWER}_*_serialize() and {ASPN_PREFIX_LOWER}_*_deserialize().
+            * Results are printed as JSON, in nanoseconds and bytes per message:
+            *
+            *  bench_marshal_aspn23 [iterations]
+            */
+
+            #if !defined(_WIN32) && !defined(_POSIX_C_SOURCE)
+            #	define _POSIX_C_SOURCE 199309L
+            #endif
+
+            #include <stdio.h>
+            #include <stdlib.h>
+            #include <string.h>
+            #include <time.h>
+
+            #include <marshal_from_lcm.h>
+            #include <marshal_to_lcm.h>
+
+            #ifdef _WIN32
+            #	include <windows.h>
+            #endif
+
+            /* Elements per dimension of every array and matrix */
+            #define BENCH_LENGTH 16
+            #define BENCH_NUM_MESSAGES {len(messages)}
+
+            typedef struct {{
+                const char* name;
+                size_t lcm_bytes;
+                size_t aspn_bytes;
+                double lcm_encode_ns;
+                double lcm_decode_ns;
+                double aspn_serialize_ns;
+                double aspn_deserialize_ns;
+            }} BenchResult;
+
+            static double now_ns(void) {{
+            #ifdef _WIN32
+                LARGE_INTEGER count, frequency;
+                QueryPerformanceCounter(&count);
+                QueryPerformanceFrequency(&frequency);
+                return 1e9 * (double)count.QuadPart / (double)frequency.QuadPart;
+            #else
+                struct timespec ts;
+                clock_gettime(CLOCK_MONOTONIC, &ts);
+                return 1e9 * (double)ts.tv_sec + (double)ts.tv_nsec;
+            #endif
+            }}
+
+            {self.make_generator.make_functions()}
+
+            {benches}
+
+            int main(int argc, char** argv) {{
+                size_t iterations = argc > 1 ? (size_t)strtoul(argv[1], NULL, 10) : 100000;
+                static BenchResult results[BENCH_NUM_MESSAGES];
+                if (iterations == 0) iterations = 1;
+
+                {calls}
+
+                printf("{{\\"benchmark\\": \\"marshal_aspn23\\", \\"iterations\\": %zu, \\"results\\": [\\n", iterations);
+                for (size_t ii = 0; ii < BENCH_NUM_MESSAGES; ii++) {{
+                    const BenchResult* result = &results[ii];
+                    printf("  {{\\"message\\": \\"%s\\", \\"lcm_bytes\\": %zu, \\"aspn_bytes\\": %zu, ", result->name,
+                        result->lcm_bytes, result->aspn_bytes);
+                    printf("\\"lcm_encode_ns\\": %.2f, \\"lcm_decode_ns\\": %.2f, ", result->lcm_encode_ns / (double)iterations,
+                        result->lcm_decode_ns / (double)iterations);
+                    printf("\\"aspn_serialize_ns\\": %.2f, \\"aspn_deserialize_ns\\": %.2f}}%s\\n",
+                        result->aspn_serialize_ns / (double)iterations, result->aspn_deserialize_ns / (double)iterations,
+                        ii + 1 < BENCH_NUM_MESSAGES ? "," : "");
+                }}
+                printf("]}}\\n");
+                return 0;
+            }}
+            """
+
+        output_filepath = join(self.output_folder, 'bench_marshal_aspn23.c')
+        format_and_write_to_file(c_file_contents, output_filepath)
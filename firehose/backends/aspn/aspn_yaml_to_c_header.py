@@ -1,10 +1,11 @@
 from os.path import join
 from textwrap import dedent
-from typing import List, Union
+from typing import Dict, List, Set, Tuple, Union
 from firehose.backends import Backend
 from firehose.backends.aspn.utils import (
     ASPN_NULLABILITY_MACRO_END,
     ASPN_NULLABILITY_MACRO_START,
+    ASPN_NONNULL_MACRO,
     ASPN_NULLABLE_MACRO,
     ASPN_PREFIX,
     INDENT,
@@ -14,6 +15,26 @@ from firehose.backends.aspn.utils import (
     name_to_struct,
 )
 
+C_LAYOUTS = ('declaration', 'packed-order')
+# Size and alignment of the members of generated structs, assuming an LP64
+# target ('*' stands for any pointer). Scalars of any other type are enums.
+C_TYPE_SIZES = {
+    'bool': 1,
+    'char': 1,
+    'int8_t': 1,
+    'uint8_t': 1,
+    'int16_t': 2,
+    'uint16_t': 2,
+    'int32_t': 4,
+    'uint32_t': 4,
+    'int64_t': 8,
+    'uint64_t': 8,
+    'float': 4,
+    'double': 8,
+    '*': 8,
+}
+ENUM_SIZE = 4
+
 
 class Struct:
     def __init__(self, snake_case_struct_name: str):
@@ -25,6 +46,9 @@ class Struct:
         self.includes: List[str] = []
         self.struct_docstr: str = "<Missing C Docstring>"
         self.struct_fields_buf: List[str] = []
+        # (element C type, element count) of each entry of struct_fields_buf,
+        # used to lay out the struct with --c-layout packed-order
+        self.field_layouts: List[Tuple[str, int]] = []
         self.struct_name: str = name_to_struct(snake_case_struct_name)
         self.pointer_fields: List[str] = []
         self.nullability_macro_start: str = ''
@@ -45,41 +69,187 @@ class Struct:
             {{enum_defs}}
 
             {{struct_docstr}}
-            typedef struct {self.struct_name} {{{{
+            struct {self.struct_name} {{{{
             {{struct_fields}}
-            }}}} {self.struct_name};
+            }}}};
+
+            {{pod_define}}
 
             {self.struct_name}* {ASPN_NULLABLE_MACRO} {{fn_basename}}_new({{fn_params}});
 
             {self.struct_name}* {ASPN_NULLABLE_MACRO} {{fn_basename}}_copy({self.struct_name}*);
 
+            /**
+             * Deep copy src into an existing dst, reusing the arrays, matrices
+             * and strings dst already owns whenever they are large enough, and
+             * copying nested structs in place. Memory is only allocated, through
+             * the ASPN allocator, to grow a buffer, so repeatedly copying
+             * messages of the same shape into the same dst does not allocate.
+             *
+             * dst must have been created by {{fn_basename}}_new() or
+             * {{fn_basename}}_copy(), or be zero-initialized. Returns false if an
+             * allocation failed, in which case dst is incomplete but can still be
+             * freed.
+             */
+            bool {{fn_basename}}_copy_into({self.struct_name}* {ASPN_NONNULL_MACRO} dst, const {self.struct_name}* {ASPN_NONNULL_MACRO} src);
+
+            /**
+             * Compare two {self.struct_name} field by field, including the
+             * contents of arrays, matrices, strings and nested types. Floating
+             * point values compare as in C (NaN differs from everything), unless
+             * flags contains {ASPN_PREFIX.upper()}_EQUALS_NAN_EQUAL.
+             */
+            bool {{fn_basename}}_equals(const {self.struct_name}* {ASPN_NONNULL_MACRO} a, const {self.struct_name}* {ASPN_NONNULL_MACRO} b, unsigned flags);
+
+            /**
+             * 64-bit FNV-1a hash of the contents of a {self.struct_name}. The hash
+             * depends only on field values, with -0.0 hashed as 0.0 and every NaN
+             * alike, so it is stable across processes and consistent with
+             * {{fn_basename}}_equals(a, b, {ASPN_PREFIX.upper()}_EQUALS_NAN_EQUAL).
+             */
+            uint64_t {{fn_basename}}_hash(const {self.struct_name}* {ASPN_NONNULL_MACRO} self);
+
+            /* Feed the contents of self into a running hash, see {{fn_basename}}_hash(). */
+            uint64_t {{fn_basename}}_hash_update(uint64_t hash, const {self.struct_name}* {ASPN_NONNULL_MACRO} self);
+
+            /**
+             * Number of bytes {{fn_basename}}_serialize() writes for self: a
+             * {ASPN_PREFIX.upper()}_SERIAL_HEADER_SIZE byte frame header followed by the
+             * little-endian payload described in serialize.h.
+             */
+            size_t {{fn_basename}}_serialized_size(const {self.struct_name}* {ASPN_NONNULL_MACRO} self);
+
+            /**
+             * Encode self into buf, independently of any transport. Returns the
+             * number of bytes written, or 0 if len is less than
+             * {{fn_basename}}_serialized_size(self).
+             */
+            size_t {{fn_basename}}_serialize(const {self.struct_name}* {ASPN_NONNULL_MACRO} self, uint8_t* {ASPN_NONNULL_MACRO} buf, size_t len);
+
+            /**
+             * Decode a {self.struct_name} written by {{fn_basename}}_serialize().
+             * The struct and every array, matrix and string it owns are placed in
+             * a single block, like {{fn_basename}}_copy_contiguous(). The block
+             * comes from allocator, or from the ASPN allocator if allocator is
+             * NULL, and is released with a single allocator->free() or
+             * {ASPN_PREFIX.lower()}_mem_free() call.
+             *
+             * Returns NULL if buf is truncated or malformed, holds another type
+             * (by its frame tag or the message type in its header), or if the
+             * allocation failed.
+             */
+            {self.struct_name}* {ASPN_NULLABLE_MACRO} {{fn_basename}}_deserialize(const uint8_t* {ASPN_NONNULL_MACRO} buf, size_t len,
+                const {ASPN_PREFIX}Allocator* {ASPN_NULLABLE_MACRO} allocator);
+
+            /* The payload alone, used to serialize the structs nesting a {self.struct_name}. */
+            size_t {{fn_basename}}_serialized_payload_size(const {self.struct_name}* {ASPN_NONNULL_MACRO} self);
+            uint8_t* {{fn_basename}}_serialize_payload(const {self.struct_name}* {ASPN_NONNULL_MACRO} self, uint8_t* {ASPN_NONNULL_MACRO} cursor);
+            bool {{fn_basename}}_deserialize_payload({ASPN_PREFIX}Reader* {ASPN_NONNULL_MACRO} reader, {self.struct_name}* {ASPN_NONNULL_MACRO} dst,
+                unsigned char** {ASPN_NULLABLE_MACRO} block, size_t* {ASPN_NONNULL_MACRO} size);
+
+            /**
+             * Field names, types, offsets and dimensions of {self.struct_name},
+             * for generic code walking structs at runtime, see reflect.h.
+             */
+            extern const {ASPN_PREFIX}StructInfo {{fn_basename}}_struct_info;
+
             {{free_docstr}}
             void {{fn_basename}}_free(void* pointer);
             void {{fn_basename}}_free_members({self.struct_name}* self);
+            {{contiguous_decls}}
+            {{take_decls}}
+            {{batch_decls}}
+            {{view_decls}}
             {{nullability_macro_end}}
             #ifdef __cplusplus
             }}}}  // extern "C"
             #endif
         """)
 
+        self.pod_define = dedent(f"""
+            /**
+             * 1 if {self.struct_name} owns no heap memory, directly or through
+             * nested types. Such structs are copied by copying
+             * sizeof({self.struct_name}) bytes, and _copy() and _copy_into()
+             * do exactly that.
+             */
+            #define {{is_pod_macro}} {{is_pod}}
+        """)
+
         self.free_docstr_no_ptr = dedent(f"""\
-            free() all memory held by the given {self.struct_name},
-            including the struct itself.
+            Release all memory held by the given {self.struct_name},
+            including the struct itself, through the ASPN allocator (see
+            {ASPN_PREFIX.lower()}_set_allocator()).
+        """)
+
+        self.contiguous_decls = dedent(f"""
+            /**
+             * Same as {self.fn_basename}_new(), but the struct and every array,
+             * matrix and string it owns (including those of nested structs) are
+             * placed in a single block from the ASPN allocator, so the whole
+             * message is one allocation with good locality.
+             *
+             * Messages created this way must be released with
+             * {self.fn_basename}_free_contiguous(), never with
+             * {self.fn_basename}_free() or {self.fn_basename}_free_members().
+             * Their pointer fields must not be reassigned or freed individually.
+             */
+            {self.struct_name}* {ASPN_NULLABLE_MACRO} {self.fn_basename}_new_contiguous({{fn_params}});
+
+            /**
+             * Deep copy of any {self.struct_name} into a single block, see
+             * {self.fn_basename}_new_contiguous(). Release the copy with
+             * {self.fn_basename}_free_contiguous().
+             */
+            {self.struct_name}* {ASPN_NULLABLE_MACRO} {self.fn_basename}_copy_contiguous({self.struct_name}* input);
+
+            /**
+             * Release a message created by {self.fn_basename}_new_contiguous()
+             * or {self.fn_basename}_copy_contiguous() in a single call.
+             */
+            void {self.fn_basename}_free_contiguous(void* pointer);
         """)
 
         self.free_docstr_w_ptrs = dedent(f"""\
             {self.free_docstr_no_ptr}
             Pointer fields ({{pointer_field_str}}) will be freed using
-            free() if they are non-NULL. If any of these have been populated
-            using non-malloc'd memory, free them manually and set them to
-            NULL before calling this function.
+            {ASPN_PREFIX.lower()}_mem_free() if they are non-NULL. If any of
+            these have been populated using memory that was not obtained from
+            the ASPN allocator, free them manually and set them to NULL before
+            calling this function.
         """)
 
 
 class AspnYamlToCHeader(Backend):
-    def __init__(self):
+    """
+    Generates the header of each ASPN-C struct.
+
+    Parameters:
+    - c_layout (str): 'declaration' keeps the struct members in ICD order.
+      'packed-order' reorders them to minimize padding, keeping the first
+      member first since messages are accessed through their leading
+      header. Only the struct definitions change; constructor parameters
+      and every other generated interface keep ICD order.
+    """
+
+    def __init__(self, c_layout: str = 'declaration'):
+        if c_layout not in C_LAYOUTS:
+            raise ValueError(f'Unknown C struct layout {c_layout}')
+        self.c_layout = c_layout
         self.current_struct: Struct = None
         self.structs: List[Struct] = []
+        # Names of the structs that get *_contiguous functions, see
+        # AspnYamlToCSource.has_pointers(). All other structs are POD.
+        self.contiguous_structs: Set[str] = set()
+        # Declarations of the ownership-taking functions of each struct, see
+        # AspnYamlToCSource._generate_take_functions()
+        self.take_declarations: Dict[str, str] = {}
+        # Declarations of the structure-of-arrays batch of each message, see
+        # AspnYamlToCSource._generate_batch_functions()
+        self.batch_declarations: Dict[str, str] = {}
+        # Declarations of the serialized view of each struct, see
+        # AspnYamlToCSource._generate_view_functions()
+        self.view_declarations: Dict[str, str] = {}
 
     def set_output_root_folder(self, output_root_folder: str):
         self.output_folder = output_root_folder
@@ -94,8 +264,134 @@ class AspnYamlToCHeader(Backend):
         self.nullability_macro_start = f"\n{ASPN_NULLABILITY_MACRO_START}\n"
         self.nullability_macro_end = f"\n{ASPN_NULLABILITY_MACRO_END}\n"
 
+    def _member_layout(
+        self, field_layout: Tuple[str, int], orders: Dict[str, List[int]]
+    ) -> Tuple[int, int]:
+        """
+        Size and alignment of a struct member, laying out nested structs in
+        the given orders.
+        """
+        c_type, count = field_layout
+        if c_type in self.structs_by_name:
+            size, align = self._struct_layout(
+                self.structs_by_name[c_type], orders
+            )
+        else:
+            size = align = C_TYPE_SIZES.get(c_type, ENUM_SIZE)
+        return size * count, align
+
+    def _struct_layout(
+        self, struct: Struct, orders: Dict[str, List[int]], order=None
+    ) -> Tuple[int, int]:
+        """
+        sizeof() and alignment of the struct with its members in the given
+        order, or in orders[struct.struct_name].
+        """
+        if order is None:
+            order = orders[struct.struct_name]
+        offset, max_align = 0, 1
+        for index in order:
+            size, align = self._member_layout(
+                struct.field_layouts[index], orders
+            )
+            offset = -(-offset // align) * align + size
+            max_align = max(max_align, align)
+        return -(-offset // max_align) * max_align, max_align
+
+    def _payload_size(
+        self, struct: Struct, orders: Dict[str, List[int]]
+    ) -> int:
+        return sum(
+            self._member_layout(field_layout, orders)[0]
+            for field_layout in struct.field_layouts
+        )
+
+    def _packed_order(
+        self, struct: Struct, orders: Dict[str, List[int]]
+    ) -> List[int]:
+        """
+        The member order of the struct with the least padding: the ICD order,
+        or the members after the first sorted by decreasing or increasing
+        alignment. Ties keep the ICD order.
+        """
+        declared = list(range(len(struct.field_layouts)))
+        if not declared:
+            return declared
+
+        def alignment(index):
+            return self._member_layout(struct.field_layouts[index], orders)[1]
+
+        candidates = [declared]
+        for descending in (True, False):
+            rest = sorted(declared[1:], key=alignment, reverse=descending)
+            candidates.append(declared[:1] + rest)
+        return min(
+            candidates,
+            key=lambda order: self._struct_layout(struct, orders, order)[0],
+        )
+
+    def _generate_layout_report(
+        self,
+        declared_orders: Dict[str, List[int]],
+        orders: Dict[str, List[int]],
+    ):
+        rows = []
+        for struct in self.structs:
+            before, _ = self._struct_layout(struct, declared_orders)
+            after, _ = self._struct_layout(struct, orders)
+            rows.append(
+                f'| {struct.struct_name} | {before} '
+                f'| {before - self._payload_size(struct, declared_orders)} '
+                f'| {after} | {after - self._payload_size(struct, orders)} |'
+            )
+        report = dedent("""\
+            <!--
+            This file is generated via firehose.
+            DO NOT hand edit.  Make any changes required using the firehose repo instead.
+            -->
+
+            # ASPN-C struct layout
+
+            sizeof() and padding bytes of each struct with its members in ICD
+            order, and in the order generated with `--c-layout packed-order`,
+            for an LP64 target.
+
+            | Struct | sizeof (ICD order) | Padding (ICD order) | sizeof (packed) | Padding (packed) |
+            | --- | ---: | ---: | ---: | ---: |
+        """)
+        report += '\n'.join(rows) + '\n'
+        report_filename = join(
+            self.output_folder, '..', '..', 'struct_layout.md'
+        )
+        with open(report_filename, "w", encoding="utf-8") as f:
+            f.write(report)
+
     def generate(self) -> str:
         self.structs += [self.current_struct]
+        self.structs_by_name = {s.struct_name: s for s in self.structs}
+        declared_orders = {
+            s.struct_name: list(range(len(s.field_layouts)))
+            for s in self.structs
+        }
+        orders = declared_orders
+        if self.c_layout == 'packed-order':
+            # Nested structs are laid out before the structs holding them
+            orders = {}
+            while len(orders) < len(self.structs):
+                for struct in self.structs:
+                    nested = [
+                        c_type
+                        for c_type, _ in struct.field_layouts
+                        if c_type in self.structs_by_name
+                    ]
+                    if struct.struct_name not in orders and all(
+                        c_type in orders for c_type in nested
+                    ):
+                        orders[struct.struct_name] = self._packed_order(
+                            struct, orders
+                        )
+            self._generate_layout_report(declared_orders, orders)
+
         for struct in self.structs:
             free_docstr = struct.free_docstr_no_ptr
             if len(struct.pointer_fields):
@@ -111,11 +407,34 @@ class AspnYamlToCHeader(Backend):
                 struct_docstr=format_docstring(
                     struct.struct_docstr, indent=INDENT
                 ),
-                struct_fields=format_c_codegen_array(struct.struct_fields_buf),
+                struct_fields=format_c_codegen_array(
+                    [
+                        struct.struct_fields_buf[index]
+                        for index in orders[struct.struct_name]
+                    ]
+                ),
                 free_docstr=format_docstring(free_docstr),
                 includes='\n'.join(struct.includes),
                 fn_basename=struct.fn_basename,
                 fn_params=', '.join(struct.constructor_param_buf),
+                contiguous_decls=(
+                    struct.contiguous_decls.format(
+                        fn_params=', '.join(struct.constructor_param_buf)
+                    )
+                    if struct.struct_name in self.contiguous_structs
+                    else ''
+                ),
+                take_decls=self.take_declarations.get(struct.struct_name, ''),
+                pod_define=struct.pod_define.format(
+                    is_pod_macro=f'{struct.fn_basename.upper()}_IS_POD',
+                    is_pod=int(
+                        struct.struct_name not in self.contiguous_structs
+                    ),
+                ),
+                batch_decls=self.batch_declarations.get(
+                    struct.struct_name, ''
+                ),
+                view_decls=self.view_declarations.get(struct.struct_name, ''),
                 nullability_macro_start=struct.nullability_macro_start,
                 nullability_macro_end=struct.nullability_macro_end,
             )
@@ -151,7 +470,9 @@ class AspnYamlToCHeader(Backend):
         f_type = type_name
         if isinstance(data_len, int):
             f_name += f"[{data_len}]"
+            self.current_struct.field_layouts.append((type_name, data_len))
         elif isinstance(data_len, str):
+            self.current_struct.field_layouts.append(('*', 1))
             self.current_struct.pointer_fields.append(field_name)
             if nullable:
                 f_type = f"{type_name}* {ASPN_NULLABLE_MACRO}"
@@ -205,7 +526,10 @@ class AspnYamlToCHeader(Backend):
             pass
 
         field_str = f"{type_name} {field_name}[{x}][{y}]"
-        if isinstance(x, str) and isinstance(y, str):
+        if isinstance(x, int) and isinstance(y, int):
+            self.current_struct.field_layouts.append((type_name, x * y))
+        elif isinstance(x, str) and isinstance(y, str):
+            self.current_struct.field_layouts.append(('*', 1))
             if nullable:
                 self._set_nullability_macro()
                 field_str = f"{type_name}* {ASPN_NULLABLE_MACRO} {field_name}"
@@ -275,6 +599,10 @@ class AspnYamlToCHeader(Backend):
 
         docstr = format_docstring(doc_string, indent=INDENT)
         field_str = f"{field_type_name} {field_name}"
+        if field_type_name.endswith('*'):
+            self.current_struct.field_layouts.append(('*', 1))
+        else:
+            self.current_struct.field_layouts.append((field_type_name, 1))
 
         if field_type_name.startswith(f"{ASPN_PREFIX}Type"):
             # If one of the fields of the current struct is another ASPN
@@ -332,6 +660,7 @@ class AspnYamlToCHeader(Backend):
 
         docstr = format_docstring(doc_string, indent=INDENT)
         self.current_struct.constructor_param_buf.append(param_str)
+        self.current_struct.field_layouts.append((field_type_name, 1))
         self.current_struct.struct_fields_buf.append(
             f"{docstr}\n{INDENT}{param_str}"
         )
@@ -5,12 +5,127 @@ from typing import Any
 from firehose.backends import Backend
 from firehose.backends.aspn.utils import (
     ASPN_PREFIX,
+    ASPN_NONNULL_MACRO,
     ASPN_NULLABLE_MACRO,
     format_and_write_to_file,
     name_to_struct,
     pascal_to_snake,
 )
 
+ASPN_PREFIX_LOWER = ASPN_PREFIX.lower()
+MEM_ALLOC = f"{ASPN_PREFIX_LOWER}_mem_alloc"
+MEM_CALLOC = f"{ASPN_PREFIX_LOWER}_mem_calloc"
+MEM_FREE = f"{ASPN_PREFIX_LOWER}_mem_free"
+ALIGN_UP = f"{ASPN_PREFIX.upper()}_ALIGN_UP"
+NAN_EQUAL = f"{ASPN_PREFIX.upper()}_EQUALS_NAN_EQUAL"
+FLOAT_TYPES = ('double', 'float')
+SERIAL_HEADER_SIZE = f"{ASPN_PREFIX.upper()}_SERIAL_HEADER_SIZE"
+# Types written to the serialized form as they are in memory (little-endian).
+# bool is written as a uint8_t and every other scalar type (the enums) as an
+# int32_t, see serialize.h.
+SERIAL_NATIVE_TYPES = (
+    'char',
+    'int8_t',
+    'uint8_t',
+    'int16_t',
+    'uint16_t',
+    'int32_t',
+    'uint32_t',
+    'int64_t',
+    'uint64_t',
+    'float',
+    'double',
+)
+# Element type codes of the reflection tables, see reflect.h. Scalars of any
+# other type are enums, and nested types are structs.
+REFLECT_TYPES = {
+    'bool': 'BOOL',
+    'char': 'CHAR',
+    'int8_t': 'INT8',
+    'uint8_t': 'UINT8',
+    'int16_t': 'INT16',
+    'uint16_t': 'UINT16',
+    'int32_t': 'INT32',
+    'uint32_t': 'UINT32',
+    'int64_t': 'INT64',
+    'uint64_t': 'UINT64',
+    'float': 'FLOAT',
+    'double': 'DOUBLE',
+}
+REFLECT_SHAPES = {
+    'scalar': 'SCALAR',
+    'enum': 'SCALAR',
+    'type': 'SCALAR',
+    'fixed_array': 'FIXED_ARRAY',
+    'fixed_matrix': 'FIXED_MATRIX',
+    'array': 'ARRAY',
+    'matrix': 'MATRIX',
+    'string': 'STRING',
+}
+NO_FIELD = f"{ASPN_PREFIX.upper()}_NO_FIELD"
+
+
+class Field:
+    """
+    Describes one field of a generated struct, for code that has to walk all
+    fields of a struct rather than emit code field by field.
+
+    Parameters:
+    - name (str): The field name.
+    - kind (str): One of 'scalar', 'enum', 'fixed_array', 'fixed_matrix',
+      'type', 'array', 'matrix' or 'string'.
+    - c_type (str): The C type of the field, or of its elements.
+    - length (Union[str, int]): The fixed length, or the name of the length
+      field, of an array or the rows of a matrix.
+    - length_y (Union[str, int]): The columns of a matrix.
+    - condition (str): Name of a bool field that must be true for a nested
+      type to be valid.
+    - init (str): Code that shallow-copies the constructor parameter of the
+      field into self.
+    - free (str): Code that releases the memory owned by a pointer field.
+    - nullable (bool): Whether the field is optional in the ICD.
+    - enum_values (List[str]): The values of an enum field.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        c_type: str,
+        length: Union[str, int] = None,
+        length_y: Union[str, int] = None,
+        condition: str = None,
+        init: str = '',
+        free: str = '',
+        nullable: bool = False,
+        enum_values: List[str] = None,
+    ):
+        self.name = name
+        self.kind = kind
+        self.c_type = c_type
+        self.length = length
+        self.length_y = length_y
+        self.condition = condition
+        self.init = init
+        self.free = free
+        self.nullable = nullable
+        self.enum_values = enum_values or []
+
+    @property
+    def is_pointer(self) -> bool:
+        return self.kind in ('array', 'matrix', 'string')
+
+    @property
+    def length_fields(self) -> List[str]:
+        """
+        Names of the fields holding the dimensions of an array or matrix.
+        """
+        if self.kind == 'array':
+            return [self.length]
+        if self.kind == 'matrix':
+            return list(dict.fromkeys([self.length, self.length_y]))
+        return []
+
 
 class Struct:
     def __init__(self, snake_case_struct_name: str):
@@ -19,15 +134,52 @@ class Struct:
         self.fn_basename: str = (
             f"{ASPN_PREFIX}_{snake_case_struct_name}".lower()
         )
+        self.is_message: bool = (
+            snake_case_struct_name.startswith('measurement')
+            or snake_case_struct_name.startswith('metadata')
+            or snake_case_struct_name == 'image'
+        )
         self.constructor_param_buf: List[str] = []
-        self.new_call_prep: List[str] = []
-        self.new_call_params: List[str] = []
-        self.new_call_cleanup: List[str] = []
         self.constructor_body_buf: List[str] = [
-            f"{self.struct_name}* self = (struct {self.struct_name}*)malloc(sizeof({self.struct_name}));"
+            f"{self.struct_name}* self = (struct {self.struct_name}*){MEM_ALLOC}(sizeof({self.struct_name}));"
             "if (NULL == self) return NULL;"
         ]
         self.free_pointer_fields_buf: List[str] = []
+        self.fields: List[Field] = []
+        # Ownership-taking functions, filled in by
+        # AspnYamlToCSource._generate_take_functions()
+        self.take_functions: List[str] = []
+        self.take_definitions: str = ''
+        self.take_declarations: str = ''
+        # Structure-of-arrays batch type and functions, filled in by
+        # AspnYamlToCSource._generate_batch_functions()
+        self.batch_functions: List[str] = []
+        self.batch_definitions: str = ''
+        self.batch_declarations: str = ''
+        # Read-only view over the serialized form, filled in by
+        # AspnYamlToCSource._generate_view_functions()
+        self.view_functions: List[str] = []
+        self.view_definitions: str = ''
+        self.view_declarations: str = ''
+        self.copy_body = dedent(f"""
+            {self.struct_name}* out = ({self.struct_name}*){MEM_CALLOC}(1, sizeof({self.struct_name}));
+            if (NULL == out) return NULL;
+            if (!{self.fn_basename}_copy_into(out, input)) {{
+                {self.fn_basename}_free(out);
+                return NULL;
+            }}
+            return out;
+        """)
+        # Structs owning no heap memory are copied with a single memcpy
+        self.pod_copy_body = dedent(f"""
+            {self.struct_name}* out = ({self.struct_name}*){MEM_ALLOC}(sizeof({self.struct_name}));
+            if (NULL == out) return NULL;
+            memcpy(out, input, sizeof({self.struct_name}));
+            return out;
+        """)
+        self.pod_copy_into_body = dedent(f"""
+            if (dst != src) memcpy(dst, src, sizeof({self.struct_name}));
+        """)
         self.header_template = dedent(f"""
             /*
              * This code is generated via firehose.
@@ -42,9 +194,92 @@ class Struct:
             }}}}
 
             {self.struct_name}* {ASPN_NULLABLE_MACRO} {self.fn_basename}_copy({self.struct_name}* input) {{{{
-                {{new_call_prep}}
-                {self.struct_name}* out = {self.fn_basename}_new({{new_call_params}});
-                {{new_call_cleanup}}
+                {{copy_body}}
+            }}}}
+
+            bool {self.fn_basename}_copy_into({self.struct_name}* {ASPN_NONNULL_MACRO} dst, const {self.struct_name}* {ASPN_NONNULL_MACRO} src) {{{{
+                {{copy_into_body}}
+                return true;
+            }}}}
+
+            bool {self.fn_basename}_equals(const {self.struct_name}* {ASPN_NONNULL_MACRO} a, const {self.struct_name}* {ASPN_NONNULL_MACRO} b, unsigned flags) {{{{
+                (void)flags;
+                if (a == b) return true;
+                {{equals_body}}
+                return true;
+            }}}}
+
+            uint64_t {self.fn_basename}_hash_update(uint64_t hash, const {self.struct_name}* {ASPN_NONNULL_MACRO} self) {{{{
+                {{hash_body}}
+                return hash;
+            }}}}
+
+            uint64_t {self.fn_basename}_hash(const {self.struct_name}* {ASPN_NONNULL_MACRO} self) {{{{
+                return {self.fn_basename}_hash_update({ASPN_PREFIX.upper()}_HASH_INIT, self);
+            }}}}
+
+            size_t {self.fn_basename}_serialized_payload_size(const {self.struct_name}* {ASPN_NONNULL_MACRO} self) {{{{
+                size_t size = 0;
+                (void)self;
+                {{serialized_size_body}}
+                return size;
+            }}}}
+
+            uint8_t* {self.fn_basename}_serialize_payload(const {self.struct_name}* {ASPN_NONNULL_MACRO} self, uint8_t* {ASPN_NONNULL_MACRO} cursor) {{{{
+                {{serialize_body}}
+                return cursor;
+            }}}}
+
+            bool {self.fn_basename}_deserialize_payload({ASPN_PREFIX}Reader* {ASPN_NONNULL_MACRO} reader, {self.struct_name}* {ASPN_NONNULL_MACRO} dst,
+                unsigned char** {ASPN_NULLABLE_MACRO} block, size_t* {ASPN_NONNULL_MACRO} size) {{{{
+                (void)block;
+                (void)size;
+                {{deserialize_body}}
+                return true;
+            }}}}
+
+            size_t {self.fn_basename}_serialized_size(const {self.struct_name}* {ASPN_NONNULL_MACRO} self) {{{{
+                return {SERIAL_HEADER_SIZE} + {self.fn_basename}_serialized_payload_size(self);
+            }}}}
+
+            size_t {self.fn_basename}_serialize(const {self.struct_name}* {ASPN_NONNULL_MACRO} self, uint8_t* {ASPN_NONNULL_MACRO} buf, size_t len) {{{{
+                size_t payload_size = {self.fn_basename}_serialized_payload_size(self);
+                if (payload_size > UINT32_MAX || len < {SERIAL_HEADER_SIZE} + payload_size) return 0;
+                {self.fn_basename}_serialize_payload(
+                    self, {ASPN_PREFIX_LOWER}_write_serial_header(buf, (uint16_t){{serial_tag}}, (uint32_t)payload_size));
+                return {SERIAL_HEADER_SIZE} + payload_size;
+            }}}}
+
+            {self.struct_name}* {ASPN_NULLABLE_MACRO} {self.fn_basename}_deserialize(const uint8_t* {ASPN_NONNULL_MACRO} buf, size_t len,
+                const {ASPN_PREFIX}Allocator* {ASPN_NULLABLE_MACRO} allocator) {{{{
+                {ASPN_PREFIX}Reader reader;
+                const uint8_t* payload;
+                uint16_t type;
+                uint32_t payload_size;
+                {self.struct_name} scratch;
+                size_t size = {ALIGN_UP}(sizeof({self.struct_name}));
+                {self.struct_name}* out;
+                unsigned char* block;
+                if (NULL == buf) return NULL;
+
+                /* Validate the input and measure the block on a first pass, then decode into the block */
+                reader.cursor = buf;
+                reader.end = buf + len;
+                if (!{ASPN_PREFIX_LOWER}_read_serial_header(&reader, &type, &payload_size)) return NULL;
+                if (type != (uint16_t){{serial_tag}}) return NULL;
+                payload = reader.cursor;
+                if (!{self.fn_basename}_deserialize_payload(&reader, &scratch, NULL, &size)) return NULL;
+                if (reader.cursor != reader.end) return NULL;
+                {{message_type_check}}
+
+                if (allocator != NULL)
+                    out = ({self.struct_name}*)allocator->alloc(size, allocator->context);
+                else
+                    out = ({self.struct_name}*){MEM_ALLOC}(size);
+                if (NULL == out) return NULL;
+                block = (unsigned char*)out + {ALIGN_UP}(sizeof({self.struct_name}));
+                reader.cursor = payload;
+                {self.fn_basename}_deserialize_payload(&reader, out, &block, &size);
                 return out;
             }}}}
 
@@ -52,7 +287,7 @@ class Struct:
                 {self.struct_name}* self = ({self.struct_name}*)pointer;
                 if (NULL == self) return;
                 {self.fn_basename}_free_members(self);
-                free(self);
+                {MEM_FREE}(self);
             }}}}
 
             void {self.fn_basename}_free_members({self.struct_name}* self) {{{{
@@ -61,11 +296,38 @@ class Struct:
             }}}}
         """)
 
-        self.free_ptr_field_template = dedent("""
-            if (self->{field} != NULL) {{
-                free(self->{field});
-                self->{field} = NULL;
-            }}
+        self.contiguous_template = dedent(f"""
+            {self.struct_name}* {ASPN_NULLABLE_MACRO} {self.fn_basename}_new_contiguous({{constructor_params}}) {{{{
+                {self.struct_name} fields;
+                {self.struct_name}* self = &fields;
+                {{contiguous_init}}
+                return {self.fn_basename}_copy_contiguous(self);
+            }}}}
+
+            {self.struct_name}* {ASPN_NULLABLE_MACRO} {self.fn_basename}_copy_contiguous({self.struct_name}* input) {{{{
+                size_t size = {ALIGN_UP}(sizeof({self.struct_name}));
+                {self.struct_name}* out;
+                unsigned char* cursor;
+                if (NULL == input) return NULL;
+                {{contiguous_size}}
+                out = ({self.struct_name}*){MEM_ALLOC}(size);
+                if (NULL == out) return NULL;
+                *out = *input;
+                cursor = (unsigned char*)out + {ALIGN_UP}(sizeof({self.struct_name}));
+                {{contiguous_place}}
+                return out;
+            }}}}
+
+            void {self.fn_basename}_free_contiguous(void* pointer) {{{{
+                {MEM_FREE}(pointer);
+            }}}}
+        """)
+
+        self.free_ptr_field_template = dedent(f"""
+            if (self->{{field}} != NULL) {{{{
+                {MEM_FREE}(self->{{field}});
+                self->{{field}} = NULL;
+            }}}}
         """)
 
 
@@ -90,12 +352,23 @@ class AspnYamlToCSource(Backend):
         arr_type: str,
         nullable: bool = False,
     ):
-        self.current_struct.constructor_body_buf.append(dedent(f"""
+        init = dedent(f"""
             if ({arr_name} != NULL)
                     memcpy(self->{arr_name}, {arr_name}, {arr_len} * sizeof({arr_type}));
             else
                 for (size_t ii = 0; ii < {arr_len}; ii++) self->{arr_name}[ii] = NAN;
-        """))
+        """)
+        self.current_struct.constructor_body_buf.append(init)
+        self.current_struct.fields.append(
+            Field(
+                arr_name,
+                'fixed_array',
+                arr_type,
+                arr_len,
+                init=init,
+                nullable=nullable,
+            )
+        )
 
     def _process_array_ptr_init(
         self,
@@ -104,7 +377,7 @@ class AspnYamlToCSource(Backend):
         arr_type: str,
         nullable: bool = False,
     ):
-        copy_array = f'self->{arr_name} = ({arr_type}*)calloc({array_len_ptr_name}, sizeof({arr_type}));'
+        copy_array = f'self->{arr_name} = ({arr_type}*){MEM_CALLOC}({array_len_ptr_name}, sizeof({arr_type}));'
         if arr_type.startswith(f"{ASPN_PREFIX}Type"):
             basename = pascal_to_snake(arr_type)
             copy_array = f'''
@@ -112,26 +385,38 @@ class AspnYamlToCSource(Backend):
             for (size_t ii = 0; ii < {array_len_ptr_name}; ii++) {{
                 {arr_type}* pointer = {basename}_copy(&{arr_name}[ii]);
                 self->{arr_name}[ii] = *pointer;
-                free(pointer);
+                {MEM_FREE}(pointer);
             }}
             '''
-            self.current_struct.free_pointer_fields_buf.append(f'''
+            free_array = f'''
                 if (self->{arr_name} != NULL && self->{array_len_ptr_name} !=0) {{
                     for (size_t ii = 0; ii < self->{array_len_ptr_name}; ii++)
 			            {basename}_free_members(&self->{arr_name}[ii]);
-                    free(self->{arr_name});
+                    {MEM_FREE}(self->{arr_name});
                 }}
-                ''')
+                '''
         else:
-            self.current_struct.free_pointer_fields_buf.append(f'''
+            free_array = f'''
                 if (self->{arr_name} != NULL && self->{array_len_ptr_name} !=0) {{
-                    free(self->{arr_name});
+                    {MEM_FREE}(self->{arr_name});
                 }}
-                ''')
+                '''
             copy_array = f'''
             {copy_array}
             memcpy(self->{arr_name}, {arr_name}, sizeof({arr_type}) * {array_len_ptr_name});
             '''
+        self.current_struct.fields.append(
+            Field(
+                arr_name,
+                'array',
+                arr_type,
+                array_len_ptr_name,
+                init=f'self->{arr_name} = {arr_name};',
+                free=free_array,
+                nullable=nullable,
+            )
+        )
+        self.current_struct.free_pointer_fields_buf.append(free_array)
         self.current_struct.constructor_body_buf.append(dedent(f"""
             self->{arr_name} = NULL;
             if ({arr_name} != NULL && {array_len_ptr_name} !=0) {{
@@ -162,7 +447,7 @@ class AspnYamlToCSource(Backend):
             if ({mat_name} != NULL && {mat_ptr_x} != 0 && {mat_ptr_y} != 0) {{
                 {mat_name}_elements = {mat_ptr_x} * {mat_ptr_y};
                 if ({mat_name}_elements > 0) {{
-                    self->{mat_name} = ({arr_type}*)calloc({mat_name}_elements, sizeof({arr_type}));
+                    self->{mat_name} = ({arr_type}*){MEM_CALLOC}({mat_name}_elements, sizeof({arr_type}));
                     memcpy(self->{mat_name}, {mat_name}, {mat_name}_elements * sizeof({arr_type}));
                 }} else {{
                     fprintf(stderr, "An error occurred: (%s * %s) defines the row and column lengths of '%s' and both must be a positive integer", "{mat_ptr_x}", "{mat_ptr_y}", "{mat_name}");
@@ -172,7 +457,19 @@ class AspnYamlToCSource(Backend):
             }}
         """))
         self.current_struct.free_pointer_fields_buf.append(
-            f'free(self->{mat_name});'
+            f'{MEM_FREE}(self->{mat_name});'
+        )
+        self.current_struct.fields.append(
+            Field(
+                mat_name,
+                'matrix',
+                arr_type,
+                mat_ptr_x,
+                mat_ptr_y,
+                init=f'self->{mat_name} = {mat_name};',
+                free=f'{MEM_FREE}(self->{mat_name});',
+                nullable=nullable,
+            )
         )
 
     def _process_const_size_matrix_init(
@@ -186,33 +483,1402 @@ class AspnYamlToCSource(Backend):
         total_size = mat_len_x * mat_len_y
         if total_size <= 0:
             raise ValueError('X and Y must both be positive integers!')
-        self.current_struct.constructor_body_buf.append(dedent(f"""
+        init = dedent(f"""
             if ({mat_name} != NULL)
                 memcpy(self->{mat_name}, {mat_name}, {total_size} * sizeof({mat_type}));
             else
                 for (size_t ii = 0; ii < {mat_len_x}; ii++)
                     for (size_t jj = 0; jj < {mat_len_y}; jj++)
                         self->{mat_name}[ii][jj] = NAN;
-        """))
+        """)
+        self.current_struct.constructor_body_buf.append(init)
+        self.current_struct.fields.append(
+            Field(
+                mat_name,
+                'fixed_matrix',
+                mat_type,
+                mat_len_x,
+                mat_len_y,
+                init=init,
+                nullable=nullable,
+            )
+        )
+
+    def collect_structs(self):
+        """
+        Closes the last struct and indexes all structs by name. Called by
+        generate(), and by backends that only reuse the field descriptors.
+        """
+        self.structs += [self.current_struct]
+        self.structs_by_name = {s.struct_name: s for s in self.structs}
 
     def generate(self) -> str:
         # TODO- sort the struct params and "new" function params so they match and are in
         # an order that makes sense.
-        self.structs += [self.current_struct]
+        self.collect_structs()
         for struct in self.structs:
+            if self.has_pointers(struct):
+                copy_body = struct.copy_body
+                copy_into_body = '\n'.join(self._copy_into_code(struct))
+            else:
+                copy_body = struct.pod_copy_body
+                copy_into_body = struct.pod_copy_into_body
             c_file_contents = struct.header_template.format(
                 constructor_body='\n'.join(struct.constructor_body_buf),
                 constructor_params=', '.join(struct.constructor_param_buf),
-                new_call_prep='\n'.join(struct.new_call_prep),
-                new_call_params=', '.join(struct.new_call_params),
-                new_call_cleanup='\n'.join(struct.new_call_cleanup),
+                copy_body=copy_body,
+                copy_into_body=copy_into_body,
+                equals_body='\n'.join(self._equals_code(struct)),
+                hash_body='\n'.join(self._hash_code(struct)),
+                serialized_size_body='\n'.join(
+                    self._serialized_size_code(struct)
+                ),
+                serialize_body='\n'.join(self._serialize_code(struct)),
+                deserialize_body='\n'.join(self._deserialize_code(struct)),
+                serial_tag=self.serial_tag(struct),
+                message_type_check=self._message_type_check(struct),
                 free_pointer_fields='\n'.join(struct.free_pointer_fields_buf),
             )
+            self._generate_take_functions(struct)
+            c_file_contents += struct.take_definitions
+            self._generate_batch_functions(struct)
+            c_file_contents += struct.batch_definitions
+            self._generate_view_functions(struct)
+            c_file_contents += struct.view_definitions
+            c_file_contents += self._struct_info_code(struct)
+            if self.has_pointers(struct):
+                c_file_contents += struct.contiguous_template.format(
+                    constructor_params=', '.join(struct.constructor_param_buf),
+                    contiguous_init='\n'.join(f.init for f in struct.fields),
+                    contiguous_size='\n'.join(
+                        self._contiguous_size_code(struct, 'input->')
+                    ),
+                    contiguous_place='\n'.join(
+                        self._contiguous_place_code(struct, 'out->', 'input->')
+                    ),
+                )
 
             basename = struct.struct_name.replace(f"{ASPN_PREFIX}", "")
             c_output_filename = join(self.output_folder, f"{basename}.c")
             format_and_write_to_file(c_file_contents, c_output_filename)
 
+    def _copy_into_code(self, struct: Struct) -> List[str]:
+        """
+        Returns the body of _copy_into(). The fixed-size part of src is copied
+        with one memcpy, keeping the buffers and nested structs owning memory
+        that dst already had. Buffers of dst are then reused when they hold at
+        least as many elements as src needs, which is judged from the lengths
+        dst had before the copy, and nested structs are copied in place with
+        their own _copy_into().
+        """
+        code = ['if (dst == src) return true;']
+        old_lengths = []
+        for field in struct.fields:
+            for length in field.length_fields:
+                if length not in old_lengths:
+                    old_lengths.append(length)
+                    code.append(f'size_t old_{length} = dst->{length};')
+            if field.condition is not None and self._nested_with_pointers(
+                field
+            ):
+                code.append(
+                    f'bool old_{field.condition} = dst->{field.condition};'
+                )
+
+        owned = [
+            field
+            for field in struct.fields
+            if field.is_pointer or self._nested_with_pointers(field)
+        ]
+        for field in owned:
+            pointer = '*' if field.is_pointer else ''
+            code.append(
+                f'{field.c_type}{pointer} kept_{field.name} = dst->{field.name};'
+            )
+        code.append('memcpy(dst, src, sizeof(*dst));')
+        for field in owned:
+            code.append(f'dst->{field.name} = kept_{field.name};')
+
+        for field in owned:
+            name = field.name
+            nested = self._nested_with_pointers(field)
+            if field.kind == 'type':
+                copy = f"""
+                    if (!{nested.fn_basename}_copy_into(&dst->{name}, &src->{name})) return false;
+                    """
+                if field.condition is None:
+                    code.append(copy)
+                else:
+                    code.append(f"""
+                        if (src->{field.condition}) {{
+                            if (!old_{field.condition}) memset(&dst->{name}, 0, sizeof(dst->{name}));
+                            {copy}
+                        }} else if (old_{field.condition}) {{
+                            {nested.fn_basename}_free_members(&dst->{name});
+                        }}
+                        """)
+            elif field.kind == 'string':
+                code.append(f"""
+                    if (src->{name} == NULL) {{
+                        {MEM_FREE}(dst->{name});
+                        dst->{name} = NULL;
+                    }} else {{
+                        size_t len = strlen(src->{name}) + 1;
+                        if (dst->{name} == NULL || strlen(dst->{name}) + 1 < len) {{
+                            {MEM_FREE}(dst->{name});
+                            dst->{name} = (char*){MEM_ALLOC}(len);
+                            if (dst->{name} == NULL) return false;
+                        }}
+                        memcpy(dst->{name}, src->{name}, len);
+                    }}
+                    """)
+            elif nested is None:
+                # Arrays and matrices of plain values
+                if field.kind == 'matrix':
+                    count = (
+                        f'(size_t)src->{field.length} * src->{field.length_y}'
+                    )
+                    old_count = f'old_{field.length} * old_{field.length_y}'
+                    empty = f'src->{field.length} == 0 || src->{field.length_y} == 0'
+                else:
+                    count = f'(size_t)src->{field.length}'
+                    old_count = f'old_{field.length}'
+                    empty = f'src->{field.length} == 0'
+                code.append(f"""
+                    if (src->{name} == NULL || {empty}) {{
+                        {MEM_FREE}(dst->{name});
+                        dst->{name} = NULL;
+                    }} else {{
+                        if (dst->{name} == NULL || {old_count} < {count}) {{
+                            {MEM_FREE}(dst->{name});
+                            dst->{name} = ({field.c_type}*){MEM_ALLOC}({count} * sizeof({field.c_type}));
+                            if (dst->{name} == NULL) return false;
+                        }}
+                        memcpy(dst->{name}, src->{name}, {count} * sizeof({field.c_type}));
+                    }}
+                    """)
+            else:
+                # Arrays of structs owning memory: elements beyond the new
+                # length are released, and growing moves the existing
+                # elements so their buffers are reused too
+                length = field.length
+                free_old = f"""
+                    if (dst->{name} != NULL) {{
+                        for (size_t ii = 0; ii < old_{length}; ii++)
+                            {nested.fn_basename}_free_members(&dst->{name}[ii]);
+                        {MEM_FREE}(dst->{name});
+                    }}
+                    dst->{name} = NULL;
+                    """
+                code.append(f"""
+                    if (src->{name} == NULL || src->{length} == 0) {{
+                        {free_old}
+                    }} else {{
+                        if (dst->{name} == NULL || old_{length} < src->{length}) {{
+                            {field.c_type}* grown = ({field.c_type}*){MEM_CALLOC}(src->{length}, sizeof({field.c_type}));
+                            if (grown == NULL) {{
+                                {free_old}
+                                return false;
+                            }}
+                            if (dst->{name} != NULL) {{
+                                memcpy(grown, dst->{name}, old_{length} * sizeof({field.c_type}));
+                                {MEM_FREE}(dst->{name});
+                            }}
+                            dst->{name} = grown;
+                        }} else {{
+                            for (size_t ii = src->{length}; ii < old_{length}; ii++)
+                                {nested.fn_basename}_free_members(&dst->{name}[ii]);
+                        }}
+                        for (size_t ii = 0; ii < src->{length}; ii++)
+                            if (!{nested.fn_basename}_copy_into(&dst->{name}[ii], &src->{name}[ii])) return false;
+                    }}
+                    """)
+        return [dedent(snippet).strip() for snippet in code]
+
+    def _element_equals(self, field: Field, a: str, b: str) -> str:
+        """
+        Returns a C expression that is true if the values or elements a and b
+        of a field are equal.
+        """
+        nested = self.structs_by_name.get(field.c_type)
+        if nested is not None:
+            return f'{nested.fn_basename}_equals(&{a}, &{b}, flags)'
+        if field.c_type in FLOAT_TYPES:
+            return (
+                f'{ASPN_PREFIX_LOWER}_{field.c_type}_equals({a}, {b}, flags)'
+            )
+        return f'{a} == {b}'
+
+    def _element_hash(self, field: Field, value: str) -> str:
+        """
+        Returns a statement feeding a value or element of a field into hash.
+        """
+        nested = self.structs_by_name.get(field.c_type)
+        if nested is not None:
+            return f'hash = {nested.fn_basename}_hash_update(hash, &{value});'
+        if field.c_type in FLOAT_TYPES:
+            return f'hash = {ASPN_PREFIX_LOWER}_hash_double(hash, {value});'
+        return f'hash = {ASPN_PREFIX_LOWER}_hash_u64(hash, (uint64_t){value});'
+
+    def _element_count(self, field: Field, self_: str) -> str:
+        if field.kind == 'fixed_array':
+            return str(field.length)
+        if field.kind == 'fixed_matrix':
+            return f'{field.length} * {field.length_y}'
+        if field.kind == 'matrix':
+            return f'(size_t){self_}{field.length} * {self_}{field.length_y}'
+        return f'(size_t){self_}{field.length}'
+
+    def _element_pointer(self, field: Field, self_: str) -> str:
+        """
+        Returns a pointer to the first element of an array or matrix field,
+        flattening fixed-size matrices.
+        """
+        if field.kind == 'fixed_matrix':
+            return f'(&{self_}{field.name}[0][0])'
+        return f'{self_}{field.name}'
+
+    def _equals_code(self, struct: Struct) -> List[str]:
+        """
+        Returns the body of _equals(). Values and lengths are compared before
+        the arrays they size, and runs of integers are compared with memcmp.
+        """
+        code = []
+        deferred = []
+        for field in struct.fields:
+            name = field.name
+            if field.kind in ('scalar', 'enum'):
+                code.append(
+                    f'if (!({self._element_equals(field, f"a->{name}", f"b->{name}")})) return false;'
+                )
+            elif field.kind == 'type':
+                guard = ''
+                if field.condition is not None:
+                    guard = f'a->{field.condition} && '
+                deferred.append(
+                    f'if ({guard}!{self._element_equals(field, f"a->{name}", f"b->{name}")}) return false;'
+                )
+            elif field.kind == 'string':
+                deferred.append(f"""
+                    if ((a->{name} == NULL) != (b->{name} == NULL)) return false;
+                    if (a->{name} != NULL && strcmp(a->{name}, b->{name}) != 0) return false;
+                    """)
+            else:
+                count = self._element_count(field, 'a->')
+                pa = self._element_pointer(field, 'a->')
+                pb = self._element_pointer(field, 'b->')
+                if (
+                    field.c_type in FLOAT_TYPES
+                    or field.c_type in self.structs_by_name
+                ):
+                    element = self._element_equals(
+                        field, f'{pa}[ii]', f'{pb}[ii]'
+                    )
+                    compare = f"""
+                        for (size_t ii = 0; ii < {count}; ii++)
+                            if (!({element})) return false;
+                        """
+                else:
+                    compare = f'if (memcmp({pa}, {pb}, {count} * sizeof({field.c_type})) != 0) return false;'
+                if field.is_pointer:
+                    compare = f"""
+                        if ({count} > 0) {{
+                            if (a->{name} == NULL || b->{name} == NULL) {{
+                                if (a->{name} != b->{name}) return false;
+                            }} else {{
+                                {compare}
+                            }}
+                        }}
+                        """
+                deferred.append(compare)
+        return code + deferred
+
+    def _hash_code(self, struct: Struct) -> List[str]:
+        """
+        Returns the body of _hash_update(). Only field values are hashed,
+        never addresses, so hashes are stable across processes.
+        """
+        code = []
+        for field in struct.fields:
+            name = field.name
+            if field.kind in ('scalar', 'enum'):
+                code.append(self._element_hash(field, f'self->{name}'))
+            elif field.kind == 'type':
+                update = self._element_hash(field, f'self->{name}')
+                if field.condition is not None:
+                    update = f'if (self->{field.condition}) {update}'
+                code.append(update)
+            elif field.kind == 'string':
+                code.append(f"""
+                    if (self->{name} != NULL)
+                        hash = {ASPN_PREFIX_LOWER}_hash_bytes(hash, self->{name}, strlen(self->{name}));
+                    hash = {ASPN_PREFIX_LOWER}_hash_u64(hash, self->{name} == NULL ? 0 : strlen(self->{name}) + 1);
+                    """)
+            else:
+                count = self._element_count(field, 'self->')
+                element = self._element_hash(
+                    field, f'{self._element_pointer(field, "self->")}[ii]'
+                )
+                loop = f'for (size_t ii = 0; ii < {count}; ii++) {element}'
+                if field.is_pointer:
+                    loop = f'if (self->{name} != NULL) {loop}'
+                code.append(loop)
+        return code
+
+    def serial_tag(self, struct: Struct) -> str:
+        """
+        Returns the type tag in the frame header of a serialized struct: its
+        message type, or ASPN_UNDEFINED for types that are not messages.
+        """
+        if not struct.is_message:
+            return 'ASPN_UNDEFINED'
+        return (
+            f'ASPN_{struct.fn_basename[len(ASPN_PREFIX_LOWER) + 1:].upper()}'
+        )
+
+    def header_path(self, struct: Struct) -> Union[str, None]:
+        """
+        Returns the member path to the type header of a message, 'header' or
+        'info.header' for metadata, or None if the struct has no header.
+        """
+        names = [field.name for field in struct.fields]
+        if not struct.is_message:
+            return None
+        if 'header' in names:
+            return 'header'
+        if 'info' in names:
+            return 'info.header'
+        return None
+
+    def _message_type_check(self, struct: Struct) -> str:
+        """
+        Returns the check of _deserialize() that the message type in the
+        decoded header matches the tag of the frame.
+        """
+        path = self.header_path(struct)
+        if path is None:
+            return ''
+        return (
+            f'if (scratch.{path}.message_type != {self.serial_tag(struct)}) '
+            'return NULL;'
+        )
+
+    def _view_message_type_check(self, struct: Struct) -> str:
+        """
+        Same as _message_type_check(), for _view_init().
+        """
+        path = self.header_path(struct)
+        if path is None:
+            return ''
+        return (
+            f'if ({ASPN_PREFIX_LOWER}_type_header_view_message_type(&view->{path}) '
+            f'!= {self.serial_tag(struct)}) return false;'
+        )
+
+    def _wire_type(self, field: Field) -> Union[str, None]:
+        """
+        Returns the type the values of a field are converted to when
+        serialized, or None if they are written as they are in memory.
+        """
+        if field.c_type in SERIAL_NATIVE_TYPES:
+            return None
+        if field.c_type == 'bool':
+            return 'uint8_t'
+        return 'int32_t'
+
+    def _is_serial_run(self, field: Field) -> bool:
+        """
+        Returns True if the elements of an array or matrix field are written
+        as one little-endian run, which is a single memcpy on little-endian
+        hosts.
+        """
+        return (
+            field.c_type not in self.structs_by_name
+            and self._wire_type(field) is None
+        )
+
+    def _element_serialized_size(self, field: Field, value: str) -> str:
+        nested = self.structs_by_name.get(field.c_type)
+        if nested is not None:
+            return f'{nested.fn_basename}_serialized_payload_size(&{value})'
+        return f'sizeof({self._wire_type(field) or field.c_type})'
+
+    def _element_serialize(self, field: Field, value: str) -> str:
+        """
+        Returns a statement writing a value or element of a field at cursor.
+        """
+        nested = self.structs_by_name.get(field.c_type)
+        if nested is not None:
+            return f'cursor = {nested.fn_basename}_serialize_payload(&{value}, cursor);'
+        wire = self._wire_type(field)
+        if wire is not None:
+            return f"""{{
+                {wire} wire = ({wire}){value};
+                cursor = {ASPN_PREFIX_LOWER}_write_le(cursor, &wire, 1, sizeof(wire));
+            }}"""
+        return f'cursor = {ASPN_PREFIX_LOWER}_write_le(cursor, &{value}, 1, sizeof({field.c_type}));'
+
+    def _element_deserialize(self, field: Field, value: str) -> str:
+        """
+        Returns a statement reading a value or element of a field into value,
+        returning false from the function if the input is malformed.
+        """
+        nested = self.structs_by_name.get(field.c_type)
+        if nested is not None:
+            return f'if (!{nested.fn_basename}_deserialize_payload(reader, &{value}, block, size)) return false;'
+        wire = self._wire_type(field)
+        if wire is None:
+            return f'if (!{ASPN_PREFIX_LOWER}_read_le(reader, &{value}, 1, sizeof({field.c_type}))) return false;'
+        convert = (
+            'wire != 0' if field.c_type == 'bool' else f'({field.c_type})wire'
+        )
+        return f"""{{
+            {wire} wire;
+            if (!{ASPN_PREFIX_LOWER}_read_le(reader, &wire, 1, sizeof(wire))) return false;
+            {value} = {convert};
+        }}"""
+
+    def _serial_fields(self, struct: Struct) -> List[Field]:
+        """
+        Returns the fields of a struct in serialized order: first the
+        scalars, enums and fixed-size arrays and matrices of plain values,
+        then nested types, arrays, matrices and strings. The lengths and
+        has_ flags an array or nested type depends on are always decoded
+        before it.
+        """
+        leading = [f for f in struct.fields if self._is_serial_leading(f)]
+        return leading + [f for f in struct.fields if f not in leading]
+
+    def _is_serial_leading(self, field: Field) -> bool:
+        """
+        Returns True if the field is in the leading, fixed-size part of the
+        payload, at the same offset in every serialized struct.
+        """
+        return (
+            field.kind in ('scalar', 'enum', 'fixed_array', 'fixed_matrix')
+            and field.c_type not in self.structs_by_name
+        )
+
+    def _serialized_size_code(self, struct: Struct) -> List[str]:
+        """
+        Returns the body of _serialized_payload_size().
+        """
+        code = []
+        for field in self._serial_fields(struct):
+            name = field.name
+            if field.kind in ('scalar', 'enum'):
+                code.append(
+                    f'size += {self._element_serialized_size(field, f"self->{name}")};'
+                )
+            elif field.kind == 'type':
+                add = f'size += {self._element_serialized_size(field, f"self->{name}")};'
+                if field.condition is not None:
+                    add = f'if (self->{field.condition}) {add}'
+                code.append(add)
+            elif field.kind == 'string':
+                code.append(
+                    f'size += sizeof(uint32_t) + (self->{name} != NULL ? strlen(self->{name}) : 0);'
+                )
+            elif field.c_type not in self.structs_by_name:
+                count = self._element_count(field, 'self->')
+                code.append(
+                    f'size += {count} * {self._element_serialized_size(field, "")};'
+                )
+            else:
+                count = self._element_count(field, 'self->')
+                element = f'{self._element_pointer(field, "self->")}[ii]'
+                if field.is_pointer:
+                    code.append(f'static const {field.c_type} zero_{name};')
+                    element = f'*(self->{name} != NULL ? &self->{name}[ii] : &zero_{name})'
+                code.append(f"""
+                    for (size_t ii = 0; ii < {count}; ii++)
+                        size += {self._element_serialized_size(field, element)};
+                    """)
+        return code
+
+    def _serialize_code(self, struct: Struct) -> List[str]:
+        """
+        Returns the body of _serialize_payload(). Arrays and matrices that are
+        NULL although their lengths are not are written as zeros, so the
+        output always matches _serialized_payload_size().
+        """
+        code = []
+        for field in self._serial_fields(struct):
+            name = field.name
+            if field.kind in ('scalar', 'enum'):
+                code.append(self._element_serialize(field, f'self->{name}'))
+            elif field.kind == 'type':
+                write = self._element_serialize(field, f'self->{name}')
+                if field.condition is not None:
+                    write = f'if (self->{field.condition}) {write}'
+                code.append(write)
+            elif field.kind == 'string':
+                code.append(f"""
+                    if (self->{name} != NULL) {{
+                        uint32_t length = (uint32_t)strlen(self->{name});
+                        cursor = {ASPN_PREFIX_LOWER}_write_le(cursor, &length, 1, sizeof(length));
+                        cursor = {ASPN_PREFIX_LOWER}_write_le(cursor, self->{name}, length, 1);
+                    }} else {{
+                        uint32_t length = {ASPN_PREFIX.upper()}_SERIAL_NULL_STRING;
+                        cursor = {ASPN_PREFIX_LOWER}_write_le(cursor, &length, 1, sizeof(length));
+                    }}
+                    """)
+            elif self._is_serial_run(field):
+                count = self._element_count(field, 'self->')
+                pointer = self._element_pointer(field, 'self->')
+                write = f'cursor = {ASPN_PREFIX_LOWER}_write_le(cursor, {pointer}, {count}, sizeof({field.c_type}));'
+                if field.is_pointer:
+                    write = f"""
+                        if (self->{name} != NULL)
+                            {write}
+                        else
+                            cursor = {ASPN_PREFIX_LOWER}_write_zeros(cursor, {count} * sizeof({field.c_type}));
+                        """
+                code.append(write)
+            else:
+                count = self._element_count(field, 'self->')
+                element = f'{self._element_pointer(field, "self->")}[ii]'
+                if field.is_pointer:
+                    code.append(f'static const {field.c_type} zero_{name};')
+                    element = f'*(self->{name} != NULL ? &self->{name}[ii] : &zero_{name})'
+                code.append(f"""
+                    for (size_t ii = 0; ii < {count}; ii++)
+                        {self._element_serialize(field, element)}
+                    """)
+        return code
+
+    def _deserialize_code(self, struct: Struct) -> List[str]:
+        """
+        Returns the body of _deserialize_payload(). When block is NULL the
+        input is only validated: pointer fields of dst are left NULL and
+        their aligned sizes are added to size. Otherwise they are placed at
+        *block, like the blocks of _copy_contiguous().
+        """
+        code = []
+        for field in self._serial_fields(struct):
+            name = field.name
+            if field.kind in ('scalar', 'enum'):
+                code.append(self._element_deserialize(field, f'dst->{name}'))
+            elif field.kind == 'type':
+                read = self._element_deserialize(field, f'dst->{name}')
+                if field.condition is not None:
+                    read = f"""
+                        if (dst->{field.condition}) {{
+                            {read}
+                        }} else {{
+                            memset(&dst->{name}, 0, sizeof(dst->{name}));
+                        }}
+                        """
+                code.append(read)
+            elif field.kind == 'string':
+                code.append(f"""
+                    {{
+                        uint32_t length;
+                        if (!{ASPN_PREFIX_LOWER}_read_le(reader, &length, 1, sizeof(length))) return false;
+                        dst->{name} = NULL;
+                        if (length != {ASPN_PREFIX.upper()}_SERIAL_NULL_STRING) {{
+                            if (length > (size_t)(reader->end - reader->cursor)) return false;
+                            *size += {ALIGN_UP}((size_t)length + 1);
+                            if (block != NULL) {{
+                                dst->{name} = (char*)*block;
+                                *block += {ALIGN_UP}((size_t)length + 1);
+                                memcpy(dst->{name}, reader->cursor, length);
+                                dst->{name}[length] = '\\0';
+                            }}
+                            reader->cursor += length;
+                        }}
+                    }}
+                    """)
+            elif not field.is_pointer:
+                count = self._element_count(field, 'dst->')
+                pointer = self._element_pointer(field, 'dst->')
+                if self._is_serial_run(field):
+                    code.append(
+                        f'if (!{ASPN_PREFIX_LOWER}_read_le(reader, {pointer}, {count}, sizeof({field.c_type}))) return false;'
+                    )
+                else:
+                    code.append(f"""
+                        for (size_t ii = 0; ii < {count}; ii++)
+                            {self._element_deserialize(field, f'{pointer}[ii]')}
+                        """)
+            else:
+                cols = field.length_y if field.kind == 'matrix' else None
+                cols = f'dst->{cols}' if cols is not None else '1'
+                if self._is_serial_run(field):
+                    read = f'if (!{ASPN_PREFIX_LOWER}_read_le(reader, dst->{name}, count, sizeof({field.c_type}))) return false;'
+                else:
+                    read = f"""
+                        for (size_t ii = 0; ii < count; ii++) {{
+                            {field.c_type} element;
+                            {field.c_type}* target = (dst->{name} != NULL) ? &dst->{name}[ii] : &element;
+                            {self._element_deserialize(field, '(*target)')}
+                        }}
+                        """
+                code.append(f"""
+                    {{
+                        size_t count;
+                        if (!{ASPN_PREFIX_LOWER}_serial_count(reader, dst->{field.length}, {cols}, &count)) return false;
+                        dst->{name} = NULL;
+                        if (count > 0) {{
+                            *size += {ALIGN_UP}(count * sizeof({field.c_type}));
+                            if (block != NULL) {{
+                                dst->{name} = ({field.c_type}*)*block;
+                                *block += {ALIGN_UP}(count * sizeof({field.c_type}));
+                            }}
+                            {read}
+                        }}
+                    }}
+                    """)
+        return code
+
+    def _generate_take_functions(self, struct: Struct):
+        """
+        Fills in the definitions and declarations of _new_take() and the
+        _take_<field>() setters, which adopt caller-allocated arrays and
+        matrices instead of copying them.
+        """
+        taken = [f for f in struct.fields if f.kind in ('array', 'matrix')]
+        if not taken:
+            return
+
+        field_types = {f.name: f.c_type for f in struct.fields}
+        taken_names = ', '.join(f.name for f in taken)
+        params = []
+        new_args = []
+        adopt = []
+        for field, param in zip(struct.fields, struct.constructor_param_buf):
+            if field in taken:
+                params.append(
+                    f'{field.c_type}* {ASPN_NULLABLE_MACRO} {field.name}'
+                )
+                new_args.append('NULL')
+                adopt.append(self._adopt_code(field))
+            else:
+                params.append(param)
+                new_args.append(field.name)
+
+        new_take = (
+            f'{struct.struct_name}* {ASPN_NULLABLE_MACRO} '
+            f'{struct.fn_basename}_new_take({", ".join(params)})'
+        )
+        definitions = [f"""
+            {new_take} {{
+                {struct.struct_name}* self = {struct.fn_basename}_new({', '.join(new_args)});
+                if (NULL == self) return NULL;
+                {''.join(adopt)}
+                return self;
+            }}
+            """]
+        declarations = [f"""
+            /**
+             * Same as {struct.fn_basename}_new(), but takes ownership of the
+             * buffers passed for {taken_names} instead of copying them.
+             * They must have been allocated through the ASPN allocator (see
+             * {ASPN_PREFIX_LOWER}_mem_alloc()) and hold as many elements as their
+             * length fields give. On success they are released by
+             * {struct.fn_basename}_free() and must not be used or freed by the
+             * caller. On failure NULL is returned and the caller keeps them.
+             */
+            {new_take};
+            """]
+        struct.take_functions.append('new_take')
+
+        for field in taken:
+            # A length shared with another array or matrix cannot change
+            # here without invalidating that field, so only unshared
+            # lengths become parameters
+            shared = {
+                length
+                for other in taken
+                if other is not field
+                for length in other.length_fields
+            }
+            lengths = [l for l in field.length_fields if l not in shared]
+            setter = (
+                f'void {struct.fn_basename}_take_{field.name}('
+                f'{struct.struct_name}* {ASPN_NONNULL_MACRO} self, '
+                + ''.join(f'{field_types[l]} {l}, ' for l in lengths)
+                + f'{field.c_type}* {ASPN_NULLABLE_MACRO} {field.name})'
+            )
+            definitions.append(f"""
+                {setter} {{
+                    {field.free}
+                    {''.join(f'self->{l} = {l};' for l in lengths)}
+                    {self._adopt_code(field)}
+                }}
+                """)
+            # Every dimension, so a square matrix reads n * n
+            dims = (
+                [field.length, field.length_y]
+                if field.kind == 'matrix'
+                else [field.length]
+            )
+            size_doc = f'{" * ".join(dims)} elements'
+            current = [l for l in dict.fromkeys(dims) if l not in lengths]
+            if current:
+                size_doc += f' ({", ".join(current)} as currently set on self)'
+            declarations.append(f"""
+                /**
+                 * Replace {field.name} with a buffer of {size_doc} allocated
+                 * through the ASPN allocator, without copying it. The previous
+                 * buffer is freed and self takes ownership of the new one.
+                 */
+                {setter};
+                """)
+            struct.take_functions.append(f'take_{field.name}')
+
+        struct.take_definitions = '\n'.join(definitions)
+        struct.take_declarations = '\n'.join(declarations)
+
+    def _generate_batch_functions(self, struct: Struct):
+        """
+        Fills in the {Struct}Batch type and its functions for messages. A batch
+        stores each fixed-size field as a column, so numeric code can run over
+        one field of many messages at once. Fields owning heap memory (arrays,
+        matrices, strings and nested types holding them) get no column, and
+        neither do the length and condition fields describing them, so
+        scattering a row never leaves a message with a length that does not
+        match its buffer.
+        """
+        if not struct.is_message:
+            return
+
+        skipped = [
+            field
+            for field in struct.fields
+            if field.is_pointer or self._nested_with_pointers(field)
+        ]
+        described = set()
+        for field in skipped:
+            described.update(field.length_fields)
+            if field.condition is not None:
+                described.add(field.condition)
+        fields = [
+            field
+            for field in struct.fields
+            if field not in skipped and field.name not in described
+        ]
+        if not fields:
+            return
+
+        batch = f'{struct.struct_name}Batch'
+        columns = []
+        store = []
+        load = []
+        for field in fields:
+            name = field.name
+            if field.kind == 'fixed_array':
+                columns.append(f'{field.c_type} (*{name})[{field.length}];')
+            elif field.kind == 'fixed_matrix':
+                columns.append(
+                    f'{field.c_type} (*{name})[{field.length}][{field.length_y}];'
+                )
+            else:
+                columns.append(f'{field.c_type}* {name};')
+            if field.kind in ('fixed_array', 'fixed_matrix'):
+                store.append(
+                    f'memcpy(batch->{name}[row], message->{name}, sizeof(message->{name}));'
+                )
+                load.append(
+                    f'memcpy(message->{name}, batch->{name}[row], sizeof(message->{name}));'
+                )
+            else:
+                store.append(f'batch->{name}[row] = message->{name};')
+                load.append(f'message->{name} = batch->{name}[row];')
+
+        first = fields[0].name
+        column_size = '{ALIGN_UP}(capacity * sizeof(*batch->{name}))'
+        struct.batch_definitions = f"""
+            {batch}* {ASPN_NULLABLE_MACRO} {struct.fn_basename}_batch_new(size_t capacity) {{
+                {batch}* batch = ({batch}*){MEM_CALLOC}(1, sizeof({batch}));
+                if (NULL == batch) return NULL;
+                if (!{struct.fn_basename}_batch_reserve(batch, capacity)) {{
+                    {MEM_FREE}(batch);
+                    return NULL;
+                }}
+                return batch;
+            }}
+
+            void {struct.fn_basename}_batch_free({batch}* {ASPN_NULLABLE_MACRO} batch) {{
+                if (NULL == batch) return;
+                /* All columns share the allocation starting at the first one */
+                {MEM_FREE}(batch->{first});
+                {MEM_FREE}(batch);
+            }}
+
+            bool {struct.fn_basename}_batch_reserve({batch}* {ASPN_NONNULL_MACRO} batch, size_t capacity) {{
+                {batch} grown = *batch;
+                size_t size = 0;
+                unsigned char* cursor;
+                if (capacity <= batch->capacity) return true;
+                {''.join(f'size += {column_size.format(ALIGN_UP=ALIGN_UP, name=f.name)};' for f in fields)}
+                cursor = (unsigned char*){MEM_ALLOC}(size);
+                if (NULL == cursor) return false;
+                {''.join(f'''
+                grown.{f.name} = (void*)cursor;
+                cursor += {column_size.format(ALIGN_UP=ALIGN_UP, name=f.name)};''' for f in fields)}
+                if (batch->count > 0) {{
+                    {''.join(f'''
+                    memcpy(grown.{f.name}, batch->{f.name}, batch->count * sizeof(*batch->{f.name}));''' for f in fields)}
+                }}
+                {MEM_FREE}(batch->{first});
+                grown.capacity = capacity;
+                *batch = grown;
+                return true;
+            }}
+
+            static void batch_store({batch}* batch, size_t row, const {struct.struct_name}* message) {{
+                {''.join(store)}
+            }}
+
+            static void batch_load(const {batch}* batch, size_t row, {struct.struct_name}* message) {{
+                {''.join(load)}
+            }}
+
+            bool {struct.fn_basename}_batch_append({batch}* {ASPN_NONNULL_MACRO} batch, const {struct.struct_name}* {ASPN_NONNULL_MACRO} message) {{
+                if (batch->count == batch->capacity &&
+                    !{struct.fn_basename}_batch_reserve(batch, batch->capacity > 0 ? 2 * batch->capacity : 16))
+                    return false;
+                batch_store(batch, batch->count++, message);
+                return true;
+            }}
+
+            bool {struct.fn_basename}_batch_gather({batch}* {ASPN_NONNULL_MACRO} batch, const {struct.struct_name}* const* messages, size_t count) {{
+                if (batch->count + count > batch->capacity &&
+                    !{struct.fn_basename}_batch_reserve(batch, batch->count + count))
+                    return false;
+                for (size_t ii = 0; ii < count; ii++) batch_store(batch, batch->count++, messages[ii]);
+                return true;
+            }}
+
+            bool {struct.fn_basename}_batch_scatter(const {batch}* {ASPN_NONNULL_MACRO} batch, size_t first, {struct.struct_name}* const* messages, size_t count) {{
+                if (first > batch->count || count > batch->count - first) return false;
+                for (size_t ii = 0; ii < count; ii++) batch_load(batch, first + ii, messages[ii]);
+                return true;
+            }}
+            """
+
+        column_decls = '\n'.join(columns)
+        omitted = [f.name for f in struct.fields if f not in fields]
+        omitted_doc = ''
+        if omitted:
+            omitted_doc = f"""
+             *
+             * The fields {', '.join(omitted)} own heap memory or describe
+             * a field that does, so they have no column: appending does not
+             * copy them and scattering leaves them unchanged in the target
+             * messages."""
+        struct.batch_declarations = f"""
+            /**
+             * Structure-of-arrays container for {struct.struct_name}. Every
+             * field is stored as a column of capacity rows, of which the first
+             * count are in use, so a loop over one column is contiguous and can
+             * be vectorized. Columns are allocated together through the ASPN
+             * allocator and may move when the batch grows.{omitted_doc}
+             */
+            typedef struct {batch} {{
+                size_t count;
+                size_t capacity;
+                {column_decls}
+            }} {batch};
+
+            /* Create an empty batch with room for capacity messages. */
+            {batch}* {ASPN_NULLABLE_MACRO} {struct.fn_basename}_batch_new(size_t capacity);
+
+            void {struct.fn_basename}_batch_free({batch}* {ASPN_NULLABLE_MACRO} batch);
+
+            /* Grow the columns to hold at least capacity messages. Returns false if allocation failed. */
+            bool {struct.fn_basename}_batch_reserve({batch}* {ASPN_NONNULL_MACRO} batch, size_t capacity);
+
+            /* Append a copy of message as the last row, growing the batch if needed. */
+            bool {struct.fn_basename}_batch_append({batch}* {ASPN_NONNULL_MACRO} batch, const {struct.struct_name}* {ASPN_NONNULL_MACRO} message);
+
+            /* Append copies of count messages, in order. */
+            bool {struct.fn_basename}_batch_gather({batch}* {ASPN_NONNULL_MACRO} batch, const {struct.struct_name}* const* messages, size_t count);
+
+            /**
+             * Copy rows first to first + count - 1 into the existing messages.
+             * Returns false, copying nothing, if those rows are not all in use.
+             */
+            bool {struct.fn_basename}_batch_scatter(const {batch}* {ASPN_NONNULL_MACRO} batch, size_t first, {struct.struct_name}* const* messages, size_t count);
+            """
+        struct.batch_functions = [
+            'batch_new',
+            'batch_free',
+            'batch_reserve',
+            'batch_append',
+            'batch_gather',
+            'batch_scatter',
+        ]
+
+    def _generate_view_functions(self, struct: Struct):
+        """
+        Fills in the {Struct}View type and its accessors, which read the
+        fields of a struct serialized by _serialize() in place. Fields of the
+        fixed-size leading part of the payload are read at constant offsets,
+        and the offsets of the rest are found once, by _view_init().
+        """
+        view = f'{struct.struct_name}View'
+        fn = f'{struct.fn_basename}_view'
+        members = []
+        init = []
+        getters = []
+        getter_decls = []
+        accessors = []
+        # Terms of the offset of the next field of the leading part
+        offset_terms = []
+        for field in self._serial_fields(struct):
+            name = field.name
+            nested = self.structs_by_name.get(field.c_type)
+            wire = self._wire_type(field)
+            value_type = field.c_type
+            load = f"""
+                {value_type} value;
+                {ASPN_PREFIX_LOWER}_load_le(&value, {{at}}, sizeof(value));
+                return value;
+                """
+            if nested is None and wire is not None:
+                convert = (
+                    'wire != 0'
+                    if field.c_type == 'bool'
+                    else f'({field.c_type})wire'
+                )
+                load = f"""
+                    {wire} wire;
+                    {ASPN_PREFIX_LOWER}_load_le(&wire, {{at}}, sizeof(wire));
+                    return {convert};
+                    """
+            element_size = f'sizeof({wire or field.c_type})'
+
+            offset = ' + '.join(offset_terms) or '0'
+            at = ' + '.join(['view->payload'] + offset_terms)
+            if self._is_serial_leading(field):
+                accessors.append(f'view_{name}')
+                if field.kind in ('scalar', 'enum'):
+                    getter_decls.append(
+                        f'{value_type} {fn}_{name}(const {view}* {ASPN_NONNULL_MACRO} view);'
+                    )
+                    getters.append(f"""
+                        {value_type} {fn}_{name}(const {view}* {ASPN_NONNULL_MACRO} view) {{
+                            {load.format(at=at)}
+                        }}
+                        """)
+                    offset_terms.append(element_size)
+                else:
+                    count = self._element_count(field, '')
+                    getter_decls.append(
+                        f'{value_type} {fn}_{name}(const {view}* {ASPN_NONNULL_MACRO} view, size_t index);'
+                    )
+                    getters.append(f"""
+                        {value_type} {fn}_{name}(const {view}* {ASPN_NONNULL_MACRO} view, size_t index) {{
+                            {load.format(at=f'{at} + index * {element_size}')}
+                        }}
+                        """)
+                    offset_terms.append(f'{count} * {element_size}')
+                continue
+
+            if not init:
+                # Skip the leading part, validating its length
+                init.append(
+                    f'if (!{ASPN_PREFIX_LOWER}_read_le(reader, NULL, {offset}, 1)) return false;'
+                )
+            if field.kind == 'type':
+                members.append(f'{nested.struct_name}View {name};')
+                guard = ''
+                if field.condition is not None:
+                    guard = f'{fn}_{field.condition}(view) && '
+                init.append(
+                    f'if ({guard}!{nested.fn_basename}_view_init_payload(&view->{name}, reader)) return false;'
+                )
+                continue
+
+            members.append(f'size_t {name}_offset;')
+            accessors.append(f'view_{name}')
+            init.append(
+                f'view->{name}_offset = (size_t)(reader->cursor - view->payload);'
+            )
+            if field.kind == 'string':
+                init.append(f"""
+                    {{
+                        uint32_t length;
+                        if (!{ASPN_PREFIX_LOWER}_read_le(reader, &length, 1, sizeof(length))) return false;
+                        if (length != {ASPN_PREFIX.upper()}_SERIAL_NULL_STRING && !{ASPN_PREFIX_LOWER}_read_le(reader, NULL, length, 1))
+                            return false;
+                    }}
+                    """)
+                getter_decls.append(
+                    f'{ASPN_PREFIX}ArrayView {fn}_{name}(const {view}* {ASPN_NONNULL_MACRO} view);'
+                )
+                getters.append(f"""
+                    {ASPN_PREFIX}ArrayView {fn}_{name}(const {view}* {ASPN_NONNULL_MACRO} view) {{
+                        {ASPN_PREFIX}ArrayView out = {{NULL, 0}};
+                        uint32_t length;
+                        {ASPN_PREFIX_LOWER}_load_le(&length, view->payload + view->{name}_offset, sizeof(length));
+                        if (length != {ASPN_PREFIX.upper()}_SERIAL_NULL_STRING) {{
+                            out.data = view->payload + view->{name}_offset + sizeof(length);
+                            out.count = length;
+                        }}
+                        return out;
+                    }}
+                    """)
+                continue
+
+            if field.kind == 'matrix':
+                rows = f'{fn}_{field.length}(view)'
+                cols = f'{fn}_{field.length_y}(view)'
+            elif field.kind == 'array':
+                rows = f'{fn}_{field.length}(view)'
+                cols = '1'
+            else:
+                rows = self._element_count(field, '')
+                cols = '1'
+            count = (
+                f'(size_t){rows}'
+                if cols == '1'
+                else f'(size_t){rows} * {cols}'
+            )
+            accessors.append(f'view_{name}_at')
+            if nested is None:
+                init.append(f"""
+                    {{
+                        size_t count;
+                        if (!{ASPN_PREFIX_LOWER}_serial_count(reader, {rows}, {cols}, &count)) return false;
+                        if (!{ASPN_PREFIX_LOWER}_read_le(reader, NULL, count, {element_size})) return false;
+                    }}
+                    """)
+                at_decl = f'{value_type} {fn}_{name}_at(const {view}* {ASPN_NONNULL_MACRO} view, size_t index)'
+                at = f"""
+                    {at_decl} {{
+                        {load.format(at=f'view->payload + view->{name}_offset + index * {element_size}')}
+                    }}
+                    """
+            else:
+                init.append(f"""
+                    {{
+                        size_t count;
+                        if (!{ASPN_PREFIX_LOWER}_serial_count(reader, {rows}, {cols}, &count)) return false;
+                        for (size_t ii = 0; ii < count; ii++) {{
+                            {nested.struct_name}View element;
+                            if (!{nested.fn_basename}_view_init_payload(&element, reader)) return false;
+                        }}
+                    }}
+                    """)
+                at_decl = f'{nested.struct_name}View {fn}_{name}_at(const {view}* {ASPN_NONNULL_MACRO} view, size_t index)'
+                at = f"""
+                    {at_decl} {{
+                        {nested.struct_name}View element;
+                        {ASPN_PREFIX}Reader reader;
+                        reader.cursor = view->payload + view->{name}_offset;
+                        reader.end = view->payload + view->payload_size;
+                        for (size_t ii = 0; ii <= index; ii++) {nested.fn_basename}_view_init_payload(&element, &reader);
+                        return element;
+                    }}
+                    """
+            getter_decls.append(
+                f'{ASPN_PREFIX}ArrayView {fn}_{name}(const {view}* {ASPN_NONNULL_MACRO} view);'
+            )
+            getter_decls.append(f'{at_decl};')
+            getters.append(f"""
+                {ASPN_PREFIX}ArrayView {fn}_{name}(const {view}* {ASPN_NONNULL_MACRO} view) {{
+                    {ASPN_PREFIX}ArrayView out;
+                    out.data = view->payload + view->{name}_offset;
+                    out.count = {count};
+                    return out;
+                }}
+                {at}
+                """)
+
+        if not init:
+            init.append(
+                f"if (!{ASPN_PREFIX_LOWER}_read_le(reader, NULL, {' + '.join(offset_terms) or '0'}, 1)) return false;"
+            )
+        init_code = '\n'.join(init)
+        getter_code = '\n'.join(getters)
+        view_type_check = self._view_message_type_check(struct)
+        struct.view_definitions = f"""
+            bool {fn}_init_payload({view}* {ASPN_NONNULL_MACRO} view, {ASPN_PREFIX}Reader* {ASPN_NONNULL_MACRO} reader) {{
+                memset(view, 0, sizeof(*view));
+                view->payload = reader->cursor;
+                {init_code}
+                view->payload_size = (size_t)(reader->cursor - view->payload);
+                return true;
+            }}
+
+            bool {fn}_init({view}* {ASPN_NONNULL_MACRO} view, const uint8_t* {ASPN_NONNULL_MACRO} buf, size_t len) {{
+                {ASPN_PREFIX}Reader reader;
+                uint16_t type;
+                uint32_t payload_size;
+                if (NULL == buf) return false;
+                reader.cursor = buf;
+                reader.end = buf + len;
+                if (!{ASPN_PREFIX_LOWER}_read_serial_header(&reader, &type, &payload_size)) return false;
+                if (type != (uint16_t){self.serial_tag(struct)}) return false;
+                if (!{fn}_init_payload(view, &reader) || reader.cursor != reader.end) return false;
+                {view_type_check}
+                return true;
+            }}
+
+            {getter_code}
+            """
+
+        member_decls = '\n'.join(members)
+        accessor_decls = '\n'.join(getter_decls)
+        struct.view_declarations = f"""
+            /**
+             * Read-only view of a {struct.struct_name} serialized by
+             * {struct.fn_basename}_serialize(). The accessors below read single
+             * fields straight from the buffer, without allocating or decoding
+             * the rest of the message. Arrays, matrices and strings are exposed
+             * as {ASPN_PREFIX}ArrayView, pointing at their little-endian elements in
+             * the buffer, and their _at() accessors decode one element. Nested
+             * types are views themselves. The buffer must outlive the view.
+             *
+             * Fixed-size arrays and matrices are read with a row-major index.
+             * The _at() accessors of arrays of nested types walk the elements
+             * before index, so iterating them that way is quadratic.
+             */
+            typedef struct {view} {{
+                /* The payload, following the frame header */
+                const uint8_t* payload;
+                size_t payload_size;
+                {member_decls}
+            }} {view};
+
+            /**
+             * Validate the serialized {struct.struct_name} at buf and point view at
+             * it. Returns false if buf is truncated or malformed, or holds
+             * another type (by its frame tag or the message type in its
+             * header). Accessors must not be used on a view that failed
+             * to initialize.
+             */
+            bool {fn}_init({view}* {ASPN_NONNULL_MACRO} view, const uint8_t* {ASPN_NONNULL_MACRO} buf, size_t len);
+
+            /* Same as {fn}_init() for a payload without frame header, which is skipped by the reader. */
+            bool {fn}_init_payload({view}* {ASPN_NONNULL_MACRO} view, {ASPN_PREFIX}Reader* {ASPN_NONNULL_MACRO} reader);
+
+            {accessor_decls}
+            """
+        struct.view_functions = ['view_init', 'view_init_payload'] + accessors
+
+    def _reflect_type(self, field: Field) -> str:
+        if field.kind == 'type' or field.c_type.startswith(
+            f"{ASPN_PREFIX}Type"
+        ):
+            return 'STRUCT'
+        return REFLECT_TYPES.get(field.c_type, 'ENUM')
+
+    def _enum_values(self, field: Field) -> List[str]:
+        """
+        Names of the values of an enum field. The message type of the header
+        lists the messages known to this generator.
+        """
+        if field.c_type == f"{ASPN_PREFIX}MessageType":
+            return ['ASPN_UNDEFINED'] + [
+                self.serial_tag(s) for s in self.structs if s.is_message
+            ]
+        return field.enum_values
+
+    def _struct_info_code(self, struct: Struct) -> str:
+        """
+        Constant reflection tables describing the fields of the struct, see
+        reflect.h.
+        """
+        indices = {field.name: ii for ii, field in enumerate(struct.fields)}
+        enum_tables = []
+        entries = []
+        for field in struct.fields:
+            reflect_type = self._reflect_type(field)
+            struct_info = 'NULL'
+            if reflect_type == 'STRUCT':
+                nested = self.structs_by_name[field.c_type]
+                struct_info = f'&{nested.fn_basename}_struct_info'
+            values = self._enum_values(field)
+            values_table = 'NULL'
+            if reflect_type == 'ENUM' and values:
+                values_table = f'{struct.fn_basename}_{field.name}_values'
+                enum_tables.append(dedent(f"""
+                    static const {ASPN_PREFIX}EnumValue {values_table}[] = {{
+                        {', '.join(f'{{"{value}", {value}}}' for value in values)}
+                    }};
+                """))
+            rows, cols = 1, 1
+            if field.kind in ('fixed_array', 'fixed_matrix'):
+                rows = field.length
+            if field.kind == 'fixed_matrix':
+                cols = field.length_y
+            if field.kind in ('array', 'matrix', 'string'):
+                rows, cols = 0, 0
+            rows_field, cols_field = NO_FIELD, NO_FIELD
+            if field.kind == 'array':
+                rows, cols = 0, 1
+                rows_field = indices[field.length]
+            if field.kind == 'matrix':
+                rows_field = indices[field.length]
+                cols_field = indices[field.length_y]
+            condition_field = NO_FIELD
+            if field.condition is not None:
+                condition_field = indices[field.condition]
+            entries.append(dedent(f"""
+                {{
+                    "{field.name}",
+                    {ASPN_PREFIX.upper()}_FIELD_{reflect_type},
+                    {ASPN_PREFIX.upper()}_SHAPE_{REFLECT_SHAPES[field.kind]},
+                    offsetof({struct.struct_name}, {field.name}),
+                    sizeof({field.c_type}),
+                    {rows},
+                    {cols},
+                    {rows_field},
+                    {cols_field},
+                    {condition_field},
+                    {'true' if field.nullable else 'false'},
+                    {struct_info},
+                    {values_table},
+                    {len(values) if values_table != 'NULL' else 0},
+                }},
+            """))
+
+        fields_table = 'NULL'
+        if entries:
+            fields_table = f'{struct.fn_basename}_fields'
+            enum_tables.append(dedent(f"""
+                static const {ASPN_PREFIX}FieldInfo {fields_table}[] = {{
+                    {''.join(entries)}
+                }};
+            """))
+        return '\n'.join(enum_tables) + dedent(f"""
+            const {ASPN_PREFIX}StructInfo {struct.fn_basename}_struct_info = {{
+                "{struct.struct_name}",
+                sizeof({struct.struct_name}),
+                {len(entries)},
+                {fields_table},
+            }};
+        """)
+
+    def _adopt_code(self, field: Field) -> str:
+        """
+        Returns code pointing a field of self at an adopted buffer. Buffers
+        of an empty array are released immediately, since the free functions
+        skip arrays whose length is 0.
+        """
+        empty = ' || '.join(f'self->{l} == 0' for l in field.length_fields)
+        return f"""
+            self->{field.name} = {field.name};
+            if (self->{field.name} != NULL && ({empty})) {{
+                {MEM_FREE}(self->{field.name});
+                self->{field.name} = NULL;
+            }}
+            """
+
+    def has_pointers(self, struct: Struct) -> bool:
+        """
+        Returns True if the struct, or any struct nested in it, owns heap
+        memory through a pointer field.
+        """
+        for field in struct.fields:
+            if field.is_pointer:
+                return True
+            nested = self.structs_by_name.get(field.c_type)
+            if nested is not None and self.has_pointers(nested):
+                return True
+        return False
+
+    def _nested_with_pointers(self, field: Field) -> Union[Struct, None]:
+        nested = self.structs_by_name.get(field.c_type)
+        if nested is not None and self.has_pointers(nested):
+            return nested
+        return None
+
+    def _contiguous_bytes(self, field: Field, src: str) -> str:
+        if field.kind == 'string':
+            return f'strlen({src}{field.name}) + 1'
+        if field.kind == 'matrix':
+            return f'(size_t){src}{field.length} * {src}{field.length_y} * sizeof({field.c_type})'
+        return f'(size_t){src}{field.length} * sizeof({field.c_type})'
+
+    def _contiguous_guard(self, field: Field, src: str) -> str:
+        if field.kind == 'string':
+            return f'{src}{field.name} != NULL'
+        if field.kind == 'matrix':
+            return f'{src}{field.name} != NULL && {src}{field.length} != 0 && {src}{field.length_y} != 0'
+        return f'{src}{field.name} != NULL && {src}{field.length} != 0'
+
+    def _contiguous_size_code(
+        self, struct: Struct, src: str, depth: int = 0
+    ) -> List[str]:
+        """
+        Returns code adding to `size` the aligned size of every block owned
+        by the struct at `src`, recursing into nested structs.
+        """
+        code = []
+        index = f'i{depth}'
+        for field in struct.fields:
+            nested = self._nested_with_pointers(field)
+            if field.is_pointer:
+                code.append(
+                    f'if ({self._contiguous_guard(field, src)}) {{'
+                    f'size += {ALIGN_UP}({self._contiguous_bytes(field, src)});'
+                )
+                if nested is not None:
+                    code.append(
+                        f'for (size_t {index} = 0; {index} < {src}{field.length}; {index}++) {{'
+                    )
+                    code += self._contiguous_size_code(
+                        nested, f'{src}{field.name}[{index}].', depth + 1
+                    )
+                    code.append('}')
+                code.append('}')
+            elif nested is not None:
+                if field.condition is not None:
+                    code.append(f'if ({src}{field.condition}) {{')
+                code += self._contiguous_size_code(
+                    nested, f'{src}{field.name}.', depth
+                )
+                if field.condition is not None:
+                    code.append('}')
+        return code
+
+    def _contiguous_place_code(
+        self, struct: Struct, dst: str, src: str, depth: int = 0
+    ) -> List[str]:
+        """
+        Returns code that copies every block owned by the struct at `src`
+        to `cursor`, pointing the matching fields of the shallow copy at
+        `dst` into the new block.
+        """
+        code = []
+        index = f'i{depth}'
+        for field in struct.fields:
+            nested = self._nested_with_pointers(field)
+            if field.is_pointer:
+                code.append(f"""
+                    {dst}{field.name} = NULL;
+                    if ({self._contiguous_guard(field, src)}) {{
+                        size_t bytes = {self._contiguous_bytes(field, src)};
+                        {dst}{field.name} = ({field.c_type}*)cursor;
+                        memcpy({dst}{field.name}, {src}{field.name}, bytes);
+                        cursor += {ALIGN_UP}(bytes);""")
+                if nested is not None:
+                    code.append(
+                        f'for (size_t {index} = 0; {index} < {src}{field.length}; {index}++) {{'
+                    )
+                    code += self._contiguous_place_code(
+                        nested,
+                        f'{dst}{field.name}[{index}].',
+                        f'{src}{field.name}[{index}].',
+                        depth + 1,
+                    )
+                    code.append('}')
+                code.append('}')
+            elif nested is not None:
+                if field.condition is not None:
+                    code.append(f'if ({src}{field.condition}) {{')
+                code += self._contiguous_place_code(
+                    nested, f'{dst}{field.name}.', f'{src}{field.name}.', depth
+                )
+                if field.condition is not None:
+                    code.append('}')
+        return code
+
     # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
     # # # # # # # # # # # # # # # Backend Methods # # # # # # # # # # # # # # #
     # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -251,7 +1917,6 @@ class AspnYamlToCSource(Backend):
             )
 
         self.current_struct.constructor_param_buf.append(f"{f_type} {f_name}")
-        self.current_struct.new_call_params.append(f"input->{field_name}")
 
     def process_matrix_field(
         self,
@@ -272,10 +1937,14 @@ class AspnYamlToCSource(Backend):
             pass
         field_str = f"{type_name} {field_name}[{x}][{y}]"
         if isinstance(x, int) and isinstance(y, int):
-            self._process_const_size_matrix_init(field_name, x, y, type_name)
+            self._process_const_size_matrix_init(
+                field_name, x, y, type_name, nullable
+            )
         elif isinstance(x, str) and isinstance(y, str):
             field_str = f"{type_name}* {field_name}"
-            self._process_matrix_ptr_init(field_name, x, y, type_name)
+            self._process_matrix_ptr_init(
+                field_name, x, y, type_name, nullable
+            )
         else:
             print(
                 "Current implementation only supports homogeneous matrix size types."
@@ -286,7 +1955,6 @@ class AspnYamlToCSource(Backend):
             raise NotImplementedError
 
         self.current_struct.constructor_param_buf.append(field_str)
-        self.current_struct.new_call_params.append(f"input->{field_name}")
 
     def process_outer_managed_pointer_field(
         self,
@@ -311,16 +1979,25 @@ class AspnYamlToCSource(Backend):
     def process_string_field(
         self, field_name: str, doc_string: str, nullable: bool = False
     ):
-        self.current_struct.new_call_params.append(f"input->{field_name}")
         self.current_struct.constructor_param_buf.append(f"char* {field_name}")
         self.current_struct.constructor_body_buf.append(
             f"""if ({field_name} == NULL) return NULL;
                 size_t len = strlen({field_name}) + 1;
-                self->{field_name} = malloc(len);
+                self->{field_name} = {MEM_ALLOC}(len);
                 memcpy(self->{field_name}, {field_name}, len);"""
         )
         self.current_struct.free_pointer_fields_buf.append(
-            f'free(self->{field_name});'
+            f'{MEM_FREE}(self->{field_name});'
+        )
+        self.current_struct.fields.append(
+            Field(
+                field_name,
+                'string',
+                'char',
+                init=f"""if ({field_name} == NULL) return NULL;
+                    self->{field_name} = {field_name};""",
+                nullable=nullable,
+            )
         )
 
     def process_string_array_field(
@@ -338,51 +2015,67 @@ class AspnYamlToCSource(Backend):
         basename = pascal_to_snake(field_type_name)
 
         if f'{ASPN_PREFIX}Type' in field_type_name:
-            self.current_struct.new_call_params.append(f"{field_name}_prep")
             self.current_struct.constructor_param_buf.append(
                 f"{field_type_name}* {field_name}"
             )
             # Special case: fields called "observation_characteristics" have a companion field
             # called "has_observation_characteristics" that determines validity.
             if field_name == 'observation_characteristics':
+                self.current_struct.fields.append(
+                    Field(
+                        field_name,
+                        'type',
+                        field_type_name,
+                        condition='has_observation_characteristics',
+                        init=f"""
+                            if (has_observation_characteristics)
+                                self->{field_name} = *{field_name};
+                            else
+                                memset(&self->{field_name}, 0, sizeof(self->{field_name}));
+                            """,
+                        nullable=nullable,
+                    )
+                )
                 self.current_struct.constructor_body_buf.append(f"""
                     if (has_observation_characteristics) {{
                         {field_type_name}* {field_name}_prep = {basename}_copy({field_name});
                         self->{field_name} = *{field_name}_prep;
-                        free({field_name}_prep);
+                        {MEM_FREE}({field_name}_prep);
                     }}
                     """)
-                self.current_struct.new_call_prep.append(f'''
-                    {field_type_name}* {field_name}_prep = NULL;
-                    if (input->has_observation_characteristics)
-                        {field_name}_prep = {basename}_copy(&input->{field_name});
-                    ''')
-                self.current_struct.new_call_cleanup.append(f'''
-                    if (input->has_observation_characteristics)
-                        {basename}_free({field_name}_prep);
-                    ''')
                 self.current_struct.free_pointer_fields_buf.append(f'''
                     if (self->has_observation_characteristics)
                         {basename}_free_members(&self->{field_name});
                     ''')
             # All other type classes.
             else:
+                self.current_struct.fields.append(
+                    Field(
+                        field_name,
+                        'type',
+                        field_type_name,
+                        init=f'self->{field_name} = *{field_name};',
+                        nullable=nullable,
+                    )
+                )
                 self.current_struct.constructor_body_buf.append(f"""
                     {field_type_name}* {field_name}_prep = {basename}_copy({field_name});
                     self->{field_name} = *{field_name}_prep;
-                    free({field_name}_prep);
+                    {MEM_FREE}({field_name}_prep);
                     """)
-                self.current_struct.new_call_prep.append(
-                    f'{field_type_name}* {field_name}_prep = {basename}_copy(&input->{field_name});'
-                )
-                self.current_struct.new_call_cleanup.append(
-                    f'{basename}_free({field_name}_prep);'
-                )
                 self.current_struct.free_pointer_fields_buf.append(
                     f'{basename}_free_members(&self->{field_name});'
                 )
         else:
-            self.current_struct.new_call_params.append(f"input->{field_name}")
+            self.current_struct.fields.append(
+                Field(
+                    field_name,
+                    'scalar',
+                    field_type_name,
+                    init=f"self->{field_name} = {field_name};",
+                    nullable=nullable,
+                )
+            )
             self.current_struct.constructor_param_buf.append(
                 f"{field_type_name} {field_name}"
             )
@@ -415,7 +2108,16 @@ class AspnYamlToCSource(Backend):
         field_str = f"enum {field_type_name} {param_name}"
 
         self.current_struct.constructor_param_buf.append(field_str)
-        self.current_struct.new_call_params.append(f"input->{param_name}")
         self.current_struct.constructor_body_buf.append(
             f"self->{field_name} = {param_name};"
         )
+        self.current_struct.fields.append(
+            Field(
+                field_name,
+                'enum',
+                f"enum {field_type_name}",
+                init=f"self->{field_name} = {param_name};",
+                nullable=nullable,
+                enum_values=[value.split(' ')[0] for value in enum_values],
+            )
+        )
@@ -15,6 +15,28 @@ from firehose.backends.aspn.utils import (
 
 ASPN_DIR = ASPN_PREFIX.lower()
 
+VIEW_DOCSTRING = (
+    'Same as get_{field_name}() without copying: a read-only view over the '
+    'memory of the underlying C struct. The view is invalidated when '
+    'set_{field_name}() is called or this object is destroyed.'
+)
+
+TAKE_DOCSTRING = (
+    'Same as set_{field_name}(), but hands {field_name} to the underlying C '
+    'struct instead of copying it. It must hold {size} elements and have been '
+    'allocated through the ASPN allocator, see make_aspn_buffer().'
+)
+
+# xt::adapt() over a const pointer with no_ownership, as returned by the
+# view_*() methods of the xtensor variants
+XTENSOR_VIEW_ALIASES = """
+template <class T>
+using VectorView = decltype(xt::adapt(std::declval<const T*>(), std::size_t(), xt::no_ownership(),
+                                      std::declval<std::vector<std::size_t>>()));
+template <class T>
+using MatrixView = VectorView<T>;
+"""
+
 EXTRA_HEADER_INC = {
     'TypeTimestamp': """
 #include <iostream>
@@ -483,6 +505,13 @@ class Struct:
              */
             void reset_aspn_c({self.struct_name}* replacement_struct, bool take_ownership = true);
 
+            /**
+             * Returns the underlying C struct and gives up ownership of it, leaving this object
+             * holding a null pointer.  The caller must free the struct.  Returns nullptr, and
+             * leaves this object unchanged, if this object does not own its C struct.
+             */
+            {self.struct_name}* release_aspn_c();
+
             {{struct_fields}}
 
             private:
@@ -516,6 +545,43 @@ class AspnYamlToCppHeader(Backend):
     def matrix(self, type: str) -> str:
         pass
 
+    def view_aliases(self) -> str:
+        """
+        Returns the definitions of the VectorView and MatrixView templates,
+        written to views.hpp by AspnCppBackend.
+        """
+        pass
+
+    def _add_view(self, field_name: str, view_type: str):
+        include = '#include "views.hpp"'
+        if include not in self.current_struct.includes:
+            self.current_struct.includes.append(include)
+        docstr = format_docstring(
+            VIEW_DOCSTRING.format(field_name=field_name), indent=INDENT
+        )
+        self.current_struct.struct_fields_buf.append(
+            f"{docstr}{INDENT}{view_type} view_{field_name}() const"
+        )
+
+    def _add_take_setter(
+        self, field_name: str, type_name: str, lengths: List[str]
+    ):
+        include = '#include "buffers.hpp"'
+        if include not in self.current_struct.includes:
+            self.current_struct.includes.append(include)
+        docstr = format_docstring(
+            TAKE_DOCSTRING.format(
+                field_name=field_name, size=' * '.join(lengths)
+            ),
+            indent=INDENT,
+        )
+        params = ''.join(
+            f', std::size_t {length}' for length in dict.fromkeys(lengths)
+        )
+        self.current_struct.struct_fields_buf.append(
+            f"{docstr}{INDENT}void set_{field_name}(AspnBuffer<{type_name}>&& {field_name}{params})"
+        )
+
     def set_output_root_folder(self, output_root_folder: str):
         self.output_folder = output_root_folder
         # Expecting parent AspnCppBackend to clear output folder
@@ -593,7 +659,7 @@ class AspnYamlToCppHeader(Backend):
                 docstr += '\nUse NaN if there is no value.'
 
         docstr = format_docstring(doc_string, indent=INDENT)
-        field_str = f"{f_type} {f_name}"
+        field_str = f"const {f_type}& {f_name}"
 
         if type_name.startswith(ASPN_PREFIX):
             ftype = type_name[len(ASPN_PREFIX) :].strip("*")
@@ -604,7 +670,20 @@ class AspnYamlToCppHeader(Backend):
             f"{docstr}{INDENT}{f_type} get_{f_name}() const"
         )
         self.current_struct.struct_fields_buf.append(
-            f"{docstr}{INDENT}void set_{f_name}({f_type})"
+            f"{docstr}{INDENT}void set_{f_name}(const {f_type}&)"
+        )
+        if isinstance(data_len, str):
+            if type_name.startswith(ASPN_PREFIX):
+                self.current_struct.includes.append('#include "buffers.hpp"')
+            else:
+                self._add_take_setter(f_name, type_name, ['length'])
+        self._add_view(
+            f_name,
+            (
+                f'std::span<const {type_name.strip("*")}>'
+                if type_name.startswith(ASPN_PREFIX)
+                else f'VectorView<{type_name}>'
+            ),
         )
 
     def process_matrix_field(
@@ -631,15 +710,22 @@ class AspnYamlToCppHeader(Backend):
         except ValueError:
             pass
 
-        field_str = f"{self.matrix(type_name)} {field_name}"
+        field_str = f"const {self.matrix(type_name)}& {field_name}"
 
         self.current_struct.constructor_param_buf.append(field_str)
         self.current_struct.struct_fields_buf.append(
             f"{docstr}{INDENT}{self.matrix(type_name)} get_{field_name}() const"
         )
         self.current_struct.struct_fields_buf.append(
-            f"{docstr}{INDENT}void set_{field_name}({self.matrix(type_name)})"
+            f"{docstr}{INDENT}void set_{field_name}(const {self.matrix(type_name)}&)"
         )
+        if isinstance(x, str):
+            self._add_take_setter(
+                field_name,
+                type_name,
+                ['rows', 'cols'] if x != y else ['size', 'size'],
+            )
+        self._add_view(field_name, f'MatrixView<{type_name}>')
 
     def process_outer_managed_pointer_field(
         self,
@@ -710,12 +796,13 @@ class AspnYamlToCppHeader(Backend):
             return
 
         field_str = f"{field_type_name} {field_name}"
+        nested = field_type_name.startswith(f"{ASPN_PREFIX}Type")
 
-        if field_type_name.startswith(f"{ASPN_PREFIX}Type"):
+        if nested:
             # If one of the fields of the current struct is another ASPN
             # struct, be sure to include its header file.
             field_type_name = field_type_name[len(ASPN_PREFIX) :].strip("*")
-            field_str = f"{field_type_name} {field_name}"
+            field_str = f"const {field_type_name}& {field_name}"
             self.current_struct.includes.append(
                 f'#include "{field_type_name}.hpp"'
             )
@@ -742,9 +829,17 @@ class AspnYamlToCppHeader(Backend):
         self.current_struct.struct_fields_buf.append(
             f"{docstr}{INDENT}{field_type_name} {self.current_struct.virtual} get_{field_name}() const"
         )
-        self.current_struct.struct_fields_buf.append(
-            f"{docstr}{INDENT}void {self.current_struct.virtual} set_{field_name}({field_type_name})"
-        )
+        if nested:
+            self.current_struct.struct_fields_buf.append(
+                f"{docstr}{INDENT}void {self.current_struct.virtual} set_{field_name}(const {field_type_name}&)"
+            )
+            self.current_struct.struct_fields_buf.append(
+                f"{docstr}{INDENT}void {self.current_struct.virtual} set_{field_name}({field_type_name}&&)"
+            )
+        else:
+            self.current_struct.struct_fields_buf.append(
+                f"{docstr}{INDENT}void {self.current_struct.virtual} set_{field_name}({field_type_name})"
+            )
 
     def process_class_docstring(self, doc_string: str, nullable: bool = False):
         self.current_struct.struct_docstr = doc_string
@@ -795,6 +890,9 @@ class AspnYamlToXtensorHeader(AspnYamlToCppHeader):
     def matrix(self, type: str) -> str:
         return f'xt::xarray<{type}>'
 
+    def view_aliases(self) -> str:
+        return XTENSOR_VIEW_ALIASES
+
 
 class AspnYamlToXtensorPyHeader(AspnYamlToCppHeader):
     def __init__(self):
@@ -812,6 +910,9 @@ class AspnYamlToXtensorPyHeader(AspnYamlToCppHeader):
     def matrix(self, type: str) -> str:
         return f'xt::pyarray<{type}>'
 
+    def view_aliases(self) -> str:
+        return XTENSOR_VIEW_ALIASES
+
 
 class AspnYamlToEigenHeader(AspnYamlToCppHeader):
     def __init__(self):
@@ -827,6 +928,14 @@ class AspnYamlToEigenHeader(AspnYamlToCppHeader):
     def matrix(self, type: str) -> str:
         return f'Eigen::Matrix<{type}, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor>'
 
+    def view_aliases(self) -> str:
+        return f"""
+            template <class T>
+            using VectorView = Eigen::Map<const {self.vector('T')}>;
+            template <class T>
+            using MatrixView = Eigen::Map<const {self.matrix('T')}>;
+        """
+
 
 class AspnYamlToStlHeader(AspnYamlToCppHeader):
     def __init__(self):
@@ -841,3 +950,12 @@ class AspnYamlToStlHeader(AspnYamlToCppHeader):
 
     def matrix(self, type: str) -> str:
         return f'std::vector<{type}>'
+
+    def view_aliases(self) -> str:
+        return """
+            template <class T>
+            using VectorView = std::span<const T>;
+            // Row-major, like the getters
+            template <class T>
+            using MatrixView = std::span<const T>;
+        """
@@ -12,6 +12,9 @@ from firehose.backends.aspn.utils import (
     is_length_field,
 )
 
+ASPN_DIR = ASPN_PREFIX.lower()
+MEM_FREE = f'{ASPN_PREFIX.lower()}_mem_free'
+
 EXTRA_CPP_INC = {
     'TypeTimestamp': """
 #include <iomanip>
@@ -414,6 +417,13 @@ class Struct:
                 this->c_struct = replacement_struct;
             }}}}
 
+            {self.struct_name}* {self.class_name}::release_aspn_c() {{{{
+                if (!this->take_ownership) return nullptr;
+                auto released = this->c_struct;
+                this->c_struct = nullptr;
+                return released;
+            }}}}
+
 
             {{setters_getters}}
 
@@ -459,6 +469,16 @@ class AspnYamlToCppSource(Backend):
     def matrix_to_pointer(self) -> str:
         pass
 
+    def pointer_to_vector_view(
+        self, pointer: str, length: str, type: str
+    ) -> str:
+        pass
+
+    def pointer_to_matrix_view(
+        self, pointer: str, rows: str, cols: str, type: str
+    ) -> str:
+        pass
+
     def length(self, field: str) -> str:
         pass
 
@@ -566,6 +586,33 @@ class AspnYamlToCppSource(Backend):
                         f'{field_name}.size()'
                     )
             fn_basename = pascal_to_snake(f_type)
+            c_type = f_type.strip("*")
+            if isinstance(data_len, str):
+                # Deep copy every element once, straight into the buffer the
+                # C struct adopts
+                copy_elements = f"""
+                    auto buffer = make_aspn_buffer<{c_type}>({field_name}.size());
+                    for (size_t ii = 0; ii < {field_name}.size(); ii++) {{
+                        if (!{fn_basename}_copy_into(&buffer[ii], {field_name}[ii].get_aspn_c())) {{
+                            for (size_t jj = 0; jj <= ii; jj++)
+                                {fn_basename}_free_members(&buffer[jj]);
+                            throw std::bad_alloc();
+                        }}
+                    }}
+                    if (c_struct->{field_name} != nullptr) {{
+                        for (size_t ii = 0; ii < {data_len}; ii++)
+                            {fn_basename}_free_members(&c_struct->{field_name}[ii]);
+                    }}
+                    {MEM_FREE}(c_struct->{field_name});
+                    c_struct->{field_name} = buffer.release();
+                    """
+            else:
+                copy_elements = f"""
+                    for (size_t ii = 0; ii < {field_name}.size() && ii < {data_len}; ii++) {{
+                        if (!{fn_basename}_copy_into(&c_struct->{field_name}[ii], {field_name}[ii].get_aspn_c()))
+                            throw std::bad_alloc();
+                    }}
+                    """
             self.current_struct.setters_getters_buf.append(f"""
                 std::vector<{type_name}> {self.current_struct.class_name}::get_{field_name}() const {{
                     nullptr_check();
@@ -577,17 +624,20 @@ class AspnYamlToCppSource(Backend):
                     return out;
                 }}
 
-                void {self.current_struct.class_name}::set_{field_name}(std::vector<{type_name}> {field_name}) {{
+                void {self.current_struct.class_name}::set_{field_name}(const std::vector<{type_name}>& {field_name}) {{
                     nullptr_check();
-                    for (size_t ii = 0; ii < {field_name}.size(); ii++) {{
-                        auto c_object = {field_name}[ii].get_aspn_c();
-                        c_struct->{field_name}[ii] = *c_object;
-                    }}
+                    {copy_elements}
                     {set_lengths}
                 }}
+
+                std::span<const {f_type.strip("*")}> {self.current_struct.class_name}::view_{field_name}() const {{
+                    nullptr_check();
+                    const {f_type.strip("*")}* data = c_struct->{field_name};
+                    return {{data, {f'data == nullptr ? 0 : static_cast<std::size_t>({data_len})' if isinstance(data_len, str) else data_len}}};
+                }}
             """)
             self.current_struct.constructor_param_buf.append(
-                f'std::vector<{type_name}> {field_name}'
+                f'const std::vector<{type_name}>& {field_name}'
             )
             self.current_struct.param_passthrough.append(f'{field_name}_prep')
             self.current_struct.param_getters.append(f'{field_name}_prep')
@@ -602,7 +652,7 @@ class AspnYamlToCppSource(Backend):
             if isinstance(data_len, str):
                 get_ptr = f'c_struct->{field_name}'
                 data_len = 'c_struct->' + data_len
-                set_lengths = f'{data_len} = {self.length(field_name)};'
+                set_lengths = f'{data_len} = length;'
                 # Special case: the time measurement uses one length field
                 # (num_obs) for multiple data fields. In this case, length
                 # is already set.
@@ -626,7 +676,7 @@ class AspnYamlToCppSource(Backend):
 
                 # All variable-length arrays
                 self.current_struct.param_passthrough.append(
-                    f'{field_name}.data()'
+                    f'const_cast<{type_name}*>({field_name}.data())'
                 )
                 self.current_struct.param_getters.append(
                     f'other.get_{field_name}().data()'
@@ -649,21 +699,46 @@ class AspnYamlToCppSource(Backend):
                     f'{field_name}_prep'
                 )
                 self.current_struct.param_getters.append(f'{field_name}_prep')
+
+            if ptr_field_check:
+                # Copy once into a buffer from the ASPN allocator, which the
+                # rvalue overload then hands to the C struct
+                setter = f"""
+            void {self.current_struct.class_name}::set_{field_name}(const {self.vector(type_name)}& {field_name}) {{
+                set_{field_name}(copy_to_aspn_buffer<{type_name}>({field_name}.data(), {self.length(field_name)}), {self.length(field_name)});
+            }}
+
+            void {self.current_struct.class_name}::set_{field_name}(AspnBuffer<{type_name}>&& {field_name}, std::size_t length) {{
+                nullptr_check();
+                {MEM_FREE}(c_struct->{field_name});
+                c_struct->{field_name} = {field_name}.release();
+                {set_lengths}
+            }}
+            """
+            else:
+                setter = f"""
+            void {self.current_struct.class_name}::set_{field_name}(const {self.vector(type_name)}& {field_name}) {{
+                nullptr_check();
+                memcpy(c_struct->{field_name}, {field_name}.data(), {data_len} * sizeof({type_name}));
+            }}
+            """
             self.current_struct.setters_getters_buf.append(f"""
                 {self.vector(type_name)} {self.current_struct.class_name}::get_{field_name}() const {{
                     nullptr_check();
                     {ptr_field_check}
                     {self.pointer_to_vector(get_ptr, data_len, type_name)}
                 }}
+            {setter}
 
-            void {self.current_struct.class_name}::set_{field_name}({self.vector(type_name)} {field_name}) {{
+            VectorView<{type_name}> {self.current_struct.class_name}::view_{field_name}() const {{
                 nullptr_check();
-                memcpy(c_struct->{field_name}, {field_name}.data(), {data_len} * sizeof({type_name}));
-                {set_lengths}
+                const {type_name}* data = {get_ptr};
+                std::size_t length = {f'data == nullptr ? 0 : {data_len}' if ptr_field_check else data_len};
+                {self.pointer_to_vector_view('data', 'length', type_name)}
             }}
             """)
             self.current_struct.constructor_param_buf.append(
-                f'{self.vector(type_name)} {field_name}'
+                f'const {self.vector(type_name)}& {field_name}'
             )
 
     def process_matrix_field(
@@ -707,10 +782,9 @@ class AspnYamlToCppSource(Backend):
             # Sometimes one size field is used twice. Make sure that isn't the
             # case here.
             if x != y:
-                set_lengths = f'''
-                    {x} = {self.num_rows(field_name)};
-                    {y} = {self.num_cols(field_name)};
-                '''
+                shape = f'({self.num_rows(field_name)}), ({self.num_cols(field_name)})'
+                shape_params = 'std::size_t rows, std::size_t cols'
+                set_lengths = f'{x} = rows; {y} = cols;'
                 self.current_struct.param_getters.append(
                     self.num_cols(f'other.get_{field_name}()')
                 )
@@ -718,9 +792,9 @@ class AspnYamlToCppSource(Backend):
                     {self.num_cols(field_name)}
                 )
             else:
-                set_lengths = f'''
-                    {x} = {self.num_cols(field_name)};
-                '''
+                shape = self.num_cols(field_name)
+                shape_params = 'std::size_t size'
+                set_lengths = f'{x} = size;'
 
             ptr_field_check = (
                 f'if (c_struct->{field_name} == nullptr) return {{}};'
@@ -728,7 +802,7 @@ class AspnYamlToCppSource(Backend):
             get_ptr = f'c_struct->{field_name}'
 
             self.current_struct.param_passthrough.append(
-                f'{field_name}{self.matrix_to_pointer()}'
+                f'const_cast<{type_name}*>({field_name}{self.matrix_to_pointer()})'
             )
             self.current_struct.param_getters.append(
                 f'other.get_{field_name}(){self.matrix_to_pointer()}'
@@ -754,21 +828,44 @@ class AspnYamlToCppSource(Backend):
             )
             raise NotImplementedError
 
+        if ptr_field_check:
+            setter = f"""
+        void {self.current_struct.class_name}::set_{field_name}(const {self.matrix(type_name)}& {field_name}) {{
+            set_{field_name}(copy_to_aspn_buffer<{type_name}>({field_name}{self.matrix_to_pointer()}, {self.length(field_name)}), {shape});
+        }}
+
+        void {self.current_struct.class_name}::set_{field_name}(AspnBuffer<{type_name}>&& {field_name}, {shape_params}) {{
+            nullptr_check();
+            {MEM_FREE}(c_struct->{field_name});
+            c_struct->{field_name} = {field_name}.release();
+            {set_lengths}
+        }}
+        """
+        else:
+            setter = f"""
+        void {self.current_struct.class_name}::set_{field_name}(const {self.matrix(type_name)}& {field_name}) {{
+            nullptr_check();
+            memcpy(c_struct->{field_name}, {field_name}{self.matrix_to_pointer()}, {x} * {y} * sizeof({type_name}));
+        }}
+        """
         self.current_struct.setters_getters_buf.append(f"""
             {self.matrix(type_name)} {self.current_struct.class_name}::get_{field_name}() const {{
                 nullptr_check();
                 {ptr_field_check}
                 {self.pointer_to_matrix(get_ptr, x, y, type_name)}
             }}
+        {setter}
 
-        void {self.current_struct.class_name}::set_{field_name}({self.matrix(type_name)} {field_name}) {{
+        MatrixView<{type_name}> {self.current_struct.class_name}::view_{field_name}() const {{
             nullptr_check();
-            memcpy(c_struct->{field_name}, {field_name}{self.matrix_to_pointer()}, {x} * {y} * sizeof({type_name}));
-            {set_lengths}
+            const {type_name}* data = {get_ptr};
+            std::size_t rows = {f'data == nullptr ? 0 : {x}' if ptr_field_check else x};
+            std::size_t cols = {f'data == nullptr ? 0 : {y}' if ptr_field_check else y};
+            {self.pointer_to_matrix_view('data', 'rows', 'cols', type_name)}
         }}
         """)
 
-        field_str = f"{self.matrix(type_name)} {field_name}"
+        field_str = f"const {self.matrix(type_name)}& {field_name}"
         self.current_struct.constructor_param_buf.append(field_str)
 
     def process_outer_managed_pointer_field(
@@ -808,8 +905,8 @@ class AspnYamlToCppSource(Backend):
 
             void {self.current_struct.class_name}::set_{field_name}(const std::string& {field_name}) {{
                 nullptr_check();
-                free(c_struct->{field_name});
-                c_struct->{field_name} = strdup({field_name}.c_str());
+                {ASPN_DIR}_mem_free(c_struct->{field_name});
+                c_struct->{field_name} = {ASPN_DIR}_mem_strdup({field_name}.c_str());
             }}
             """)
         self.current_struct.constructor_param_buf.append(
@@ -884,13 +981,29 @@ class AspnYamlToCppSource(Backend):
                         return {function_basename}_copy(&c_struct->{field_name});
                     }}
                     """)
+            # The rvalue overload takes over the nested struct's heap memory
+            # when the argument owns it, and falls back to a deep copy when
+            # the argument only wraps a struct owned by someone else.
             self.current_struct.setters_getters_buf.append(f"""
-                void {self.current_struct.class_name}::set_{field_name}({field_type_name} {field_name}) {{
+                void {self.current_struct.class_name}::set_{field_name}(const {field_type_name}& {field_name}) {{
+                    nullptr_check();
+                    if (!{function_basename}_copy_into(&c_struct->{field_name}, {field_name}.get_aspn_c()))
+                        throw std::bad_alloc();
+                }}
+
+                void {self.current_struct.class_name}::set_{field_name}({field_type_name}&& {field_name}) {{
                     nullptr_check();
-                    auto c_object = std::move({field_name}).get_aspn_c();
-                    c_struct->{field_name} = *c_object;
+                    auto released = {field_name}.release_aspn_c();
+                    if (released == nullptr) {{
+                        set_{field_name}(static_cast<const {field_type_name}&>({field_name}));
+                        return;
+                    }}
+                    {function_basename}_free_members(&c_struct->{field_name});
+                    c_struct->{field_name} = *released;
+                    {MEM_FREE}(released);
                 }}
                 """)
+            field_str = f"const {field_type_name}& {field_name}"
         else:
             self.current_struct.param_passthrough.append(field_name)
             self.current_struct.param_getters.append(
@@ -907,7 +1020,7 @@ class AspnYamlToCppSource(Backend):
                     c_struct->{field_name} = {field_name};
                 }}
                 """)
-        field_str = f"{field_type_name} {field_name}"
+            field_str = f"{field_type_name} {field_name}"
         self.current_struct.constructor_param_buf.append(field_str)
 
     def process_class_docstring(self, doc_string: str, nullable: bool = False):
@@ -977,6 +1090,18 @@ class AspnYamlToXtensorSource(AspnYamlToCppSource):
     def matrix_to_pointer(self) -> str:
         return '.data()'
 
+    def pointer_to_vector_view(
+        self, pointer: str, length: str, type: str
+    ) -> str:
+        return f'''std::vector<std::size_t> shape = {{{length}}};
+            return xt::adapt({pointer}, {length}, xt::no_ownership(), shape);'''
+
+    def pointer_to_matrix_view(
+        self, pointer: str, rows: str, cols: str, type: str
+    ) -> str:
+        return f'''std::vector<std::size_t> shape = {{{rows}, {cols}}};
+            return xt::adapt({pointer}, {rows} * {cols}, xt::no_ownership(), shape);'''
+
     def length(self, field: str) -> str:
         return f'{field}.size()'
 
@@ -1029,6 +1154,16 @@ class AspnYamlToEigenSource(AspnYamlToCppSource):
     def matrix_to_pointer(self) -> str:
         return '.data()'
 
+    def pointer_to_vector_view(
+        self, pointer: str, length: str, type: str
+    ) -> str:
+        return f'return VectorView<{type}>({pointer}, {length});'
+
+    def pointer_to_matrix_view(
+        self, pointer: str, rows: str, cols: str, type: str
+    ) -> str:
+        return f'return MatrixView<{type}>({pointer}, {rows}, {cols});'
+
     def length(self, field: str) -> str:
         return f'{field}.size()'
 
@@ -1069,6 +1204,16 @@ class AspnYamlToStlSource(AspnYamlToCppSource):
     def matrix_to_pointer(self) -> str:
         return '.data()'
 
+    def pointer_to_vector_view(
+        self, pointer: str, length: str, type: str
+    ) -> str:
+        return f'return VectorView<{type}>({pointer}, {length});'
+
+    def pointer_to_matrix_view(
+        self, pointer: str, rows: str, cols: str, type: str
+    ) -> str:
+        return f'return MatrixView<{type}>({pointer}, {rows} * {cols});'
+
     def length(self, field: str) -> str:
         return f'{field}.size()'
 
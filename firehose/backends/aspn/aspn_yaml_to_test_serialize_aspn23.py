@@ -0,0 +1,157 @@
+from os.path import join
+from firehose.backends.aspn.aspn_yaml_to_bench_aspn23 import (
+    AspnYamlToBenchAspn23,
+)
+from firehose.backends.aspn.utils import ASPN_PREFIX, format_and_write_to_file
+
+ASPN_PREFIX_LOWER = ASPN_PREFIX.lower()
+
+
+class AspnYamlToTestSerializeAspn23:
+    """
+    Generates tests/test_serialize_aspn23.c, which round-trips one instance
+    of every message type through the generated serialization and checks
+    that truncated and corrupted frames are rejected or decode safely.
+
+    The messages are built by the make_ functions of AspnYamlToBenchAspn23,
+    so it must run after AspnYamlToCSource.
+    """
+
+    def __init__(self, bench_generator: AspnYamlToBenchAspn23):
+        self.bench_generator = bench_generator
+
+    def set_output_root_folder(self, output_root_folder: str):
+        self.output_folder = output_root_folder
+        # Expecting parent AspnCBackend to clear output folder
+
+    def generate(self):
+        structs = self.bench_generator.c_source_generator.structs
+        messages = [s for s in structs if s.is_message]
+
+        includes = '\n'.join(
+            f'#include <{ASPN_PREFIX_LOWER}/{s.struct_name[len(ASPN_PREFIX) :]}.h>'
+            for s in structs
+        )
+        snake = self.bench_generator._snake_name
+        view_inits = '\n'.join(f"""
+            static bool view_init_{snake(s)}(const uint8_t* buf, size_t len) {{
+                {s.struct_name}View view;
+                return {s.fn_basename}_view_init(&view, buf, len);
+            }}""" for s in messages)
+        checks = '\n'.join(f"""
+            if (check_message((AspnBase*)make_{snake(s)}(), view_init_{snake(s)}) != 0) {{
+                fprintf(stderr, "{self.bench_generator.c_source_generator.serial_tag(s)} failed\\n");
+                failures++;
+            }}""" for s in messages)
+
+        c_file_contents = f"""
+            /*
+            * This code is generated via firehose.
+            * DO NOT hand edit code.  Make any changes required using the firehose repo instead.
+            *
+            * Serializes one instance of every ASPN message and checks that it decodes to
+            * an equal message, that every truncation of the frame is rejected, and that
+            * corrupting any byte either is rejected or decodes to a message of the same
+            * type and size. The type's _view_init() must accept exactly the frames
+            * that deserialize. Run under a sanitizer, the corruption pass also shows that
+            * malformed input is never read out of bounds.
+            */
+
+            #include <stdio.h>
+            #include <stdlib.h>
+            #include <string.h>
+
+            #include <{ASPN_PREFIX_LOWER}/compare.h>
+            #include <{ASPN_PREFIX_LOWER}/utils.h>
+            {includes}
+
+            /* Elements per dimension of every array and matrix */
+            #define BENCH_LENGTH 4
+
+            #define CHECK(condition)                                                 \\
+                do {{                                                                 \\
+                    if (!(condition)) {{                                             \\
+                        fprintf(stderr, "%s:%d: CHECK(%s) failed\\n", __FILE__, __LINE__, #condition); \\
+                        return 1;                                                   \\
+                    }}                                                               \\
+                }} while (0)
+
+            typedef bool (*ViewInit)(const uint8_t* buf, size_t len);
+
+            {self.bench_generator.make_functions()}
+
+            {view_inits}
+
+            static int check_frame(uint8_t* buf, size_t size, {ASPN_PREFIX}MessageType type, ViewInit view_init) {{
+                static const uint8_t flips[] = {{0x01, 0x80, 0xff}};
+                AspnBase* decoded;
+
+                for (size_t len = 0; len < size; len++) {{
+                    CHECK({ASPN_PREFIX_LOWER}_message_deserialize(buf, len, NULL) == NULL);
+                    CHECK(!view_init(buf, len));
+                }}
+
+                for (size_t ii = 0; ii < size; ii++) {{
+                    for (size_t ff = 0; ff < sizeof(flips); ff++) {{
+                        buf[ii] ^= flips[ff];
+                        decoded = {ASPN_PREFIX_LOWER}_message_deserialize(buf, size, NULL);
+                        CHECK(view_init(buf, size) == (decoded != NULL));
+                        buf[ii] ^= flips[ff];
+                        if (decoded == NULL) continue;
+                        CHECK(decoded->message_type == type);
+                        CHECK({ASPN_PREFIX_LOWER}_message_serialized_size(decoded) == size);
+                        {ASPN_PREFIX_LOWER}_mem_free(decoded);
+                    }}
+                }}
+                return 0;
+            }}
+
+            static int check_message(AspnBase* message, ViewInit view_init) {{
+                const {ASPN_PREFIX}MessageTypeInfo* info;
+                {ASPN_PREFIX}MessageType type;
+                AspnBase* decoded;
+                uint8_t* buf;
+                size_t size;
+                int result;
+
+                CHECK(message != NULL);
+                type = message->message_type;
+                info = {ASPN_PREFIX_LOWER}_message_type_info(type);
+                CHECK(info != NULL);
+                size = {ASPN_PREFIX_LOWER}_message_serialized_size(message);
+                buf = (uint8_t*)malloc(size);
+                CHECK(buf != NULL);
+
+                CHECK({ASPN_PREFIX_LOWER}_message_serialize(message, buf, size - 1) == 0);
+                CHECK({ASPN_PREFIX_LOWER}_message_serialize(message, buf, size) == size);
+                decoded = {ASPN_PREFIX_LOWER}_message_deserialize(buf, size, NULL);
+                CHECK(decoded != NULL);
+                CHECK(view_init(buf, size));
+                CHECK({ASPN_PREFIX_LOWER}_message_equals(message, decoded, {ASPN_PREFIX.upper()}_EQUALS_NAN_EQUAL));
+                {ASPN_PREFIX_LOWER}_mem_free(decoded);
+
+                result = check_frame(buf, size, type, view_init);
+
+                /* The frame tag and the message type in the header must agree */
+                message->message_type = ASPN_UNDEFINED;
+                CHECK(info->serialize(message, buf, size) == size);
+                CHECK({ASPN_PREFIX_LOWER}_message_deserialize(buf, size, NULL) == NULL);
+                CHECK(info->deserialize(buf, size, NULL) == NULL);
+                CHECK(!view_init(buf, size));
+                message->message_type = type;
+
+                free(buf);
+                {ASPN_PREFIX_LOWER}_free(message);
+                return result;
+            }}
+
+            int main(void) {{
+                int failures = 0;
+                {checks}
+                if (failures == 0) printf("test_serialize_aspn23 passed\\n");
+                return failures == 0 ? 0 : 1;
+            }}
+            """
+
+        output_filepath = join(self.output_folder, 'test_serialize_aspn23.c')
+        format_and_write_to_file(c_file_contents, output_filepath)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+from os.path import abspath, dirname, join
+
+FIREHOSE_ROOT = abspath(join(dirname(__file__), '..', '..', '..', '..'))
+DEFAULT_BUILD_DIR = join(FIREHOSE_ROOT, 'build', 'bench_build')
+DEFAULT_BASELINE = join(FIREHOSE_ROOT, 'build', 'build_baseline.json')
+
+# Build ASPN-C, every ASPN-C++ variant and the xtensor_py module; nothing else
+MESON_OPTIONS = [
+    '-Daspn-c=enabled',
+    '-Daspn-cpp=enabled',
+    '-Daspn-cpp-eigen=enabled',
+    '-Daspn-cpp-stl=enabled',
+    '-Daspn-cpp-xtensor=enabled',
+    '-Daspn-cpp-xtensor-py=enabled',
+    '-Dlcm-generated=disabled',
+    '-Ddds-generated=disabled',
+]
+
+OBJECT_SUFFIXES = ('.o', '.obj')
+
+
+def is_shared_library(path):
+    name = os.path.basename(path)
+    return name.endswith('.so') or '.so.' in name or name.endswith('.dylib')
+
+
+def build(staged_dir, build_dir, jobs, meson_args):
+    """
+    Configures and builds the staged meson tree from scratch so every TU is
+    compiled (and timed) exactly once. ccache is disabled so cache hits do
+    not masquerade as fast compiles.
+    """
+    env = os.environ.copy()
+    env['CCACHE_DISABLE'] = '1'
+    shutil.rmtree(build_dir, ignore_errors=True)
+    subprocess.run(
+        ['meson', 'setup', build_dir, staged_dir] + MESON_OPTIONS + meson_args,
+        check=True,
+        env=env,
+    )
+    subprocess.run(
+        ['ninja', '-C', build_dir, '-j', str(jobs)], check=True, env=env
+    )
+
+
+def read_ninja_log(build_dir):
+    """
+    Returns {output: milliseconds} for the most recent build of each output
+    recorded in .ninja_log (format v5: start, end, mtime, output, hash).
+    """
+    durations = {}
+    with open(join(build_dir, '.ninja_log')) as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 4:
+                continue
+            start, end, output = int(fields[0]), int(fields[1]), fields[3]
+            durations[output] = end - start
+    return durations
+
+
+def collect_metrics(build_dir):
+    durations = read_ninja_log(build_dir)
+    tus = {}
+    libraries = {}
+    for output, milliseconds in sorted(durations.items()):
+        path = join(build_dir, output)
+        if not os.path.isfile(path):
+            continue
+        if output.endswith(OBJECT_SUFFIXES):
+            tus[output] = {
+                'seconds': milliseconds / 1000.0,
+                'object_bytes': os.path.getsize(path),
+            }
+        elif is_shared_library(output) and not os.path.islink(path):
+            libraries[output] = os.path.getsize(path)
+
+    return {
+        'tus': tus,
+        'libraries': libraries,
+        'totals': {
+            'compile_seconds': sum(tu['seconds'] for tu in tus.values()),
+            'object_bytes': sum(tu['object_bytes'] for tu in tus.values()),
+            'library_bytes': sum(libraries.values()),
+        },
+    }
+
+
+def regressed(baseline, current, threshold, minimum):
+    return current - baseline > max(baseline * threshold, minimum)
+
+
+def compare(baseline, current, threshold, min_seconds, min_bytes):
+    """
+    Returns a list of human readable regressions of current against
+    baseline. A value regresses when it grows by more than `threshold`
+    (a fraction) and by more than the absolute noise floor of its unit.
+    """
+    regressions = []
+
+    def check(name, unit, base, now, minimum):
+        if regressed(base, now, threshold, minimum):
+            growth = (now - base) / base * 100 if base else float('inf')
+            regressions.append(
+                f"{name}: {base:.2f}{unit} -> {now:.2f}{unit} (+{growth:.0f}%)"
+            )
+
+    for key, minimum, unit in [
+        ('compile_seconds', min_seconds, 's'),
+        ('object_bytes', min_bytes, 'B'),
+        ('library_bytes', min_bytes, 'B'),
+    ]:
+        check(
+            f"total {key}",
+            unit,
+            baseline['totals'][key],
+            current['totals'][key],
+            minimum,
+        )
+
+    for output, tu in current['tus'].items():
+        base = baseline['tus'].get(output)
+        if base is None:
+            continue
+        check(output, 's', base['seconds'], tu['seconds'], min_seconds)
+        check(output, 'B', base['object_bytes'], tu['object_bytes'], min_bytes)
+
+    for output, size in current['libraries'].items():
+        base = baseline['libraries'].get(output)
+        if base is not None:
+            check(output, 'B', base, size, min_bytes)
+
+    return regressions
+
+
+def print_report(metrics, slowest):
+    tus = sorted(
+        metrics['tus'].items(),
+        key=lambda item: item[1]['seconds'],
+        reverse=True,
+    )
+    print(f"\nSlowest {min(slowest, len(tus))} translation units:")
+    for output, tu in tus[:slowest]:
+        print(f"  {tu['seconds']:8.2f}s {tu['object_bytes']:>10}B  {output}")
+
+    print("\nShared libraries:")
+    for output, size in sorted(metrics['libraries'].items()):
+        print(f"  {size:>10}B  {output}")
+
+    totals = metrics['totals']
+    print(
+        f"\n{len(tus)} TUs, {totals['compile_seconds']:.1f}s compile time, "
+        f"{totals['object_bytes']}B of objects, "
+        f"{totals['library_bytes']}B of shared libraries"
+    )
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Build the generated ASPN-C and ASPN-C++ libraries from a staged "
+            "meson tree and track per-TU compile time, object size and shared "
+            "library size against a JSON baseline."
+        )
+    )
+    parser.add_argument(
+        "staged_dir", help="Staged generate.py output directory"
+    )
+    parser.add_argument(
+        "--build-dir",
+        default=DEFAULT_BUILD_DIR,
+        help=f"Meson build directory. Defaults to {DEFAULT_BUILD_DIR}",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=DEFAULT_BASELINE,
+        help=f"JSON baseline to compare against. Defaults to {DEFAULT_BASELINE}",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Write the measured metrics to the baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="Allowed growth in percent before flagging a regression",
+    )
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.5,
+        help="Ignore compile time changes smaller than this (noise floor)",
+    )
+    parser.add_argument(
+        "--min-bytes",
+        type=int,
+        default=4096,
+        help="Ignore size changes smaller than this (noise floor)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help=(
+            "Parallel compile jobs. Defaults to 1, since concurrent compiles "
+            "skew per-TU timings"
+        ),
+    )
+    parser.add_argument(
+        "--slowest",
+        type=int,
+        default=10,
+        help="Number of slowest translation units to report",
+    )
+    parser.add_argument(
+        "--meson-args",
+        nargs=argparse.REMAINDER,
+        default=[],
+        help="Extra arguments passed to meson setup",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+
+    build(abspath(args.staged_dir), args.build_dir, args.jobs, args.meson_args)
+    metrics = collect_metrics(args.build_dir)
+    print_report(metrics, args.slowest)
+
+    if args.update_baseline or not os.path.isfile(args.baseline):
+        os.makedirs(dirname(abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(metrics, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nWrote baseline {args.baseline}")
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare(
+        baseline,
+        metrics,
+        args.threshold / 100.0,
+        args.min_seconds,
+        args.min_bytes,
+    )
+    new_tus = sorted(set(metrics['tus']) - set(baseline['tus']))
+    if new_tus:
+        print(f"\n{len(new_tus)} TUs are not in the baseline:")
+        for output in new_tus:
+            print(f"  {output}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} regressions past {args.threshold}%:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(
+        f"\n✅ No regressions past {args.threshold}% against {args.baseline}"
+    )
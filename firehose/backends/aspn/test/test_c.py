@@ -1,72 +1,281 @@
 #!/usr/bin/env python3
 
+import argparse
 import os
-import sys
+import shutil
 import subprocess
+import sys
+import sysconfig
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from shutil import rmtree
 
+C_FLAGS = ['-std=c99', '-O3', '-Wall', '-Werror', '-pedantic']
+CPP_FLAGS = ['-std=c++20', '-O1', '-Wall', '-Werror']
+
+# Matrix variants of ASPN-C++, i.e. the subdirectories of src/aspn23/
+CPP_VARIANTS = ['xtensor', 'xtensor_py', 'eigen', 'stl']
+
+# pkg-config modules providing the third party headers of each variant
+VARIANT_PKG_CONFIG = {
+    'xtensor': ['xtensor'],
+    'xtensor_py': ['xtensor', 'xtensor-python', 'pybind11'],
+    'eigen': ['eigen3'],
+    'stl': [],
+}
+
+
+class CompileJob:
+    def __init__(self, path, language, variant=None):
+        self.path = path
+        self.language = language  # 'c' or 'c++'
+        self.variant = variant
+        self.seconds = 0.0
+        self.returncode = None
+        self.output = ''
+
+
+def find_include_dirs(directory):
+    """
+    Returns every directory under `directory` that contains an `aspn23`
+    subdirectory, so `#include <aspn23/...>` resolves for both ASPN-C and
+    ASPN-C++ sources.
+    """
+    include_dirs = []
+    for root, dirs, _ in os.walk(directory):
+        if 'aspn23' in dirs:
+            include_dirs.append(root)
+    if os.path.basename(os.path.abspath(directory)) == 'aspn23':
+        include_dirs.append(os.path.dirname(os.path.abspath(directory)))
+    return sorted(include_dirs)
+
+
+def get_variant(path):
+    parts = os.path.normpath(path).split(os.sep)
+    for i, part in enumerate(parts[:-1]):
+        if part == 'aspn23' and parts[i + 1] in CPP_VARIANTS:
+            return parts[i + 1]
+    return None
+
+
+def collect_jobs(directory, variants, languages):
+    jobs = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            if file.endswith('.c') and 'c' in languages:
+                jobs.append(CompileJob(path, 'c'))
+            elif file.endswith(('.cpp', '.hpp')) and 'c++' in languages:
+                variant = get_variant(path)
+                if variant in variants:
+                    jobs.append(CompileJob(path, 'c++', variant))
+    return jobs
+
+
+def pkg_config_cflags(modules):
+    if not modules or shutil.which('pkg-config') is None:
+        return []
+    flags = []
+    for module in modules:
+        result = subprocess.run(
+            ['pkg-config', '--cflags', module],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        if result.returncode == 0:
+            # Third party headers should not trip -Werror
+            flags += [
+                '-isystem' + flag[2:] if flag.startswith('-I') else flag
+                for flag in result.stdout.split()
+            ]
+    return flags
+
+
+def variant_cflags(variant):
+    flags = pkg_config_cflags(VARIANT_PKG_CONFIG[variant])
+    if variant == 'xtensor_py':
+        flags += ['-isystem' + sysconfig.get_paths()['include']]
+        try:
+            import numpy
+
+            flags += ['-isystem' + numpy.get_include()]
+        except ImportError:
+            pass
+    return flags
+
+
+def build_command(job, compiler, include_dirs, extra_flags, object_file):
+    cmd = [compiler] + (C_FLAGS if job.language == 'c' else CPP_FLAGS)
+    cmd += ['-I' + include_dir for include_dir in include_dirs]
+    cmd += extra_flags
+    if job.path.endswith('.hpp'):
+        # Headers are checked on their own for self-containment, through a
+        # one line TU read from stdin (see header_check_input)
+        cmd += ['-x', 'c++', '-fsyntax-only', '-']
+    else:
+        cmd += ['-c', job.path, '-o', object_file]
+    return cmd
+
+
+def header_check_input(job):
+    if job.path.endswith('.hpp'):
+        return f'#include "{os.path.abspath(job.path)}"\n'
+    return None
+
+
+def compile_files(directory, variants, languages, jobs_count, use_ccache):
+    jobs = collect_jobs(directory, variants, languages)
+    include_dirs = find_include_dirs(directory)
+    launcher = ['ccache'] if use_ccache and shutil.which('ccache') else []
+    if launcher:
+        print("Using ccache")
+    cflags = {variant: variant_cflags(variant) for variant in variants}
 
-def compile_c_files(directory):
-    # Create the temporary folder if it doesn't exist
-    # Create a temporary directory
     temp_dir = tempfile.mkdtemp()
 
-    successes = 0
-    failures = []
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.endswith('.c'):
-                file_path = os.path.join(root, file)
-                object_file = os.path.join(
-                    temp_dir, os.path.splitext(file)[0] + '.o'
-                )
-                print(f"Compiling {file}...")
-                passed = subprocess.run(
-                    [
-                        'gcc',
-                        '-std=c89',
-                        '-O3',
-                        '-Wall',
-                        '-Werror',
-                        '-pedantic',
-                        '-c',
-                        file_path,
-                        '-o',
-                        object_file,
-                    ]
-                ).returncode
-                if passed == 0:
-                    print(f"{file} compiles: ✅\n")
-                    successes += 1
-                else:
-                    failures.append(file)
-
-    rmtree(temp_dir)
+    def run(index_and_job):
+        index, job = index_and_job
+        compiler = os.environ.get('CC', 'gcc')
+        extra = []
+        if job.language == 'c++':
+            compiler = os.environ.get('CXX', 'g++')
+            extra = cflags[job.variant]
+        object_file = os.path.join(temp_dir, f'{index}.o')
+        cmd = launcher + build_command(
+            job, compiler, include_dirs, extra, object_file
+        )
+        start = time.monotonic()
+        result = subprocess.run(
+            cmd,
+            input=header_check_input(job),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        job.seconds = time.monotonic() - start
+        job.returncode = result.returncode
+        job.output = result.stdout
+        status = "✅" if job.returncode == 0 else "❌"
+        print(f"{status} {display_name(job, directory)} ({job.seconds:.2f}s)")
+        return job
 
+    start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=jobs_count) as pool:
+            list(pool.map(run, enumerate(jobs)))
+    finally:
+        rmtree(temp_dir)
+    return jobs, time.monotonic() - start
+
+
+def display_name(job, directory):
+    return os.path.relpath(job.path, directory)
+
+
+def print_summary(jobs, wall_seconds, directory, slowest):
     total_pounds = 80
+    failures = [job for job in jobs if job.returncode != 0]
+
+    for job in failures:
+        print(f"\n❌ {display_name(job, directory)} failed:\n{job.output}")
+
+    if slowest and jobs:
+        print(f"\nSlowest {min(slowest, len(jobs))} translation units:")
+        for job in sorted(jobs, key=lambda j: j.seconds, reverse=True)[
+            :slowest
+        ]:
+            print(f"  {job.seconds:8.2f}s  {display_name(job, directory)}")
+
+    cpu_seconds = sum(job.seconds for job in jobs)
+    print(
+        f"\n{len(jobs)} files, {cpu_seconds:.1f}s compile time, "
+        f"{wall_seconds:.1f}s wall time"
+    )
 
     if len(failures) == 0:
-        succ_msg = "All files compiled successfully!"
-        surround_pounds = "#" * ((total_pounds - len(succ_msg) - 2) // 2)
-        print("\n" + "#" * total_pounds)
-        print(f"{surround_pounds} {succ_msg} {surround_pounds}")
+        msg = "All files compiled successfully!"
     else:
-        for failure in failures:
-            print(f"❌ {failure} failed")
-        fail_msg = f"{len(failures)}/{successes} files did NOT compile"
-        surround_pounds = "#" * ((total_pounds - len(fail_msg) - 2) // 2)
-        print("\n" + "#" * total_pounds)
-        print(f"{surround_pounds} {fail_msg} {surround_pounds}")
-
+        msg = f"{len(failures)}/{len(jobs)} files did NOT compile"
+    surround_pounds = "#" * ((total_pounds - len(msg) - 2) // 2)
+    print("\n" + "#" * total_pounds)
+    print(f"{surround_pounds} {msg} {surround_pounds}")
     print("#" * total_pounds + "\n")
 
+    return len(failures) == 0
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compile-check generated ASPN-C and ASPN-C++ sources and headers "
+            "in parallel."
+        )
+    )
+    parser.add_argument(
+        "source_directory",
+        help=(
+            "Generated output to check, e.g. the generate.py output "
+            "directory or its aspn-c/aspn-cpp subdirectories"
+        ),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of parallel compiler processes. Defaults to CPU count",
+    )
+    parser.add_argument(
+        "--variants",
+        nargs="*",
+        choices=CPP_VARIANTS,
+        default=CPP_VARIANTS,
+        help="ASPN-C++ matrix variants to check. Defaults to all",
+    )
+    parser.add_argument(
+        "--no-c", action="store_true", help="Skip ASPN-C sources"
+    )
+    parser.add_argument(
+        "--no-cpp", action="store_true", help="Skip ASPN-C++ sources"
+    )
+    parser.add_argument(
+        "--no-ccache",
+        action="store_true",
+        help="Do not use ccache even if it is installed",
+    )
+    parser.add_argument(
+        "--slowest",
+        type=int,
+        default=10,
+        help="Number of slowest translation units to report. Defaults to 10",
+    )
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: test_c.py <source_directory>")
-        sys.exit(1)
+    args = get_args()
 
-    directory = sys.argv[1]
+    languages = []
+    if not args.no_c:
+        languages.append('c')
+    if not args.no_cpp:
+        languages.append('c++')
+
+    jobs, wall_seconds = compile_files(
+        args.source_directory,
+        args.variants,
+        languages,
+        max(1, args.jobs),
+        not args.no_ccache,
+    )
+    if not jobs:
+        print(f"No sources found in {args.source_directory}")
+        sys.exit(1)
 
-    compile_c_files(directory)
+    passed = print_summary(
+        jobs, wall_seconds, args.source_directory, args.slowest
+    )
+    sys.exit(0 if passed else 1)
@@ -1,142 +1,163 @@
+import difflib
+import json
 import subprocess
 import shutil
 import os
 from os.path import abspath, join, dirname
 import sys
-import uuid
 
 FIREHOSE_ROOT = abspath(join(dirname(__file__), '..', '..', '..', '..'))
 BUILD_DIR = join(FIREHOSE_ROOT, 'build')
+BASE_BRANCH = 'main'
 
-
-def get_current_branch():
-    result = subprocess.run(
-        ['git', 'rev-parse', '--abbrev-ref', 'HEAD'],
-        stdout=subprocess.PIPE,
-        text=True,
-        check=True,
-    )
-    return result.stdout.strip()
+sys.path.insert(0, FIREHOSE_ROOT)
+from generate import write_output_manifest  # noqa: E402
 
 
-def stash_changes():
-    unique_id = str(uuid.uuid4())
-    stash_message = f"temp-stash-for-script-{unique_id}"
+def get_commit(ref):
     result = subprocess.run(
-        ['git', 'stash', 'push', '-u', '-m', stash_message],
+        ['git', 'rev-parse', ref],
         stdout=subprocess.PIPE,
         text=True,
         check=True,
+        cwd=FIREHOSE_ROOT,
     )
-    stash_output = result.stdout.strip()
-    print(f"Stashed changes: {stash_output}")
-
-    # Find the stash with the unique message
-    result = subprocess.run(
-        ['git', 'stash', 'list'], stdout=subprocess.PIPE, text=True, check=True
-    )
-    stashes = result.stdout.strip().split('\n')
-    for stash in stashes:
-        if stash_message in stash:
-            stash_name = stash.split(':')[0]
-            return stash_name
-    print("Error: Stash not found after stashing.")
-    return None
-
-
-def pop_stash(stash_name):
-    subprocess.run(['git', 'stash', 'pop', stash_name], check=True)
-
+    return result.stdout.strip()
 
-def generate_outputs(branch, temp_dir):
-    subprocess.run(['git', 'checkout', branch], check=True)
-    output_dir = join(BUILD_DIR, 'output')
 
-    # Remove the old build directory
+def generate_outputs(source_root, output_dir, manifest_path):
+    """
+    Runs generate.py from source_root into output_dir, then writes the
+    content hash manifest of the generated tree to manifest_path. The
+    manifest is computed here rather than with generate.py --manifest so
+    that commits predating that option can still be used as the golden.
+    """
     shutil.rmtree(output_dir, ignore_errors=True)
     os.makedirs(output_dir)
 
-    # Run generate.py and store outputs in the temporary directory
     subprocess.check_call(
-        [
-            'python',
-            './generate.py',
-            '--all',
-            '--build-dir',
-            BUILD_DIR,
-            '--output-dir',
-            output_dir,
-        ],
+        [sys.executable, './generate.py', '--all', '--output-dir', output_dir],
+        cwd=source_root,
+    )
+    write_output_manifest(output_dir, manifest_path)
+
+
+def generate_golden(build_dir, commit):
+    """
+    Returns the directory holding the golden output and manifest of the
+    given commit, generating them in a temporary git worktree only if they
+    are not already cached. The working tree of the current checkout is
+    never touched.
+    """
+    golden_dir = join(build_dir, 'golden', commit)
+    manifest_path = join(golden_dir, 'manifest.json')
+    if os.path.isfile(manifest_path):
+        print(f"Using cached golden manifest for {BASE_BRANCH} ({commit})")
+        return golden_dir
+
+    worktree_dir = join(build_dir, f'worktree_{commit}')
+    staging_dir = join(build_dir, f'golden_{commit}.tmp')
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    subprocess.run(
+        ['git', 'worktree', 'add', '--detach', worktree_dir, commit],
+        check=True,
         cwd=FIREHOSE_ROOT,
     )
-    shutil.move(f'{output_dir}/', temp_dir)
+    try:
+        generate_outputs(
+            worktree_dir,
+            join(staging_dir, 'output'),
+            join(staging_dir, 'manifest.json'),
+        )
+    finally:
+        subprocess.run(
+            ['git', 'worktree', 'remove', '--force', worktree_dir],
+            check=False,
+            cwd=FIREHOSE_ROOT,
+        )
 
+    # Publish the cache entry only once it is complete
+    shutil.rmtree(golden_dir, ignore_errors=True)
+    os.makedirs(dirname(golden_dir), exist_ok=True)
+    os.rename(staging_dir, golden_dir)
+    return golden_dir
 
-def diffcheck_outputs_against_main(BUILD_DIR):
-    current_branch = get_current_branch()
 
-    temp_dir1 = abspath(join(BUILD_DIR, 'temp_outputs_main'))
-    temp_dir2 = abspath(join(BUILD_DIR, f'temp_outputs_{current_branch}'))
+def load_manifest(manifest_path):
+    with open(manifest_path) as f:
+        return json.load(f)['files']
 
-    shutil.rmtree(temp_dir1, ignore_errors=True)
-    shutil.rmtree(temp_dir2, ignore_errors=True)
-    os.makedirs(temp_dir1, exist_ok=True)
-    os.makedirs(temp_dir2, exist_ok=True)
-    failed = False
 
-    # Save the Git state
-    stash_name = None
+def read_lines(path):
     try:
-        # Stash any uncommitted changes and get the stash name
-        stash_name = stash_changes()
+        with open(path, encoding='utf-8') as f:
+            return f.readlines()
+    except UnicodeDecodeError:
+        return None
+
+
+def print_file_diff(golden_output, current_output, rel_path):
+    golden_lines = read_lines(join(golden_output, rel_path))
+    current_lines = read_lines(join(current_output, rel_path))
+    if golden_lines is None or current_lines is None:
+        print(f"Binary files {BASE_BRANCH}/{rel_path} and {rel_path} differ")
+        return
+    sys.stdout.writelines(
+        difflib.unified_diff(
+            golden_lines,
+            current_lines,
+            fromfile=f'{BASE_BRANCH}/{rel_path}',
+            tofile=rel_path,
+        )
+    )
 
-        # Switch to 'main' branch and generate outputs
-        generate_outputs('main', temp_dir1)
 
-        # Switch back to the original branch and pop the stash
-        subprocess.run(['git', 'checkout', current_branch], check=True)
-        if stash_name:
-            pop_stash(stash_name)
-            stash_name = None  # Stash has been popped
+def diffcheck_outputs_against_main(BUILD_DIR):
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    try:
+        golden_dir = generate_golden(BUILD_DIR, get_commit(BASE_BRANCH))
 
-        # Generate outputs on the current branch
-        generate_outputs(current_branch, temp_dir2)
+        current_dir = join(BUILD_DIR, 'current')
+        generate_outputs(
+            FIREHOSE_ROOT,
+            join(current_dir, 'output'),
+            join(current_dir, 'manifest.json'),
+        )
     except Exception as e:
         print("❌ An error occurred during processing.")
         print(e)
-        failed = True
-    finally:
-        # Restore the Git state
-        if stash_name:
-            try:
-                pop_stash(stash_name)
-            except subprocess.CalledProcessError as e:
-                print(f"Error popping stash: {e}")
-        try:
-            subprocess.run(['git', 'checkout', current_branch], check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"Error checking out original branch: {e}")
-        if failed:
-            exit(-1)
-
-    # Compare the outputs
-    output = (
-        subprocess.run(
-            ['diff', '-ur', temp_dir1, temp_dir2],
-            check=False,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        .stdout.strip()
-        .split('\n')
+        exit(-1)
+
+    golden = load_manifest(join(golden_dir, 'manifest.json'))
+    current = load_manifest(join(current_dir, 'manifest.json'))
+
+    removed = sorted(set(golden) - set(current))
+    added = sorted(set(current) - set(golden))
+    changed = sorted(
+        path
+        for path in set(golden) & set(current)
+        if golden[path] != current[path]
     )
 
-    if not output or (len(output) == 1 and not output[0]):
+    for path in removed:
+        print(f"Only in {BASE_BRANCH}: {path}")
+    for path in added:
+        print(f"Only in current tree: {path}")
+    for path in changed:
+        print_file_diff(
+            join(golden_dir, 'output'), join(current_dir, 'output'), path
+        )
+
+    differences = len(removed) + len(added) + len(changed)
+    if differences == 0:
         print("\n\n✅ Success: No differences found!")
         exit(0)
     else:
-        print(f"❌ Failure: {len(output)} differences found")
+        print(
+            f"❌ Failure: {differences} files differ "
+            f"({len(changed)} changed, {len(added)} added, "
+            f"{len(removed)} removed)"
+        )
         exit(-1)
 
 
@@ -149,5 +170,5 @@ if __name__ == "__main__":
         exit(-1)
     else:
         if len(sys.argv) >= 2:
-            BUILD_DIR = sys.argv[1]
+            BUILD_DIR = abspath(sys.argv[1])
         diffcheck_outputs_against_main(BUILD_DIR)
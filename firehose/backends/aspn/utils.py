@@ -8,6 +8,7 @@ ASPN_PREFIX = "Aspn23"
 ASPN_NULLABILITY_MACRO_START = 'ASPN_ASSUME_NONNULL_BEGIN'
 ASPN_NULLABILITY_MACRO_END = 'ASPN_ASSUME_NONNULL_END'
 ASPN_NULLABLE_MACRO = 'ASPN_NULLABLE'
+ASPN_NONNULL_MACRO = 'ASPN_NONNULL'
 ASPN_DISABLE_NULLABILITY = 'ASPN_DISABLE_NULLABILITY'
 C_MULTILINE_TEMPLATE = dedent('''
     {indent}/**
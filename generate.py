@@ -1,15 +1,25 @@
 #!/usr/bin/env python3
 
 import argparse
+import hashlib
+import json
 import multiprocessing
 import os
 import shutil
 import subprocess
 import sys
-from typing import Dict, List
+from typing import Dict, List, Optional
 from glob import glob
 from os.path import join
 
+from firehose.artifact_cache import (
+    ArtifactCache,
+    break_hardlinks,
+    hash_files,
+    snapshot,
+    tool_version,
+)
+
 FIREMAN = r"""
 
                                      █████████
@@ -81,6 +91,10 @@ DEFAULT_OUTPUT_DIR = join(FIREHOSE_ROOT, "output")
 ASPN_CODEGEN_RUNNER = join(FIREHOSE_ROOT, "runners", "convert_aspn_yaml.py")
 FASTDDS_RUNNER = join(FIREHOSE_ROOT, "runners", "gen_fastdds.py")
 
+# Generated sources are run through clang-format, so its version is part of
+# every target's cache key
+FORMATTER_VERSION_CMD = ["clang-format", "--version"]
+
 # Add some PYTHONPATH entries necessary for the runners to work
 os.environ["PYTHONPATH"] = os.pathsep.join(
     [FIREHOSE_ROOT, os.environ.get("PYTHONPATH", "")]
@@ -102,6 +116,9 @@ class FirehoseTarget:
         dependencies=None,
         post_run=None,
         post_run_args=[],
+        outputs=None,
+        cache_inputs=None,
+        tools=None,
     ):
         self.name = name
         self.runner = runner
@@ -109,6 +126,13 @@ class FirehoseTarget:
         self.dependencies = dependencies or []
         self.post_run = post_run
         self.post_run_args = post_run_args or []
+        # Directories the target (including post_run) writes its files to
+        self.outputs = outputs or []
+        # Extra non-Python files the output depends on, e.g. build scripts
+        self.cache_inputs = cache_inputs or []
+        # Version commands of the external tools the target runs
+        self.tools = [FORMATTER_VERSION_CMD] + (tools or [])
+        self.cache_key = None
 
     @property
     def cmd(self):
@@ -329,7 +353,106 @@ def topological_sort_levels(targets):
     return levels  # List of levels, each level is a list of target names
 
 
+def get_icd_dirs(args: argparse.Namespace) -> List[str]:
+    """
+    Returns the directories holding the ICD YAML files the runners read:
+    the types, metadata and measurements directories of the installed
+    aspn-2023 package (found the same way as get_aspn_icd_root() in
+    runners/convert_aspn_yaml.py), plus any ICD directories given on the
+    command line.
+    """
+    icd_dirs = []
+    for directory in getsitepackages():
+        if os.path.isdir(join(directory, "aspn-2023.dist-info")):
+            icd_dirs += [
+                join(directory, icd_dir)
+                for icd_dir in ["types", "metadata", "measurements"]
+                if os.path.isdir(join(directory, icd_dir))
+            ]
+            break
+    for icd_dir in [args.aspn_icd_dir, args.extra_icd_files_dir]:
+        if icd_dir and os.path.isdir(icd_dir):
+            icd_dirs.append(icd_dir)
+    return icd_dirs
+
+
+def compute_cache_keys(
+    targets: Dict[str, FirehoseTarget],
+    levels: List[List[str]],
+    args: argparse.Namespace,
+) -> None:
+    """
+    Sets the artifact cache key of every target to a hash of the ICD files,
+    the firehose sources (including generate.py), the target options, the
+    versions of the external tools it runs and the keys of the targets it
+    depends on.
+
+    Parameters:
+    - targets (Dict[str, FirehoseTarget]): Targets to compute keys for.
+    - levels (List[List[str]]): Target names in dependency order.
+    - args (argparse.Namespace): Parsed generate.py arguments.
+    """
+    ir_hash = hash_files(get_icd_dirs(args)).hexdigest()
+    # generate.py itself holds post_run steps (e.g. the LCM jar build) that
+    # write cached outputs
+    source_hash = hash_files(
+        [
+            join(FIREHOSE_ROOT, "firehose"),
+            join(FIREHOSE_ROOT, "runners"),
+            os.path.abspath(__file__),
+        ]
+    ).hexdigest()
+    versions = {}
+
+    def relative(arg):
+        # Keys must not depend on where the output or checkout lives
+        for root, placeholder in [
+            (args.output_dir, "<output>"),
+            (args.staging_input_dir, "<staging>"),
+        ]:
+            if isinstance(arg, str) and arg.startswith(root):
+                return placeholder + arg[len(root) :]
+        return str(arg)
+
+    for level in levels:
+        for name in level:
+            target = targets[name]
+            for tool in target.tools:
+                if tuple(tool) not in versions:
+                    versions[tuple(tool)] = tool_version(tool)
+            key_data = {
+                "ir": ir_hash,
+                "sources": source_hash,
+                "name": target.name,
+                "runner": os.path.relpath(target.runner, FIREHOSE_ROOT),
+                "cmd_args": [relative(arg) for arg in target.cmd_args],
+                "post_run_args": [
+                    relative(arg) for arg in target.post_run_args
+                ],
+                "outputs": [relative(path) for path in target.outputs],
+                "inputs": hash_files(target.cache_inputs).hexdigest(),
+                "tools": [versions[tuple(tool)] for tool in target.tools],
+                "dependencies": [
+                    targets[dep].cache_key for dep in target.dependencies
+                ],
+            }
+            target.cache_key = hashlib.sha256(
+                json.dumps(key_data, sort_keys=True).encode()
+            ).hexdigest()
+
+
 def generate_target(target: FirehoseTarget):
+    cache = ArtifactCache.from_env() if target.cache_key else None
+    if cache and cache.restore(target.cache_key, target.outputs):
+        print(f"Restored target from cache: {target.name}")
+        return
+
+    before = {}
+    if cache:
+        # Files restored from the cache for a dependency may be rewritten
+        break_hardlinks(target.outputs)
+        before = snapshot(target.outputs)
+
     print(f"Running target: {target.name}")
     subprocess.check_call(target.cmd)
 
@@ -339,8 +462,11 @@ def generate_target(target: FirehoseTarget):
         else:
             target.post_run()
 
+    if cache:
+        cache.store(target.cache_key, target.outputs, before)
+
 
-def run_generation_targets(targets_to_generate, all_targets):
+def run_generation_targets(targets_to_generate, all_targets, args):
     """
     Runs code generation targets, respecting dependencies and running in parallel where possible.
     """
@@ -349,6 +475,9 @@ def run_generation_targets(targets_to_generate, all_targets):
 
     # Perform topological sort to get levels
     levels = topological_sort_levels(all_targets_dict)
+
+    if ArtifactCache.from_env() is not None:
+        compute_cache_keys(all_targets_dict, levels, args)
     for level in levels:
         # level is a list of target names
         targets_in_level = [all_targets_dict[name] for name in level]
@@ -454,7 +583,67 @@ def stage_files(staging_input_dir: str, output_dir: str) -> None:
     """
     Stages non-generated files into the output directory.
     """
-    shutil.copytree(staging_input_dir, output_dir, dirs_exist_ok=True)
+
+    def copy_unlinked(src, dst):
+        # Never write through a hardlink into the artifact cache
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        return shutil.copy2(src, dst)
+
+    shutil.copytree(
+        staging_input_dir,
+        output_dir,
+        dirs_exist_ok=True,
+        copy_function=copy_unlinked,
+    )
+
+
+def compute_output_manifest(
+    output_dir: str, exclude: Optional[List[str]] = None
+) -> Dict[str, str]:
+    """
+    Computes a content hash for every file in the output directory.
+
+    Parameters:
+    - output_dir (str): The directory to hash.
+    - exclude (Optional[List[str]]): Absolute paths of files to leave out of the
+      manifest (e.g. the manifest itself).
+
+    Returns:
+    - Dict[str, str]: Mapping of POSIX-style paths relative to output_dir to
+      the SHA-256 hex digest of each file's contents.
+    """
+    manifest = {}
+    excluded = {os.path.abspath(path) for path in exclude or []}
+    for root, dirs, files in os.walk(output_dir):
+        dirs[:] = sorted(d for d in dirs if d != ".git")
+        for file_name in sorted(files):
+            file_path = join(root, file_name)
+            if os.path.abspath(file_path) in excluded:
+                continue
+            digest = hashlib.sha256()
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            rel_path = os.path.relpath(file_path, output_dir)
+            manifest[Path(rel_path).as_posix()] = digest.hexdigest()
+    return manifest
+
+
+def write_output_manifest(output_dir: str, manifest_path: str) -> None:
+    """
+    Writes a JSON manifest of per-file content hashes of the output directory.
+
+    Parameters:
+    - output_dir (str): The directory containing the generated output.
+    - manifest_path (str): Where to write the manifest.
+    """
+    manifest = compute_output_manifest(output_dir, exclude=[manifest_path])
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump({"files": manifest}, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Wrote manifest of {len(manifest)} files to {manifest_path}")
 
 
 def print_targets_status(
@@ -601,6 +790,16 @@ def get_args() -> argparse.Namespace:
         action="store_true",
         help="Interactive mode to select output formats",
     )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        metavar="",
+        help=(
+            "Write a JSON manifest of per-file SHA-256 content hashes of the "
+            "output directory to this path after staging. Defaults to None"
+        ),
+        type=normalized_path,
+    )
 
     return parser.parse_args()
 
@@ -612,11 +811,13 @@ def create_targets(args: argparse.Namespace) -> None:
             name="aspn_c",
             runner=ASPN_CODEGEN_RUNNER,
             cmd_args=["-d", join(args.output_dir, "aspn-c"), "-o", "c"],
+            outputs=[join(args.output_dir, "aspn-c")],
         ),
         FirehoseTarget(
             name="aspn_cpp",
             runner=ASPN_CODEGEN_RUNNER,
             cmd_args=["-d", join(args.output_dir, "aspn-cpp"), "-o", "cpp"],
+            outputs=[join(args.output_dir, "aspn-cpp")],
         ),
         FirehoseTarget(
             name="aspn_lcm",
@@ -624,6 +825,16 @@ def create_targets(args: argparse.Namespace) -> None:
             cmd_args=["-d", join(args.output_dir, "aspn-lcm"), "-o", "lcm"],
             post_run=post_aspn_lcm,
             post_run_args=[args.output_dir, args.staging_input_dir],
+            outputs=[
+                join(args.output_dir, "aspn-lcm"),
+                join(args.output_dir, "lcm"),
+                # build.gradle writes the jar relative to the staging dir
+                os.path.normpath(
+                    join(args.staging_input_dir, "..", "output", "lcm", "jar")
+                ),
+            ],
+            cache_inputs=[join(args.staging_input_dir, "lcm", "build.gradle")],
+            tools=[["lcm-gen", "--version"], ["gradle", "--version"]],
         ),
         FirehoseTarget(
             name="aspn_dds_idl",
@@ -634,6 +845,7 @@ def create_targets(args: argparse.Namespace) -> None:
                 "-o",
                 "dds",
             ],
+            outputs=[join(args.output_dir, "dds", "idl", "aspn23_dds")],
         ),
         FirehoseTarget(
             name="aspn_lcm_translations",
@@ -645,11 +857,13 @@ def create_targets(args: argparse.Namespace) -> None:
                 "lcmtranslations",
             ],
             dependencies=["aspn_lcm"],
+            outputs=[join(args.output_dir, "lcm", "python", "aspn23_lcm")],
         ),
         FirehoseTarget(
             name="aspn_py",
             runner=ASPN_CODEGEN_RUNNER,
             cmd_args=["-d", join(args.output_dir, "aspn-py"), "-o", "py"],
+            outputs=[join(args.output_dir, "aspn-py")],
         ),
         FirehoseTarget(
             name="aspn_dds_cpp",
@@ -661,6 +875,8 @@ def create_targets(args: argparse.Namespace) -> None:
                 join(args.output_dir, "dds", "cpp", "aspn23_dds"),
             ],
             dependencies=["aspn_dds_idl"],
+            outputs=[join(args.output_dir, "dds", "cpp", "aspn23_dds")],
+            tools=[["fastddsgen", "-version"]],
         ),
         FirehoseTarget(
             name="aspn_ros",
@@ -673,6 +889,11 @@ def create_targets(args: argparse.Namespace) -> None:
                 "-o",
                 "ros",
             ],
+            outputs=[
+                join(
+                    args.output_dir, "aspn-ros", "src", "aspn23_ros_interfaces"
+                )
+            ],
         ),
         FirehoseTarget(
             name="aspn_ros_translations",
@@ -690,6 +911,15 @@ def create_targets(args: argparse.Namespace) -> None:
                 "ros_translations",
             ],
             dependencies=["aspn_ros"],
+            outputs=[
+                join(
+                    args.output_dir,
+                    "aspn-ros",
+                    "src",
+                    "aspn23_ros_utils",
+                    "aspn23_ros_utils",
+                )
+            ],
         ),
     ]
 
@@ -730,11 +960,14 @@ def main() -> None:
 
     configure_extra_icds(args.aspn_icd_dir, args.extra_icd_files_dir)
 
-    run_generation_targets(targets_to_generate, all_targets)
+    run_generation_targets(targets_to_generate, all_targets, args)
 
     print("Staging files...")
     stage_files(args.staging_input_dir, args.output_dir)
 
+    if args.manifest:
+        write_output_manifest(args.output_dir, args.manifest)
+
 
 if __name__ == "__main__":
     main()
@@ -19,6 +19,7 @@ from firehose.backends import (
     AspnYamlToLCMTranslations,
     Backend,
 )
+from firehose.backends.aspn.aspn_yaml_to_c_header import C_LAYOUTS
 from firehose.backends.aspn.utils import (
     ASPN_PREFIX,
     CODEGEN_MAPPINGS,
@@ -226,9 +227,35 @@ def main():
         help="Extra icd dirs to include",
         default=[],
     )
+    parser.add_argument(
+        "--c-layout",
+        choices=C_LAYOUTS,
+        default='declaration',
+        help=(
+            "Member order of the generated C structs. packed-order reorders "
+            "members to minimize padding and writes struct_layout.md. Only "
+            "used by the c output format."
+        ),
+    )
+    parser.add_argument(
+        "--cpp-bindings-per-file",
+        type=int,
+        default=1,
+        help=(
+            "Number of ASPN types registered by each translation unit of the "
+            "xtensor_py bindings. Only used by the cpp output format."
+        ),
+    )
     args = parser.parse_args()
 
-    backend: Backend = BACKENDS[args.output_format]()
+    if args.output_format == 'c':
+        backend: Backend = AspnCBackend(c_layout=args.c_layout)
+    elif args.output_format == 'cpp':
+        backend: Backend = AspnCppBackend(
+            bindings_per_file=args.cpp_bindings_per_file
+        )
+    else:
+        backend: Backend = BACKENDS[args.output_format]()
 
     backend.set_output_root_folder(args.output_directory)
 